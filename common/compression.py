@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict
+
+import settings
+
+# A fresh gzip compressor, copied for each response so that the
+# compressor state doesn't need to be set up from scratch every time
+_GZIP_COMPRESSOR_TEMPLATE = zlib.compressobj(
+    settings.APP_GZIP_LEVEL,
+    zlib.DEFLATED,
+    16 + zlib.MAX_WBITS,  # gzip container
+)
+
+# zlib releases the GIL while compressing, so large bodies can be
+# compressed in a thread pool without blocking the event loop.
+_executor: ThreadPoolExecutor | None = None
+
+
+class CompressionStats(TypedDict):
+    compressed_responses: int
+    uncompressed_responses: int
+    offloaded_responses: int
+    bytes_in: int
+    bytes_out: int
+    compression_ratio: float | None
+    compression_seconds: float
+
+
+_stats: CompressionStats = {
+    "compressed_responses": 0,
+    "uncompressed_responses": 0,
+    "offloaded_responses": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "compression_ratio": None,
+    "compression_seconds": 0.0,
+}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.APP_GZIP_WORKERS,
+            thread_name_prefix="gzip",
+        )
+    return _executor
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """Whether an Accept-Encoding header value allows a gzip response"""
+    if not accept_encoding:
+        return False
+
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "x-gzip", "*"):
+            continue
+
+        quality = params.strip().lower().removeprefix("q=")
+        try:
+            return not params or float(quality) > 0
+        except ValueError:
+            return False
+
+    return False
+
+
+def _gzip(data: bytes) -> bytes:
+    compressor = _GZIP_COMPRESSOR_TEMPLATE.copy()
+    return compressor.compress(data) + compressor.flush()
+
+
+async def compress_response(
+    data: bytes,
+    accept_encoding: str | None,
+) -> tuple[bytes, str | None]:
+    """
+    Compress a response body, if it's worth it and the client supports it
+
+    :param data: response body
+    :param accept_encoding: the request's Accept-Encoding header
+    :return: (body, content encoding or None if it was not compressed)
+    """
+    if (
+        not settings.APP_GZIP
+        or len(data) < settings.APP_GZIP_MIN_SIZE
+        or not accepts_gzip(accept_encoding)
+    ):
+        _stats["uncompressed_responses"] += 1
+        return data, None
+
+    start_time = time.perf_counter()
+    if len(data) >= settings.APP_GZIP_OFFLOAD_SIZE:
+        compressed_data = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(),
+            _gzip,
+            data,
+        )
+        _stats["offloaded_responses"] += 1
+    else:
+        compressed_data = _gzip(data)
+
+    _stats["compression_seconds"] += time.perf_counter() - start_time
+    _stats["compressed_responses"] += 1
+    _stats["bytes_in"] += len(data)
+    _stats["bytes_out"] += len(compressed_data)
+    return compressed_data, "gzip"
+
+
+def get_stats() -> CompressionStats:
+    stats = _stats.copy()
+    if stats["bytes_in"]:
+        stats["compression_ratio"] = stats["bytes_out"] / stats["bytes_in"]
+    return stats
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
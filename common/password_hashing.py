@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import settings
+from common.log import logger
+
+# bcrypt releases the GIL while hashing, so a thread pool is enough to keep
+# verification (~200ms each) from blocking the event loop.
+_executor: ThreadPoolExecutor | None = None
+
+# Checks which have been submitted to the pool but have not completed yet
+_queue_depth = 0
+
+# In-flight checks, keyed by (password, hashed password), so that concurrent
+# logins with the same credentials share a single hash computation
+_in_flight: dict[tuple[bytes, bytes], asyncio.Future[bool]] = {}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BCRYPT_WORKERS,
+            thread_name_prefix="bcrypt",
+        )
+    return _executor
+
+
+def get_queue_depth() -> int:
+    """Returns the number of bcrypt checks currently queued or running"""
+    return _queue_depth
+
+
+async def checkpw(password: bytes, hashed_password: bytes) -> bool:
+    """
+    Check `password` against `hashed_password` in the bcrypt worker pool
+
+    :param password: plaintext password (for osu!, the md5 of the password)
+    :param hashed_password: bcrypt hash to check against
+    :return: True if the password matches
+    """
+    global _queue_depth
+
+    key = (password, hashed_password)
+
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(
+            _get_executor(),
+            bcrypt.checkpw,
+            password,
+            hashed_password,
+        )
+        future.add_done_callback(functools.partial(_on_check_done, key))
+        _in_flight[key] = future
+
+        _queue_depth += 1
+        if _queue_depth > settings.BCRYPT_WORKERS:
+            logger.warning(
+                "Bcrypt verification is queueing",
+                extra={
+                    "queue_depth": _queue_depth,
+                    "workers": settings.BCRYPT_WORKERS,
+                },
+            )
+
+    # Shielded so that one cancelled login doesn't
+    # cancel the check for the others sharing it
+    return await asyncio.shield(future)
+
+
+def _on_check_done(key: tuple[bytes, bytes], future: asyncio.Future[bool]) -> None:
+    global _queue_depth
+    _queue_depth -= 1
+    del _in_flight[key]
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
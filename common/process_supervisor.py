@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import time
+from collections.abc import Callable
+from types import FrameType
+
+from common.log import logger
+
+# Give up (and exit, so the pod is restarted) if workers keep crashing
+MAX_RESTARTS = 10
+RESTART_WINDOW = 60  # in seconds
+
+FORWARDED_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+def run_workers(num_workers: int, run_worker: Callable[[int], int]) -> int:
+    """
+    Fork `num_workers` processes running `run_worker(worker_id)`, restart
+    any which crash, and forward shutdown signals to them.
+
+    Must be called before any event loop or connection has been created,
+    so that each worker sets up its own.
+
+    :return: exit code for the supervisor process
+    """
+    # Workers handle signals the way the process did before forking
+    worker_signal_handlers = {
+        signum: signal.getsignal(signum) for signum in FORWARDED_SIGNALS
+    }
+
+    workers: dict[int, int] = {}  # pid -> worker id
+    shutting_down = False
+    exit_code = 0
+    restart_times: list[float] = []
+
+    def start_worker(worker_id: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            for signum, handler in worker_signal_handlers.items():
+                signal.signal(signum, handler)
+
+            worker_exit_code = 1
+            try:
+                worker_exit_code = run_worker(worker_id)
+            except Exception:
+                logger.exception(
+                    "An unhandled error occurred in an API worker",
+                    extra={"worker_id": worker_id},
+                )
+            finally:
+                logging.shutdown()
+                os._exit(worker_exit_code)
+
+        workers[pid] = worker_id
+        logger.info(
+            "Started API worker",
+            extra={"worker_id": worker_id, "pid": pid},
+        )
+
+    def stop_workers(signum: int, frame: FrameType | None) -> None:
+        nonlocal shutting_down
+        shutting_down = True
+        logger.info(
+            "Stopping API workers",
+            extra={"signum": signal.strsignal(signum), "workers": len(workers)},
+        )
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for signum in FORWARDED_SIGNALS:
+        signal.signal(signum, stop_workers)
+
+    for worker_id in range(num_workers):
+        start_worker(worker_id)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        worker_id_or_none = workers.pop(pid, None)
+        if worker_id_or_none is None:
+            continue
+        worker_id = worker_id_or_none
+
+        worker_exit_code = os.waitstatus_to_exitcode(status)
+        if shutting_down:
+            logger.info(
+                "API worker stopped",
+                extra={"worker_id": worker_id, "exit_code": worker_exit_code},
+            )
+            continue
+
+        logger.error(
+            "API worker exited unexpectedly",
+            extra={"worker_id": worker_id, "exit_code": worker_exit_code},
+        )
+
+        now = time.monotonic()
+        restart_times = [t for t in restart_times if now - t < RESTART_WINDOW]
+        if len(restart_times) >= MAX_RESTARTS:
+            logger.error(
+                "API workers are crashing repeatedly, shutting down",
+                extra={"restarts": len(restart_times), "window": RESTART_WINDOW},
+            )
+            exit_code = 1
+            stop_workers(signal.SIGTERM, None)
+            continue
+
+        restart_times.append(now)
+        start_worker(worker_id)
+
+    return exit_code
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+
+
+class CommandCounter:
+    __slots__ = ("count",)
+
+    def __init__(self) -> None:
+        self.count = 0
+
+
+_COMMAND_COUNTER: ContextVar[CommandCounter | None] = ContextVar(
+    "_COMMAND_COUNTER",
+    default=None,
+)
+
+
+@contextmanager
+def count_commands() -> Iterator[CommandCounter]:
+    """Count the redis commands sent within this context"""
+    counter = CommandCounter()
+    reset_token = _COMMAND_COUNTER.set(counter)
+    try:
+        yield counter
+    finally:
+        _COMMAND_COUNTER.reset(reset_token)
+
+
+def _add_commands(count: int) -> None:
+    counter = _COMMAND_COUNTER.get()
+    if counter is not None:
+        counter.count += count
+
+
+class CountingRedis(redis.Redis):
+    """A redis client which reports the commands it sends to `count_commands`"""
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        _add_commands(1)
+        return await super().execute_command(  # type: ignore[no-untyped-call]
+            *args,
+            **options,
+        )
+
+    def pipeline(
+        self,
+        transaction: bool = True,
+        shard_hint: str | None = None,
+    ) -> CountingPipeline:
+        return CountingPipeline(
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+        )
+
+
+class CountingPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:
+        _add_commands(len(self.command_stack))
+        return await super().execute(raise_on_error)
@@ -6,8 +6,7 @@ from time import strftime
 from typing import Any
 from typing import TypedDict
 
-import bcrypt
-
+from common import password_hashing
 from common.constants import gameModes
 from common.constants import privileges
 from common.log import audit_logs
@@ -184,10 +183,11 @@ async def authenticate(user_id: int, password: str) -> bool:
     pw_md5 = password.encode()
     db_pw_bcrypt = passwordData["password_md5"].encode()  # why is it called md5 LOL
 
-    if db_pw_bcrypt in glob.bcrypt_cache:  # ~0.01ms
-        return pw_md5 == glob.bcrypt_cache[db_pw_bcrypt]
-    elif bcrypt.checkpw(pw_md5, db_pw_bcrypt):  # ~200ms
-        glob.bcrypt_cache[db_pw_bcrypt] = pw_md5
+    cached_pw_md5 = glob.bcrypt_cache.get(user_id, db_pw_bcrypt)
+    if cached_pw_md5 is not None:  # ~0.01ms
+        return pw_md5 == cached_pw_md5
+    elif await password_hashing.checkpw(pw_md5, db_pw_bcrypt):  # ~200ms, off-loop
+        glob.bcrypt_cache.set(user_id, db_pw_bcrypt, pw_md5)
         return True
 
     return False
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+from collections.abc import Coroutine
+from typing import Any
+
+import settings
+from common.log import logger
+
+try:
+    import uvloop
+except ImportError:  # e.g. on windows
+    new_uvloop_event_loop: Callable[[], asyncio.AbstractEventLoop] | None = None
+else:
+    new_uvloop_event_loop = uvloop.new_event_loop
+
+EVENT_LOOPS = ("asyncio", "uvloop")
+
+
+def get_loop_factory() -> Callable[[], asyncio.AbstractEventLoop] | None:
+    """
+    Get the factory for the event loop selected in settings
+
+    :return: the loop factory, or None for asyncio's default loop
+    """
+    if settings.APP_EVENT_LOOP not in EVENT_LOOPS:
+        raise ValueError(f"Unknown event loop: {settings.APP_EVENT_LOOP}")
+
+    if settings.APP_EVENT_LOOP == "uvloop":
+        if new_uvloop_event_loop is not None:
+            return new_uvloop_event_loop
+
+        logger.warning("uvloop is not installed, falling back to asyncio")
+
+    return None
+
+
+def run(main: Callable[[], Coroutine[Any, Any, int]]) -> int:
+    """
+    Run an entry point's main() to completion on the selected event loop
+
+    :return: exit code for the process
+    """
+    loop_factory = get_loop_factory()
+    logger.info(
+        "Starting event loop",
+        extra={"event_loop": "uvloop" if loop_factory is not None else "asyncio"},
+    )
+
+    try:
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            return runner.run(main())
+    except KeyboardInterrupt:
+        return 0
@@ -755,12 +755,12 @@ async def systemMaintenance(fro: str, chan: str, message: list[str]) -> str:
     if maintenance:
         # We have turned on maintenance mode
         # Users that will be disconnected
-        who = []
+        who: set[int] = set()
 
         # Disconnect everyone but mod/admins
-        for value in await osuToken.get_tokens():
+        async for value in osuToken.iter_tokens(fields=("user_id", "privileges")):
             if not osuToken.is_staff(value["privileges"]):
-                who.append(value["user_id"])
+                who.add(value["user_id"])
 
         await stream_messages.broadcast_data(
             "main",
@@ -774,7 +774,7 @@ async def systemMaintenance(fro: str, chan: str, message: list[str]) -> str:
             ),
         )
 
-        await tokenList.multipleEnqueue(serverPackets.loginError, who)
+        await tokenList.multipleEnqueue(serverPackets.loginError, list(who))
         msg = "The server is now in maintenance mode!"
     else:
         # We have turned off maintenance mode
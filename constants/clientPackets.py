@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import struct
 from typing import Any
 
 from constants import dataTypes
@@ -8,9 +9,11 @@ from helpers import packetHelper
 
 """ Protocol v20 """
 
+_CHANGE_PROTOCOL_VERSION = packetHelper.compile_reader((("version", dataTypes.UINT32),))
 
-def changeProtocolVersion(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("version", dataTypes.UINT32),))["data"]
+
+def changeProtocolVersion(stream: bytes | memoryview) -> dict[str, Any]:
+    return _CHANGE_PROTOCOL_VERSION.read(stream)["data"]
 
 
 """ Protocol v19 """
@@ -23,19 +26,23 @@ ACTION_CHANGE_FMT = (
     ("gameMode", dataTypes.BYTE),
     ("beatmapID", dataTypes.SINT32),
 )
+_ACTION_CHANGE = packetHelper.compile_reader(ACTION_CHANGE_FMT)
 """ Users listing packets """
 
 
-def userActionChange(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, ACTION_CHANGE_FMT)["data"]
+def userActionChange(stream: bytes | memoryview) -> dict[str, Any]:
+    return _ACTION_CHANGE.read(stream)["data"]
+
+
+_USERS_LIST = packetHelper.compile_reader((("users", dataTypes.INT_LIST),))
 
 
-def userStatsRequest(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("users", dataTypes.INT_LIST),))["data"]
+def userStatsRequest(stream: bytes | memoryview) -> dict[str, Any]:
+    return _USERS_LIST.read(stream)["data"]
 
 
-def userPanelRequest(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("users", dataTypes.INT_LIST),))["data"]
+def userPanelRequest(stream: bytes | memoryview) -> dict[str, Any]:
+    return _USERS_LIST.read(stream)["data"]
 
 
 """ Client chat packets """
@@ -44,10 +51,11 @@ PUBLIC_MSG_FMT = (
     ("message", dataTypes.STRING),
     ("to", dataTypes.STRING),
 )
+_PUBLIC_MSG = packetHelper.compile_reader(PUBLIC_MSG_FMT)
 
 
-def sendPublicMessage(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, PUBLIC_MSG_FMT)["data"]
+def sendPublicMessage(stream: bytes | memoryview) -> dict[str, Any]:
+    return _PUBLIC_MSG.read(stream)["data"]
 
 
 PRIVATE_MSG_FMT = (
@@ -56,42 +64,54 @@ PRIVATE_MSG_FMT = (
     ("to", dataTypes.STRING),
     ("unknown2", dataTypes.UINT32),
 )
+_PRIVATE_MSG = packetHelper.compile_reader(PRIVATE_MSG_FMT)
 
 
-def sendPrivateMessage(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, PRIVATE_MSG_FMT)["data"]
+def sendPrivateMessage(stream: bytes | memoryview) -> dict[str, Any]:
+    return _PRIVATE_MSG.read(stream)["data"]
 
 
-def setAwayMessage(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(
-        stream,
-        (("unknown", dataTypes.STRING), ("awayMessage", dataTypes.STRING)),
-    )["data"]
+_AWAY_MESSAGE = packetHelper.compile_reader(
+    (("unknown", dataTypes.STRING), ("awayMessage", dataTypes.STRING)),
+)
 
 
-def blockDM(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("value", dataTypes.UINT32),))["data"]
+def setAwayMessage(stream: bytes | memoryview) -> dict[str, Any]:
+    return _AWAY_MESSAGE.read(stream)["data"]
 
 
-def channelJoin(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("channel", dataTypes.STRING),))["data"]
+_BLOCK_DM = packetHelper.compile_reader((("value", dataTypes.UINT32),))
 
 
-def channelPart(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("channel", dataTypes.STRING),))["data"]
+def blockDM(stream: bytes | memoryview) -> dict[str, Any]:
+    return _BLOCK_DM.read(stream)["data"]
 
 
-def addRemoveFriend(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("friendID", dataTypes.SINT32),))[
-        "data"
-    ]
+_CHANNEL = packetHelper.compile_reader((("channel", dataTypes.STRING),))
+
+
+def channelJoin(stream: bytes | memoryview) -> dict[str, Any]:
+    return _CHANNEL.read(stream)["data"]
+
+
+def channelPart(stream: bytes | memoryview) -> dict[str, Any]:
+    return _CHANNEL.read(stream)["data"]
+
+
+_FRIEND = packetHelper.compile_reader((("friendID", dataTypes.SINT32),))
+
+
+def addRemoveFriend(stream: bytes | memoryview) -> dict[str, Any]:
+    return _FRIEND.read(stream)["data"]
 
 
 """ Spectator packets """
 
+_START_SPECTATING = packetHelper.compile_reader((("userID", dataTypes.SINT32),))
+
 
-def startSpectating(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("userID", dataTypes.SINT32),))["data"]
+def startSpectating(stream: bytes | memoryview) -> dict[str, Any]:
+    return _START_SPECTATING.read(stream)["data"]
 
 
 """ Multiplayer packets """
@@ -117,33 +137,41 @@ MATCH_SETTINGS_FMT_SECOND = (
 )
 MATCH_SETTINGS_FMT_THIRD = (*[(f"slot{i}Mods", dataTypes.UINT32) for i in range(16)],)
 
+_MATCH_SETTINGS_FIRST = packetHelper.compile_reader(MATCH_SETTINGS_FMT_FIRST)
+_MATCH_SETTINGS_SECOND = packetHelper.compile_reader(MATCH_SETTINGS_FMT_SECOND)
+_MATCH_SETTINGS_THIRD = packetHelper.compile_reader(MATCH_SETTINGS_FMT_THIRD)
 
-def matchSettings(stream: bytes) -> dict[str, Any]:
-    # Data to return, will be merged later
-    data = {}
+# One slot id (SINT32) is sent for each occupied slot
+_MATCH_SLOT_IDS = [struct.Struct(f"<{count}l") for count in range(17)]
 
+
+def matchSettings(stream: bytes | memoryview) -> dict[str, Any]:
     # Read first part
-    result = packetHelper.readPacketData(stream, MATCH_SETTINGS_FMT_FIRST)
-    data.update(result["data"])
+    result = _MATCH_SETTINGS_FIRST.read(stream)
+    data = result["data"]
 
     # Next part's start
     start = result["end"]
 
     # Second part (this one somewhat depends on match state)
-    struct: list[tuple[str, int]] = [
-        (f"slot{i}ID", dataTypes.SINT32)
+    occupied_slots = [
+        i
         for i in range(16)
         if data[f"slot{i}Status"] not in (slotStatuses.FREE, slotStatuses.LOCKED)
     ]
+    slot_ids = _MATCH_SLOT_IDS[len(occupied_slots)]
+    for i, slot_user_id in zip(
+        occupied_slots,
+        slot_ids.unpack_from(stream, start),
+    ):
+        data[f"slot{i}ID"] = slot_user_id
+    start += slot_ids.size
 
     # Other settings
-    struct.extend(MATCH_SETTINGS_FMT_SECOND)
-
-    # Read second part
-    result = packetHelper.readPacketData(
-        stream[start:],
-        tuple(struct),
+    result = _MATCH_SETTINGS_SECOND.read(
+        stream,
         has_packet_header=False,
+        offset=start,
     )
     data.update(result["data"])
 
@@ -155,81 +183,88 @@ def matchSettings(stream: bytes) -> dict[str, Any]:
 
     # Read third (final) part
     data.update(
-        packetHelper.readPacketData(
-            stream[start:],
-            MATCH_SETTINGS_FMT_THIRD,
+        _MATCH_SETTINGS_THIRD.read(
+            stream,
             has_packet_header=False,
+            offset=start,
         )["data"],
     )
 
     return data
 
 
-def createMatch(stream: bytes) -> dict[str, Any]:
+def createMatch(stream: bytes | memoryview) -> dict[str, Any]:
     return matchSettings(stream)
 
 
-def changeMatchSettings(stream: bytes) -> dict[str, Any]:
+def changeMatchSettings(stream: bytes | memoryview) -> dict[str, Any]:
     return matchSettings(stream)
 
 
-def changeSlot(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("slotID", dataTypes.UINT32),))["data"]
+_SLOT_ID = packetHelper.compile_reader((("slotID", dataTypes.UINT32),))
 
 
-def joinMatch(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(
-        stream,
-        (("matchID", dataTypes.UINT32), ("password", dataTypes.STRING)),
-    )["data"]
+def changeSlot(stream: bytes | memoryview) -> dict[str, Any]:
+    return _SLOT_ID.read(stream)["data"]
+
 
+_JOIN_MATCH = packetHelper.compile_reader(
+    (("matchID", dataTypes.UINT32), ("password", dataTypes.STRING)),
+)
 
-def changeMods(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("mods", dataTypes.UINT32),))["data"]
 
+def joinMatch(stream: bytes | memoryview) -> dict[str, Any]:
+    return _JOIN_MATCH.read(stream)["data"]
 
-def lockSlot(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("slotID", dataTypes.UINT32),))["data"]
 
+_MODS = packetHelper.compile_reader((("mods", dataTypes.UINT32),))
 
-def transferHost(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("slotID", dataTypes.UINT32),))["data"]
 
+def changeMods(stream: bytes | memoryview) -> dict[str, Any]:
+    return _MODS.read(stream)["data"]
 
-def matchInvite(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("userID", dataTypes.UINT32),))["data"]
 
+def lockSlot(stream: bytes | memoryview) -> dict[str, Any]:
+    return _SLOT_ID.read(stream)["data"]
 
-MATCH_FRAMES_FMT = (
-    ("time", dataTypes.SINT32),
-    ("id", dataTypes.BYTE),
-    ("count300", dataTypes.UINT16),
-    ("count100", dataTypes.UINT16),
-    ("count50", dataTypes.UINT16),
-    ("countGeki", dataTypes.UINT16),
-    ("countKatu", dataTypes.UINT16),
-    ("countMiss", dataTypes.UINT16),
-    ("totalScore", dataTypes.SINT32),
-    ("maxCombo", dataTypes.UINT16),
-    ("currentCombo", dataTypes.UINT16),
-    ("perfect", dataTypes.BYTE),
-    ("currentHp", dataTypes.BYTE),
-    ("tagByte", dataTypes.BYTE),
-    ("usingScoreV2", dataTypes.BYTE),
-)
+
+def transferHost(stream: bytes | memoryview) -> dict[str, Any]:
+    return _SLOT_ID.read(stream)["data"]
+
+
+_MATCH_INVITE = packetHelper.compile_reader((("userID", dataTypes.UINT32),))
+
+
+def matchInvite(stream: bytes | memoryview) -> dict[str, Any]:
+    return _MATCH_INVITE.read(stream)["data"]
+
+
+# A score frame is: time (s32), id (u8), count300, count100, count50,
+# countGeki, countKatu, countMiss (u16), totalScore (s32), maxCombo,
+# currentCombo (u16), perfect, currentHp, tagByte, usingScoreV2 (u8).
+# Frames are relayed as sent, so only totalScore & currentHp are read.
+_MATCH_FRAMES_SCORE = struct.Struct("<17xl5xB")
+
+
+def matchFramesScore(stream: bytes | memoryview) -> tuple[int, int]:
+    """
+    Read only the total score and hp of a score frame
+
+    :return: (totalScore, currentHp)
+    """
+    return _MATCH_FRAMES_SCORE.unpack_from(stream, packetHelper.PKT_HDR.size)
 
 
-def matchFrames(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, MATCH_FRAMES_FMT)["data"]
+_MATCH_ID = packetHelper.compile_reader((("matchID", dataTypes.UINT32),))
 
 
-def tournamentMatchInfoRequest(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("matchID", dataTypes.UINT32),))["data"]
+def tournamentMatchInfoRequest(stream: bytes | memoryview) -> dict[str, Any]:
+    return _MATCH_ID.read(stream)["data"]
 
 
-def tournamentJoinMatchChannel(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("matchID", dataTypes.UINT32),))["data"]
+def tournamentJoinMatchChannel(stream: bytes | memoryview) -> dict[str, Any]:
+    return _MATCH_ID.read(stream)["data"]
 
 
-def tournamentLeaveMatchChannel(stream: bytes) -> dict[str, Any]:
-    return packetHelper.readPacketData(stream, (("matchID", dataTypes.UINT32),))["data"]
+def tournamentLeaveMatchChannel(stream: bytes | memoryview) -> dict[str, Any]:
+    return _MATCH_ID.read(stream)["data"]
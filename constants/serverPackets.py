@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+import functools
+
 from common.constants import privileges
 from common.ripple import user_utils
 from constants import CHATBOT_USER_ID
@@ -18,11 +20,155 @@ from objects import osuToken
 # such that this can be just be a serialization layer
 
 
+# Precompiled encoders for packets with dynamic contents
+_NOTIFICATION = packetHelper.compile_writer(
+    packetIDs.server_notification,
+    (dataTypes.STRING,),
+)
+_USER_ID = packetHelper.compile_writer(packetIDs.server_userID, (dataTypes.SINT32,))
+_SILENCE_END = packetHelper.compile_writer(
+    packetIDs.server_silenceEnd,
+    (dataTypes.UINT32,),
+)
+_PROTOCOL_VERSION = packetHelper.compile_writer(
+    packetIDs.server_protocolVersion,
+    (dataTypes.UINT32,),
+)
+_MAIN_MENU_ICON = packetHelper.compile_writer(
+    packetIDs.server_mainMenuIcon,
+    (dataTypes.STRING,),
+)
+_SUPPORTER_GMT = packetHelper.compile_writer(
+    packetIDs.server_supporterGMT,
+    (dataTypes.UINT32,),
+)
+_FRIENDS_LIST = packetHelper.compile_writer(
+    packetIDs.server_friendsList,
+    (dataTypes.INT_LIST,),
+)
+_USER_PRESENCE_BUNDLE = packetHelper.compile_writer(
+    packetIDs.server_userPresenceBundle,
+    (dataTypes.INT_LIST,),
+)
+_USER_LOGOUT = packetHelper.compile_writer(
+    packetIDs.server_userLogout,
+    (dataTypes.SINT32, dataTypes.BYTE),
+)
+_USER_PANEL = packetHelper.compile_writer(
+    packetIDs.server_userPanel,
+    (
+        dataTypes.SINT32,  # user id
+        dataTypes.STRING,  # username
+        dataTypes.BYTE,  # timezone
+        dataTypes.BYTE,  # country
+        dataTypes.BYTE,  # user rank
+        dataTypes.FFLOAT,  # longitude
+        dataTypes.FFLOAT,  # latitude
+        dataTypes.UINT32,  # global rank
+    ),
+)
+_USER_STATS = packetHelper.compile_writer(
+    packetIDs.server_userStats,
+    (
+        dataTypes.UINT32,  # user id
+        dataTypes.BYTE,  # action id
+        dataTypes.STRING,  # action text
+        dataTypes.STRING,  # action md5
+        dataTypes.SINT32,  # action mods
+        dataTypes.BYTE,  # game mode
+        dataTypes.SINT32,  # beatmap id
+        dataTypes.UINT64,  # ranked score
+        dataTypes.FFLOAT,  # accuracy
+        dataTypes.UINT32,  # playcount
+        dataTypes.UINT64,  # total score
+        dataTypes.UINT32,  # global rank
+        dataTypes.UINT16,  # pp
+    ),
+)
+_CHAT_MESSAGE_LAYOUT = (
+    dataTypes.STRING,  # sender
+    dataTypes.STRING,  # message
+    dataTypes.STRING,  # recipient
+    dataTypes.SINT32,  # sender id
+)
+_SEND_MESSAGE = packetHelper.compile_writer(
+    packetIDs.server_sendMessage,
+    _CHAT_MESSAGE_LAYOUT,
+)
+_TARGET_BLOCKING_DMS = packetHelper.compile_writer(
+    packetIDs.server_targetBlockingNonFriendsDM,
+    _CHAT_MESSAGE_LAYOUT,
+)
+_TARGET_SILENCED = packetHelper.compile_writer(
+    packetIDs.server_targetSilenced,
+    _CHAT_MESSAGE_LAYOUT,
+)
+_CHANNEL_JOIN_SUCCESS = packetHelper.compile_writer(
+    packetIDs.server_channelJoinSuccess,
+    (dataTypes.STRING,),
+)
+_CHANNEL_INFO = packetHelper.compile_writer(
+    packetIDs.server_channelInfo,
+    (dataTypes.STRING, dataTypes.STRING, dataTypes.UINT16),
+)
+_CHANNEL_KICKED = packetHelper.compile_writer(
+    packetIDs.server_channelKicked,
+    (dataTypes.STRING,),
+)
+_USER_SILENCED = packetHelper.compile_writer(
+    packetIDs.server_userSilenced,
+    (dataTypes.UINT32,),
+)
+_SPECTATOR_JOINED = packetHelper.compile_writer(
+    packetIDs.server_spectatorJoined,
+    (dataTypes.SINT32,),
+)
+_SPECTATOR_LEFT = packetHelper.compile_writer(
+    packetIDs.server_spectatorLeft,
+    (dataTypes.SINT32,),
+)
+_SPECTATE_FRAMES = packetHelper.compile_writer(
+    packetIDs.server_spectateFrames,
+    (dataTypes.BBYTES,),
+)
+_SPECTATOR_CANT_SPECTATE = packetHelper.compile_writer(
+    packetIDs.server_spectatorCantSpectate,
+    (dataTypes.SINT32,),
+)
+_FELLOW_SPECTATOR_JOINED = packetHelper.compile_writer(
+    packetIDs.server_fellowSpectatorJoined,
+    (dataTypes.SINT32,),
+)
+_FELLOW_SPECTATOR_LEFT = packetHelper.compile_writer(
+    packetIDs.server_fellowSpectatorLeft,
+    (dataTypes.SINT32,),
+)
+_DISPOSE_MATCH = packetHelper.compile_writer(
+    packetIDs.server_disposeMatch,
+    (dataTypes.UINT32,),
+)
+_MATCH_CHANGE_PASSWORD = packetHelper.compile_writer(
+    packetIDs.server_matchChangePassword,
+    (dataTypes.STRING,),
+)
+_MATCH_PLAYER_SKIPPED = packetHelper.compile_writer(
+    packetIDs.server_matchPlayerSkipped,
+    (dataTypes.SINT32,),
+)
+_MATCH_PLAYER_FAILED = packetHelper.compile_writer(
+    packetIDs.server_matchPlayerFailed,
+    (dataTypes.UINT32,),
+)
+_SWITCH_SERVER = packetHelper.compile_writer(
+    packetIDs.server_switchServer,
+    (dataTypes.STRING,),
+)
+_RESTART = packetHelper.compile_writer(packetIDs.server_restart, (dataTypes.UINT32,))
+_SEND_RTX = packetHelper.compile_writer(packetIDs.server_sendRTX, (dataTypes.STRING,))
+
+
 def notification(message: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_notification,
-        ((message, dataTypes.STRING),),
-    )
+    return _NOTIFICATION.build(message)
 
 
 """ Login errors packets """
@@ -73,28 +219,19 @@ needVerification = packetHelper.buildPacket(
 
 
 def userID(uid: int) -> bytes:
-    return packetHelper.buildPacket(packetIDs.server_userID, ((uid, dataTypes.SINT32),))
+    return _USER_ID.build(uid)
 
 
 def silenceEndTime(seconds: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_silenceEnd,
-        ((seconds, dataTypes.UINT32),),
-    )
+    return _SILENCE_END.build(seconds)
 
 
 def protocolVersion(version: int = 19) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_protocolVersion,
-        ((version, dataTypes.UINT32),),
-    )
+    return _PROTOCOL_VERSION.build(version)
 
 
 def mainMenuIcon(icon: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_mainMenuIcon,
-        ((icon, dataTypes.STRING),),
-    )
+    return _MAIN_MENU_ICON.build(icon)
 
 
 def userSupporterGMT(
@@ -114,41 +251,25 @@ def userSupporterGMT(
     if is_tourney_staff:
         result |= userRanks.TOURNAMENT_STAFF
 
-    return packetHelper.buildPacket(
-        packetIDs.server_supporterGMT,
-        ((result, dataTypes.UINT32),),
-    )
+    return _SUPPORTER_GMT.build(result)
 
 
 def friendList(userID: int, friends_list: list[int]) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_friendsList,
-        ((friends_list, dataTypes.INT_LIST),),
-    )
+    return _FRIENDS_LIST.build(friends_list)
 
 
 async def onlineUsers() -> bytes:
-    userIDs = []
-
     # Create list with all connected (and not restricted) users
-    for value in await osuToken.get_tokens():
-        if not osuToken.is_restricted(value["privileges"]):
-            userIDs.append(value["user_id"])
+    userIDs = list(await osuToken.get_non_restricted_user_ids())
 
-    return packetHelper.buildPacket(
-        packetIDs.server_userPresenceBundle,
-        ((userIDs, dataTypes.INT_LIST),),
-    )
+    return _USER_PRESENCE_BUNDLE.build(userIDs)
 
 
 """ Users packets """
 
 
 def userLogout(userID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_userLogout,
-        ((userID, dataTypes.SINT32), (0, dataTypes.BYTE)),
-    )
+    return _USER_LOGOUT.build(userID, 0)
 
 
 BOT_PRESENCE = (
@@ -195,18 +316,15 @@ async def userPanel(userID: int, force: bool = False) -> bytes:
     else:
         userRank |= userRanks.NORMAL  # Regular - lighter yellow
 
-    return packetHelper.buildPacket(
-        packetIDs.server_userPanel,
-        (
-            (userID, dataTypes.SINT32),
-            (username, dataTypes.STRING),
-            (timezone, dataTypes.BYTE),
-            (country, dataTypes.BYTE),
-            (userRank, dataTypes.BYTE),
-            (longitude, dataTypes.FFLOAT),
-            (latitude, dataTypes.FFLOAT),
-            (gameRank, dataTypes.UINT32),
-        ),
+    return _USER_PANEL.build(
+        userID,
+        username,
+        timezone,
+        country,
+        userRank,
+        longitude,
+        latitude,
+        gameRank,
     )
 
 
@@ -237,30 +355,20 @@ async def userStats(userID: int, force: bool = False) -> bytes:
     # our pp value as ranked score instead, and send pp as 0.
     # The rank will not be affected as it is calculated
     # server side rather than on the client.
-    return packetHelper.buildPacket(
-        packetIDs.server_userStats,
-        (
-            (userID, dataTypes.UINT32),
-            (userToken["action_id"], dataTypes.BYTE),
-            (userToken["action_text"], dataTypes.STRING),
-            (userToken["action_md5"], dataTypes.STRING),
-            (userToken["action_mods"], dataTypes.SINT32),
-            (userToken["game_mode"], dataTypes.BYTE),
-            (userToken["beatmap_id"], dataTypes.SINT32),
-            (
-                (
-                    userToken["ranked_score"]
-                    if userToken["pp"] < 0x8000
-                    else userToken["pp"]
-                ),
-                dataTypes.UINT64,
-            ),
-            (userToken["accuracy"], dataTypes.FFLOAT),
-            (userToken["playcount"], dataTypes.UINT32),
-            (userToken["total_score"], dataTypes.UINT64),
-            (userToken["global_rank"], dataTypes.UINT32),
-            (userToken["pp"] if userToken["pp"] < 0x8000 else 0, dataTypes.UINT16),
-        ),
+    return _USER_STATS.build(
+        userID,
+        userToken["action_id"],
+        userToken["action_text"],
+        userToken["action_md5"],
+        userToken["action_mods"],
+        userToken["game_mode"],
+        userToken["beatmap_id"],
+        userToken["ranked_score"] if userToken["pp"] < 0x8000 else userToken["pp"],
+        userToken["accuracy"],
+        userToken["playcount"],
+        userToken["total_score"],
+        userToken["global_rank"],
+        userToken["pp"] if userToken["pp"] < 0x8000 else 0,
     )
 
 
@@ -268,46 +376,24 @@ async def userStats(userID: int, force: bool = False) -> bytes:
 
 
 def sendMessage(fro: str, to: str, message: str, fro_id: int = 0) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_sendMessage,
-        (
-            (fro, dataTypes.STRING),
-            (message, dataTypes.STRING),
-            (to, dataTypes.STRING),
-            (fro_id or user_utils.get_id_from_username(fro), dataTypes.SINT32),
-        ),
+    return _SEND_MESSAGE.build(
+        fro,
+        message,
+        to,
+        fro_id or user_utils.get_id_from_username(fro),
     )
 
 
 def targetBlockingDMs(target: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_targetBlockingNonFriendsDM,
-        (
-            ("", dataTypes.STRING),
-            ("", dataTypes.STRING),
-            (target, dataTypes.STRING),
-            (0, dataTypes.SINT32),
-        ),
-    )
+    return _TARGET_BLOCKING_DMS.build("", "", target, 0)
 
 
 def targetSilenced(target: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_targetSilenced,
-        (
-            ("", dataTypes.STRING),
-            ("", dataTypes.STRING),
-            (target, dataTypes.STRING),
-            (0, dataTypes.SINT32),
-        ),
-    )
+    return _TARGET_SILENCED.build("", "", target, 0)
 
 
 def channelJoinSuccess(chan: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_channelJoinSuccess,
-        ((chan, dataTypes.STRING),),
-    )
+    return _CHANNEL_JOIN_SUCCESS.build(chan)
 
 
 def channelInfo(
@@ -315,13 +401,10 @@ def channelInfo(
     channel_description: str,
     channel_playercount: int,
 ) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_channelInfo,
-        (
-            (channel_name, dataTypes.STRING),
-            (channel_description, dataTypes.STRING),
-            (channel_playercount, dataTypes.UINT16),
-        ),
+    return _CHANNEL_INFO.build(
+        channel_name,
+        channel_description,
+        channel_playercount,
     )
 
 
@@ -332,62 +415,38 @@ channelInfoEnd = packetHelper.buildPacket(
 
 
 def channelKicked(chan: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_channelKicked,
-        ((chan, dataTypes.STRING),),
-    )
+    return _CHANNEL_KICKED.build(chan)
 
 
 def userSilenced(userID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_userSilenced,
-        ((userID, dataTypes.UINT32),),
-    )
+    return _USER_SILENCED.build(userID)
 
 
 """ Spectator packets """
 
 
 def addSpectator(userID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_spectatorJoined,
-        ((userID, dataTypes.SINT32),),
-    )
+    return _SPECTATOR_JOINED.build(userID)
 
 
 def removeSpectator(userID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_spectatorLeft,
-        ((userID, dataTypes.SINT32),),
-    )
+    return _SPECTATOR_LEFT.build(userID)
 
 
-def spectatorFrames(data: bytes) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_spectateFrames,
-        ((data, dataTypes.BBYTES),),
-    )
+def spectatorFrames(data: bytes | memoryview) -> bytes:
+    return _SPECTATE_FRAMES.build(data)
 
 
 def noSongSpectator(userID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_spectatorCantSpectate,
-        ((userID, dataTypes.SINT32),),
-    )
+    return _SPECTATOR_CANT_SPECTATE.build(userID)
 
 
 def fellowSpectatorJoined(userID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_fellowSpectatorJoined,
-        ((userID, dataTypes.SINT32),),
-    )
+    return _FELLOW_SPECTATOR_JOINED.build(userID)
 
 
 def fellowSpectatorLeft(userID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_fellowSpectatorLeft,
-        ((userID, dataTypes.SINT32),),
-    )
+    return _FELLOW_SPECTATOR_LEFT.build(userID)
 
 
 """ Multiplayer Packets """
@@ -395,54 +454,53 @@ def fellowSpectatorLeft(userID: int) -> bytes:
 
 async def createMatch(match_id: int) -> bytes:
     # Get match binary data and build packet
-    multiplayer_match = await match.get_match(match_id)
-    if multiplayer_match is None:
+    match_packet_data = await match.get_match_packet_data(match_id)
+    if match_packet_data is None:
         return b""
 
-    matchData = await match.getMatchData(match_id, censored=True)
-    return packetHelper.buildPacket(packetIDs.server_newMatch, matchData)
+    return packetHelper.build_packet_from_body(
+        packetIDs.server_newMatch,
+        match_packet_data.censored,
+    )
 
 
 async def updateMatch(match_id: int, censored: bool = False) -> bytes | None:
     # Get match binary data and build packet
-    multiplayer_match = await match.get_match(match_id)
-    if multiplayer_match is None:
+    match_packet_data = await match.get_match_packet_data(match_id)
+    if match_packet_data is None:
         return None
 
-    return packetHelper.buildPacket(
+    return packetHelper.build_packet_from_body(
         packetIDs.server_updateMatch,
-        await match.getMatchData(match_id, censored=censored),
+        match_packet_data.censored if censored else match_packet_data.uncensored,
     )
 
 
 async def matchStart(match_id: int) -> bytes:
     # Get match binary data and build packet
-    multiplayer_match = await match.get_match(match_id)
-    if multiplayer_match is None:
+    match_packet_data = await match.get_match_packet_data(match_id)
+    if match_packet_data is None:
         return b""
 
-    return packetHelper.buildPacket(
+    return packetHelper.build_packet_from_body(
         packetIDs.server_matchStart,
-        await match.getMatchData(match_id, censored=False),
+        match_packet_data.uncensored,
     )
 
 
 def disposeMatch(match_id: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_disposeMatch,
-        ((match_id, dataTypes.UINT32),),
-    )
+    return _DISPOSE_MATCH.build(match_id)
 
 
 async def matchJoinSuccess(match_id: int) -> bytes:
     # Get match binary data and build packet
-    multiplayer_match = await match.get_match(match_id)
-    if multiplayer_match is None:
+    match_packet_data = await match.get_match_packet_data(match_id)
+    if match_packet_data is None:
         return b""
 
-    return packetHelper.buildPacket(
+    return packetHelper.build_packet_from_body(
         packetIDs.server_matchJoinSuccess,
-        await match.getMatchData(match_id, censored=False),
+        match_packet_data.uncensored,
     )
 
 
@@ -450,32 +508,37 @@ matchJoinFail = packetHelper.buildPacket(packetIDs.server_matchJoinFail)
 
 
 def changeMatchPassword(newPassword: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_matchChangePassword,
-        ((newPassword, dataTypes.STRING),),
-    )
+    return _MATCH_CHANGE_PASSWORD.build(newPassword)
 
 
 allPlayersLoaded = packetHelper.buildPacket(packetIDs.server_matchAllPlayersLoaded)
 
 
 def playerSkipped(userID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_matchPlayerSkipped,
-        ((userID, dataTypes.SINT32),),
-    )
+    return _MATCH_PLAYER_SKIPPED.build(userID)
 
 
 allPlayersSkipped = packetHelper.buildPacket(packetIDs.server_matchSkip)
 
 
-def matchFrames(slotID: int, data: bytes) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_matchScoreUpdate,
+@functools.lru_cache(maxsize=16)
+def _match_score_update_header(length: int) -> bytes:
+    # Score frames come in very few sizes, so their headers are reused
+    return packetHelper.PKT_HDR.pack(packetIDs.server_matchScoreUpdate, length)
+
+
+_SLOT_IDS = [bytes((slot_id,)) for slot_id in range(16)]
+
+
+def matchFrames(slotID: int, data: bytes | memoryview) -> bytes:
+    # Relay the client's frame as-is, with its id replaced by the sender's slot
+    frame = memoryview(data)[packetHelper.PKT_HDR.size :]
+    return b"".join(
         (
-            (data[7:11], dataTypes.BBYTES),
-            (slotID, dataTypes.BYTE),
-            (data[12:], dataTypes.BBYTES),
+            _match_score_update_header(len(frame)),
+            frame[:4],
+            _SLOT_IDS[slotID],
+            frame[5:],
         ),
     )
 
@@ -484,10 +547,7 @@ matchComplete = packetHelper.buildPacket(packetIDs.server_matchComplete)
 
 
 def playerFailed(slotID: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_matchPlayerFailed,
-        ((slotID, dataTypes.UINT32),),
-    )
+    return _MATCH_PLAYER_FAILED.build(slotID)
 
 
 matchTransferHost = packetHelper.buildPacket(packetIDs.server_matchTransferHost)
@@ -495,39 +555,22 @@ matchAbort = packetHelper.buildPacket(packetIDs.server_matchAbort)
 
 
 def switchServer(address: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_switchServer,
-        ((address, dataTypes.STRING),),
-    )
+    return _SWITCH_SERVER.build(address)
 
 
 """ Other packets """
 
 
 def banchoRestart(msUntilReconnection: int) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_restart,
-        ((msUntilReconnection, dataTypes.UINT32),),
-    )
+    return _RESTART.build(msUntilReconnection)
 
 
 def rtx(message: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_sendRTX,
-        ((message, dataTypes.STRING),),
-    )
+    return _SEND_RTX.build(message)
 
 
 def invalidChatMessage(username: str) -> bytes:
-    return packetHelper.buildPacket(
-        packetIDs.server_sendMessage,
-        (
-            ("", dataTypes.STRING),
-            ("", dataTypes.STRING),
-            (username, dataTypes.STRING),
-            (CHATBOT_USER_ID, dataTypes.SINT32),
-        ),
-    )
+    return _SEND_MESSAGE.build("", "", username, CHATBOT_USER_ID)
 
 
 getAttention = packetHelper.buildPacket(packetIDs.server_getAttention)
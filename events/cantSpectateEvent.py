@@ -7,12 +7,11 @@ from objects import osuToken
 from objects.osuToken import Token
 
 
-async def handle(token: Token, rawPacketData: bytes) -> None:
+async def handle(token: Token, rawPacketData: bytes | memoryview) -> None:
     try:
         # We don't have the beatmap, we can't spectate
-        if (
-            token["spectating_token_id"] is None
-            or token["spectating_token_id"] not in await osuToken.get_token_ids()
+        if token["spectating_token_id"] is None or not await osuToken.token_exists(
+            token["spectating_token_id"]
         ):
             raise exceptions.tokenNotFoundException()
 
@@ -10,7 +10,7 @@ from objects import stream_messages
 from objects.osuToken import Token
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     # Make sure we are not banned
     # if await user_utils.isBanned(userID):
     # 	userToken.enqueue(serverPackets.loginBanned)
@@ -97,6 +97,7 @@ async def handle(userToken: Token, rawPacketData: bytes) -> None:
             stream_name="main",
             data=await serverPackets.userStats(userToken["user_id"]),
             excluded_token_ids=[userToken["token_id"]],
+            shard_key=userToken["user_id"],
         )
 
     await osuToken.enqueue(
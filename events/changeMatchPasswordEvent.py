@@ -6,7 +6,7 @@ from objects.osuToken import Token
 from objects.redisLock import redisLock
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     # Read packet data. Same structure as changeMatchSettings
     packetData = clientPackets.changeMatchSettings(rawPacketData)
 
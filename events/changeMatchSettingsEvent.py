@@ -11,7 +11,7 @@ from objects.osuToken import Token
 from objects.redisLock import redisLock
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     # Read new settings
     packetData = clientPackets.changeMatchSettings(rawPacketData)
 
@@ -70,12 +70,11 @@ async def handle(userToken: Token, rawPacketData: bytes) -> None:
             )
 
         if old_match_mod_mode != multiplayer_match["match_mod_mode"]:
-            slots = await slot.get_slots(multiplayer_match["match_id"])
-
             # Match mode was changed.
             if multiplayer_match["match_mod_mode"] == matchModModes.NORMAL:
                 # Freemods -> Central
                 # Move mods from host -> match.
+                slots = await slot.get_slots(multiplayer_match["match_id"])
                 for slot_id, _slot in enumerate(slots):
                     if _slot["user_id"] == multiplayer_match["host_user_id"]:
                         await match.update_match(
@@ -86,16 +85,18 @@ async def handle(userToken: Token, rawPacketData: bytes) -> None:
             else:
                 # Central -> Freemods
                 # Move mods from match -> players.
-                for slot_id, _slot in enumerate(slots):
-                    if _slot["user_token"]:
-                        await slot.update_slot(
-                            multiplayer_match["match_id"],
-                            slot_id,
+                await slot.transition_slots(
+                    multiplayer_match["match_id"],
+                    [
+                        {
+                            "where_not": {"user_token": None},
                             # removing speed changing mods would seem more correct,
                             # but that would mean switching back from freemods to central
                             # would remove speed changing mods from the match?
-                            mods=multiplayer_match["mods"],
-                        )
+                            "set": {"mods": multiplayer_match["mods"]},
+                        },
+                    ],
+                )
 
                 # Only keep speed-changing mods centralized.
                 await match.update_match(
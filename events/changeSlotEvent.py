@@ -7,7 +7,7 @@ from objects.osuToken import Token
 from objects.redisLock import redisLock
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     match_id = userToken["match_id"]
     if match_id is None:
         return
@@ -8,7 +8,7 @@ from objects import glob
 from objects.osuToken import Token
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     channel_name = clientPackets.channelJoin(rawPacketData)["channel"]
     await chat.part_channel(token_id=userToken["token_id"], channel_name=channel_name)
 
@@ -8,7 +8,10 @@ from objects import glob
 from objects.osuToken import Token
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:  # Friend add packet
+async def handle(
+    userToken: Token,
+    rawPacketData: bytes | memoryview,
+) -> None:  # Friend add packet
     friend_user_id = clientPackets.addRemoveFriend(rawPacketData)["friendID"]
     await user_utils.add_friend(userToken["user_id"], friend_user_id)
 
@@ -13,7 +13,7 @@ from objects.osuToken import Token
 from objects.redisLock import redisLock
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     # read packet data
     packetData = clientPackets.joinMatch(rawPacketData)
     matchID = packetData["matchID"]
@@ -541,12 +541,11 @@ async def handle(web_handler: AsyncRequestHandler) -> tuple[str, bytes]:  # toke
             )
 
         # Send online users' panels
-        for token in await osuToken.get_tokens():
-            if not osuToken.is_restricted(token["privileges"]):
-                await osuToken.enqueue(
-                    userToken["token_id"],
-                    await serverPackets.userPanel(token["user_id"]),
-                )
+        for online_user_id in await osuToken.get_non_restricted_user_ids():
+            await osuToken.enqueue(
+                userToken["token_id"],
+                await serverPackets.userPanel(online_user_id),
+            )
 
         # Get location and country from client ip address
         geolocation = await locationHelper.resolve_ip_geolocation(request_ip_address)
@@ -576,6 +575,7 @@ async def handle(web_handler: AsyncRequestHandler) -> tuple[str, bytes]:  # toke
             await stream_messages.broadcast_data(
                 "main",
                 await serverPackets.userPanel(userID),
+                shard_key=userID,
             )
 
         if glob.amplitude is not None:
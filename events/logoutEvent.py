@@ -17,7 +17,7 @@ from objects.osuToken import Token
 
 async def handle(
     token: Token,
-    rawPacketData: bytes | None = None,
+    rawPacketData: bytes | memoryview | None = None,
     deleteToken: bool = True,
 ) -> None:
     # Big client meme here. If someone logs out and logs in right after,
@@ -45,6 +45,7 @@ async def handle(
     await stream_messages.broadcast_data(
         "main",
         serverPackets.userLogout(token["user_id"]),
+        shard_key=token["user_id"],
     )
 
     # Delete token
@@ -5,7 +5,7 @@ from objects import osuToken
 from objects.osuToken import Token
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     # Remove user from users in lobby
     await osuToken.leaveStream(userToken["token_id"], "lobby")
 
@@ -8,7 +8,7 @@ from objects import osuToken
 from objects.osuToken import Token
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     # Read packet data
     packetData = clientPackets.setAwayMessage(rawPacketData)
 
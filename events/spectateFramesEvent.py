@@ -6,7 +6,7 @@ from objects import stream_messages
 from objects.osuToken import Token
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     # Send spectator frames to every spectator
     streamName = f"spect/{userToken['user_id']}"
     await stream_messages.broadcast_data(
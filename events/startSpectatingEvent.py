@@ -12,7 +12,7 @@ from objects import osuToken
 from objects.osuToken import Token
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     try:
         # Start spectating packet
         packetData = clientPackets.startSpectating(rawPacketData)
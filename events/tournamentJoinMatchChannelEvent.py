@@ -7,7 +7,7 @@ from objects import osuToken
 from objects.osuToken import Token
 
 
-async def handle(userToken: Token, rawPacketData: bytes) -> None:
+async def handle(userToken: Token, rawPacketData: bytes | memoryview) -> None:
     packetData = clientPackets.tournamentJoinMatchChannel(rawPacketData)
     if (
         packetData["matchID"] not in await match.get_match_ids()
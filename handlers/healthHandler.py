@@ -8,6 +8,9 @@ from objects import glob
 
 class handler(AsyncRequestHandler):
     async def get(self) -> None:
+        if glob.worker_id is not None:
+            self.set_header("X-Worker-Id", str(glob.worker_id))
+
         try:
             await glob.redis.ping()
             await glob.db.fetch("SELECT 1")
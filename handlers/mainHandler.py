@@ -1,9 +1,7 @@
 from __future__ import annotations
 
 import asyncio
-import gzip
 import random
-import struct
 import time
 from collections.abc import Awaitable
 from collections.abc import Callable
@@ -12,7 +10,9 @@ from uuid import UUID
 import amplitude
 
 import settings
+from common import compression
 from common.log import logger
+from common.redis import command_counting
 from common.web.requestsManager import AsyncRequestHandler
 from constants import exceptions
 from constants import packetIDs
@@ -61,16 +61,19 @@ from events import tournamentLeaveMatchChannelEvent
 from events import tournamentMatchInfoRequestEvent
 from events import userPanelRequestEvent
 from events import userStatsRequestEvent
+from helpers import packetHelper
+from helpers import pollHelper
 from objects import glob
 from objects import osuToken
 from objects import stream_messages
 from objects import tokenList
 
-PACKET_PROTO = struct.Struct("<HxI")
-
 # Packet map of all bancho related
 # interactions with the osu! client.
-bancho_packets: dict[int, Callable[[osuToken.Token, bytes], Awaitable[None]]] = {
+bancho_packets: dict[
+    int,
+    Callable[[osuToken.Token, bytes | memoryview], Awaitable[None]],
+] = {
     packetIDs.client_changeAction: changeActionEvent.handle,
     packetIDs.client_logout: logoutEvent.handle,
     packetIDs.client_friendAdd: friendAddEvent.handle,
@@ -191,39 +194,33 @@ class handler(AsyncRequestHandler):
             userToken = None  # default value
             try:
                 # This is not the first packet, send response based on client's request
-                # Packet start position, used to read stacked packets
-                pos = 0
-
                 # Make sure the token exists
                 userToken = await osuToken.get_token(requestTokenString)
                 if userToken is None:
                     raise exceptions.tokenNotFoundException()
 
-                # Keep reading packets until everything has been read
-                requestDataLen = len(requestData)
-                while pos < requestDataLen:
+                # Read the stacked packets, handing out views into the
+                # request body rather than copying each packet out of it
+                for packetID, packetData in packetHelper.iter_packets(requestData):
                     st = time.perf_counter_ns()
-                    # Get packet from stack starting from new packet
-                    leftData = requestData[pos:]
-
-                    # Get packet ID, data length and data
-                    packetID, dataLength = PACKET_PROTO.unpack(leftData[:7])
-                    assert isinstance(packetID, int) and isinstance(dataLength, int)
-                    packetData = leftData[: dataLength + 7]
 
                     # Process/ignore packet
-                    if packetID != 4:
-                        if packetID in bancho_packets:
-                            if (
-                                not osuToken.is_restricted(userToken["privileges"])
-                                or packetID in restricted_packets
-                            ):
-                                await bancho_packets[packetID](userToken, packetData)
-                        # else:
-                        # 	#log.warning(f"Unhandled: {packetID}")
-                    else:
-                        # This is a ping packet (4) - update ping time for timeout
-                        await osuToken.updatePingTime(userToken["token_id"])
+                    with command_counting.count_commands() as redis_commands:
+                        if packetID != 4:
+                            if packetID in bancho_packets:
+                                if (
+                                    not osuToken.is_restricted(userToken["privileges"])
+                                    or packetID in restricted_packets
+                                ):
+                                    await bancho_packets[packetID](
+                                        userToken,
+                                        packetData,
+                                    )
+                            # else:
+                            # 	#log.warning(f"Unhandled: {packetID}")
+                        else:
+                            # This is a ping packet (4) - update ping time for timeout
+                            await osuToken.updatePingTime(userToken["token_id"])
 
                     time_elapsed_ms = round(
                         (time.perf_counter_ns() - st) / 1000 / 1000,
@@ -240,19 +237,19 @@ class handler(AsyncRequestHandler):
                                     "packet_id": packetIDs.get_packet_name(packetID),
                                     "_user_id": userToken["user_id"],
                                     "time_elapsed_ms": time_elapsed_ms,
+                                    "redis_commands": redis_commands.count,
                                 },
                             ),
                         )
 
-                    # Update pos so we can read the next stacked packet
-                    # +7 because we add packet ID bytes, unused byte and data length bytes
-                    pos += dataLength + 7
-
                 # Token queue built, send it
                 responseTokenString = userToken["token_id"]
                 responseData = await stream_messages.read_all_pending_data(
                     userToken["token_id"],
                 )
+                if not responseData and settings.APP_LONG_POLL_ENABLED:
+                    # Nothing to send yet; wait a little while for something
+                    responseData = await pollHelper.hold_poll(userToken["token_id"])
 
             except exceptions.tokenNotFoundException:
                 # Client thinks it's logged in when it's
@@ -264,25 +261,27 @@ class handler(AsyncRequestHandler):
                 if userToken is not None:
                     # Packet handlers may have updated session information, or may have
                     # deleted the session (e.g. logout packet). Re-fetch it to ensure
-                    # we have the latest state in-memory
-                    userToken = await osuToken.get_token(requestTokenString)
-                    if userToken is not None:
-                        # Delete token if kicked
-                        if userToken["kicked"]:
-                            await tokenList.deleteToken(userToken["token_id"])
+                    # we have the latest state in-memory, including changes made
+                    # by other requests meanwhile (e.g. being kicked)
+                    with osuToken.bypass_token_cache():
+                        userToken = await osuToken.get_token(requestTokenString)
+                        if userToken is not None:
+                            # Delete token if kicked
+                            if userToken["kicked"]:
+                                await tokenList.deleteToken(userToken["token_id"])
 
         # Send server's response to client
         # We don't use token object because we might not have a token (failed login)
-        if settings.APP_GZIP:
-            # First, write the gzipped response
-            self.write(gzip.compress(responseData, settings.APP_GZIP_LEVEL))
+        responseData, contentEncoding = await compression.compress_response(
+            responseData,
+            self.request.headers.get("Accept-Encoding"),
+        )
+        self.write(responseData)
 
-            # Then, add gzip headers
+        if settings.APP_GZIP:
             self.add_header("Vary", "Accept-Encoding")
-            self.add_header("Content-Encoding", "gzip")
-        else:
-            # First, write the response
-            self.write(responseData)
+        if contentEncoding is not None:
+            self.add_header("Content-Encoding", contentEncoding)
 
         # Add all the headers AFTER the response has been written
         self.set_status(200)
@@ -295,7 +294,8 @@ class handler(AsyncRequestHandler):
     async def post(self) -> None:
         # XXX:HACK around tornado/asyncio poor exception support
         try:
-            await self._post()
+            with osuToken.request_token_cache():
+                await self._post()
         except Exception:
             logger.exception("An unhandled error occurred")
 
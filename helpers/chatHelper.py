@@ -15,13 +15,27 @@ from constants import serverPackets
 from objects import channelList
 from objects import chatbot
 from objects import osuToken
+from objects import rateLimiter
 from objects import stream
 from objects import stream_messages
 from objects import streamList
 from objects.chatbot import ChatbotResponse
+from objects.rateLimiter import RateLimit
 
 MAXIMUM_MESSAGE_LENGTH = 1000
 
+# Users exceeding a chat rate limit are silenced. Staff are exempt, and the
+# per-user limit is taken from the first privilege the user has in this list.
+DEFAULT_CHAT_RATE_LIMIT = RateLimit(max_hits=10, window=60)
+PRIVILEGE_CHAT_RATE_LIMITS: list[tuple[int, RateLimit]] = [
+    (privileges.USER_TOURNAMENT_STAFF, RateLimit(max_hits=30, window=60)),
+]
+
+# Additional per-user limits for messages sent to specific channels
+CHANNEL_CHAT_RATE_LIMITS: dict[str, RateLimit] = {}
+
+SPAM_SILENCE_SECONDS = 5 * 60
+
 
 class SendMessageError(str, Enum):
     UNKNOWN_CHANNEL = "UNKNOWN_CHANNEL"
@@ -681,6 +695,48 @@ async def _handle_message_from_chatbot(
     return None
 
 
+def _get_chat_rate_limit(user_privileges: int) -> RateLimit:
+    for privilege, rate_limit in PRIVILEGE_CHAT_RATE_LIMITS:
+        if user_privileges & privilege:
+            return rate_limit
+    return DEFAULT_CHAT_RATE_LIMIT
+
+
+async def chat_spam_protection(
+    token: osuToken.Token,
+    *,
+    channel_name: str | None = None,
+) -> None:
+    """
+    Record a chat message sent by `token`, silencing them if they are spamming.
+
+    :param channel_name: name of the channel the message was sent to, if any
+    :return:
+    """
+    within_limits = await rateLimiter.hit(
+        "chat",
+        token["user_id"],
+        _get_chat_rate_limit(token["privileges"]),
+    )
+
+    channel_rate_limit = (
+        CHANNEL_CHAT_RATE_LIMITS.get(channel_name) if channel_name is not None else None
+    )
+    if within_limits and channel_rate_limit is not None:
+        within_limits = await rateLimiter.hit(
+            f"chat:{channel_name}",
+            token["user_id"],
+            channel_rate_limit,
+        )
+
+    if not within_limits:
+        await osuToken.silence(
+            token["token_id"],
+            SPAM_SILENCE_SECONDS,
+            "Spamming (auto spam protection)",
+        )
+
+
 async def send_message(
     *,
     sender_token_id: str,
@@ -797,7 +853,10 @@ async def send_message(
         return response
 
     if not osuToken.is_staff(sender_token["privileges"]):
-        await osuToken.chat_spam_protection(sender_token["token_id"])
+        await chat_spam_protection(
+            sender_token,
+            channel_name=recipient_name if is_channel else None,
+        )
 
     if _should_audit_log_message(message):
         audit_log_message = f"{sender_token['username']} @ {recipient_name}: {message}"
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import functools
 import struct
+from collections.abc import Callable
+from collections.abc import Iterator
 from typing import Any
 from typing import TypedDict
 
@@ -107,6 +110,147 @@ def packData(__data: Any, dataType: int) -> bytes:
 
 PKT_HDR_START = struct.Struct("<Hx")
 PKT_HDR_END = struct.Struct("<I")
+PKT_HDR = struct.Struct("<HxI")
+
+# Struct format characters for all fixed-width data types,
+# used to merge runs of fixed-width fields into a single struct.
+_fixed_formats = {
+    dataTypes.UINT16: "H",
+    dataTypes.SINT16: "h",
+    dataTypes.UINT32: "L",
+    dataTypes.SINT32: "l",
+    dataTypes.UINT64: "Q",
+    dataTypes.SINT64: "q",
+    dataTypes.FFLOAT: "f",
+    dataTypes.BYTE: "B",
+}
+
+_INT_LIST_LENGTH = struct.Struct("<H")
+
+
+def _pack_string(value: str | None) -> bytes:
+    if not value:
+        # empty string; \x00
+        return b"\x00"
+
+    # real string; \x0b[uleb][string]
+    encoded = value.encode()
+    return b"\x0b" + uleb128Encode(len(encoded)) + encoded
+
+
+def _pack_int_list(values: list[int]) -> bytes:
+    # 2 bytes length, 4 bytes each element
+    return _INT_LIST_LENGTH.pack(len(values)) + struct.pack(
+        f"<{len(values)}i",
+        *values,
+    )
+
+
+def _pack_raw_bytes(value: bytes | memoryview) -> bytes:
+    return bytes(value)
+
+
+_variable_packers: dict[int, Callable[[Any], bytes]] = {
+    dataTypes.STRING: _pack_string,
+    dataTypes.INT_LIST: _pack_int_list,
+    dataTypes.BBYTES: _pack_raw_bytes,
+}
+
+
+class PacketWriter:
+    """\
+    A precompiled encoder for a server packet layout.
+
+    Runs of fixed-width fields are merged into a single `struct.Struct`,
+    and layouts made only of fixed-width fields are encoded (header
+    included) with a single `pack` call.
+    """
+
+    __slots__ = ("packet_id", "layout", "_fixed", "_steps")
+
+    def __init__(self, packet_id: int, layout: tuple[int, ...] = ()) -> None:
+        self.packet_id = packet_id
+        self.layout = layout
+
+        self._fixed: struct.Struct | None = None
+        self._steps: list[tuple[Callable[..., bytes], int, int]] = []
+
+        if all(data_type in _fixed_formats for data_type in layout):
+            fmt = "".join(_fixed_formats[data_type] for data_type in layout)
+            self._fixed = struct.Struct(f"<HxI{fmt}")
+            return
+
+        pos = 0
+        run_start = 0
+        run_format = ""
+        for data_type in layout:
+            if data_type in _fixed_formats:
+                run_format += _fixed_formats[data_type]
+            else:
+                if run_format:
+                    packer = struct.Struct(f"<{run_format}").pack
+                    self._steps.append((packer, run_start, pos))
+                    run_format = ""
+
+                self._steps.append((_variable_packers[data_type], pos, pos + 1))
+                run_start = pos + 1
+
+            pos += 1
+
+        if run_format:
+            self._steps.append((struct.Struct(f"<{run_format}").pack, run_start, pos))
+
+    def build(self, *values: Any) -> bytes:
+        """
+        Build a packet from `values`, in the order of this writer's layout
+
+        :return: packet bytes
+        """
+        if self._fixed is not None:
+            return self._fixed.pack(
+                self.packet_id,
+                self._fixed.size - PKT_HDR.size,
+                *values,
+            )
+
+        body = b"".join(
+            [packer(*values[start:stop]) for packer, start, stop in self._steps],
+        )
+        return PKT_HDR.pack(self.packet_id, len(body)) + body
+
+
+def build_packet_body(packet_data: tuple[tuple[Any, int], ...]) -> bytes:
+    """
+    Builds the body of a packet, to be sent later with `build_packet_from_body`
+
+    :param packet_data: packet structure [[data, dataType], [data, dataType], ...]
+    :return: packet body bytes
+    """
+    writer = compile_writer(0, tuple([i[1] for i in packet_data]))
+    return writer.build(*[i[0] for i in packet_data])[PKT_HDR.size :]
+
+
+def build_packet_from_body(packet_id: int, body: bytes) -> bytes:
+    """
+    Builds a packet around an already encoded body
+
+    :param packet_id: packet ID
+    :param body: packet body bytes
+    :return: packet bytes
+    """
+    return PKT_HDR.pack(packet_id, len(body)) + body
+
+
+@functools.lru_cache(maxsize=512)
+def compile_writer(packet_id: int, layout: tuple[int, ...] = ()) -> PacketWriter:
+    """
+    Compile (or fetch a cached) encoder for a server packet layout
+
+    :param packet_id: packet ID
+    :param layout: packet data types (dataType, dataType, ...)
+    :return: compiled packet writer
+    """
+    return PacketWriter(packet_id, layout)
 
 
 def buildPacket(
@@ -120,13 +264,27 @@ def buildPacket(
     :param __packetData: packet structure [[data, dataType], [data, dataType], ...]
     :return: packet bytes
     """
-    packetData = bytearray(PKT_HDR_START.pack(packet_id))
+    writer = compile_writer(packet_id, tuple([i[1] for i in packet_data]))
+    return writer.build(*[i[0] for i in packet_data])
 
-    for i in packet_data:
-        packetData += packData(i[0], i[1])
 
-    packetData[3:3] = PKT_HDR_END.pack(len(packetData) - 3)
-    return bytes(packetData)
+def iter_packets(stream: bytes | memoryview) -> Iterator[tuple[int, memoryview]]:
+    """
+    Iterate over the stacked packets in `stream` without copying it
+
+    :param stream: request body, containing zero or more packets
+    :return: iterator of (packet ID, packet view). Each view includes the
+             packet header, so it can be passed straight to `clientPackets`
+    """
+    view = memoryview(stream)
+    size = len(view)
+    pos = 0
+
+    while pos < size:
+        packet_id, length = PKT_HDR.unpack_from(view, pos)
+        end = pos + PKT_HDR.size + length
+        yield packet_id, view[pos:end]
+        pos = end
 
 
 class PacketData(TypedDict):
@@ -134,8 +292,147 @@ class PacketData(TypedDict):
     end: int
 
 
+def _read_uleb128(stream: bytes | memoryview, pos: int) -> tuple[int, int]:
+    """Decode a uleb128 starting at `pos`, returning (value, new pos)"""
+    value = 0
+    shift = 0
+
+    while True:
+        b = stream[pos]
+        value |= (b & 0b01111111) << shift
+        pos += 1
+
+        if (b & 0b10000000) == 0:
+            return value, pos
+
+        shift += 7
+
+
+def _read_string(stream: bytes | memoryview, pos: int) -> tuple[str, int]:
+    # Check empty string
+    if stream[pos] == 0:
+        # empty string; \x00
+        return "", pos + 1
+
+    # real string; \x0b[uleb][string]
+    length = stream[pos + 1]
+    if length & 0b10000000:
+        length, pos = _read_uleb128(stream, pos + 1)
+    else:
+        pos += 2
+
+    end = pos + length
+    # bytes() is a no-op for bytes input, and copies only the string
+    # itself out of a memoryview
+    return bytes(stream[pos:end]).decode(), end
+
+
+def _read_int_list(stream: bytes | memoryview, pos: int) -> tuple[list[int], int]:
+    # 2 bytes length, 4 bytes each element
+    (length,) = _INT_LIST_LENGTH.unpack_from(stream, pos)
+    pos += _INT_LIST_LENGTH.size
+    return list(struct.unpack_from(f"<{length}I", stream, pos)), pos + 4 * length
+
+
+_variable_readers: dict[
+    int,
+    Callable[[bytes | memoryview, int], tuple[Any, int]],
+] = {
+    dataTypes.STRING: _read_string,
+    dataTypes.INT_LIST: _read_int_list,
+}
+
+
+class PacketReader:
+    """\
+    A precompiled decoder for a client packet structure.
+
+    Runs of fixed-width fields are merged into a single `struct.Struct`
+    which is unpacked in place, without slicing the input buffer.
+    """
+
+    __slots__ = ("structure", "_steps")
+
+    def __init__(self, structure: tuple[tuple[str, int], ...]) -> None:
+        self.structure = structure
+
+        # Each step is either a run of fixed-width fields (names, struct, None)
+        # or a single variable-width field ((name,), None, reader function)
+        self._steps: list[
+            tuple[
+                tuple[str, ...],
+                struct.Struct | None,
+                Callable[[bytes | memoryview, int], tuple[Any, int]] | None,
+            ]
+        ] = []
+
+        run_names: list[str] = []
+        run_format = ""
+        for name, data_type in structure:
+            if data_type in _fixed_formats:
+                run_names.append(name)
+                run_format += _fixed_formats[data_type]
+                continue
+
+            if run_names:
+                fmt = struct.Struct(f"<{run_format}")
+                self._steps.append((tuple(run_names), fmt, None))
+                run_names = []
+                run_format = ""
+
+            self._steps.append(((name,), None, _variable_readers[data_type]))
+
+        if run_names:
+            fmt = struct.Struct(f"<{run_format}")
+            self._steps.append((tuple(run_names), fmt, None))
+
+    def read(
+        self,
+        stream: bytes | memoryview,
+        *,
+        has_packet_header: bool = True,
+        offset: int = 0,
+    ) -> PacketData:
+        """
+        Read packet data from `stream` according to this reader's structure
+
+        :param stream: packet bytes
+        :param has_packet_header: 	if True, `stream` has packetID and length bytes.
+                                    if False, `stream` has only packet data. Default: True
+        :param offset: position in `stream` to start reading from. Default: 0
+        :return: {data, end}
+        """
+        data: dict[str, Any] = {}
+
+        # Skip packet ID and packet length if needed
+        pos = offset + PKT_HDR.size if has_packet_header else offset
+
+        for names, fmt, reader in self._steps:
+            if fmt is not None:
+                if len(names) == 1:
+                    data[names[0]] = fmt.unpack_from(stream, pos)[0]
+                else:
+                    data.update(zip(names, fmt.unpack_from(stream, pos)))
+                pos += fmt.size
+            elif reader is not None:
+                data[names[0]], pos = reader(stream, pos)
+
+        return {"data": data, "end": pos - offset}
+
+
+@functools.lru_cache(maxsize=512)
+def compile_reader(structure: tuple[tuple[str, int], ...]) -> PacketReader:
+    """
+    Compile (or fetch a cached) decoder for a client packet structure
+
+    :param structure: packet structure: ((name, dataType), (name, dataType), ...)
+    :return: compiled packet reader
+    """
+    return PacketReader(structure)
+
+
 def readPacketData(
-    stream: bytes,
+    stream: bytes | memoryview,
     structure: tuple[tuple[str, int], ...],
     *,
     has_packet_header: bool = True,
@@ -148,41 +445,4 @@ def readPacketData(
                                 if False, `stream` has only packet data. Default: True
     :return: {data, end}
     """
-    # Read packet ID (first 2 bytes)
-    data: dict[str, Any] = {}
-
-    # Skip packet ID and packet length if needed
-    start = end = 7 if has_packet_header else 0
-
-    # Read packet
-    for i in structure:
-        start = end
-        if i[1] == dataTypes.INT_LIST:
-            # 2 bytes length, 4 bytes each element
-            length = int.from_bytes(stream[start : start + 2], "little")
-
-            data[i[0]] = []
-            for j in range(length):
-                offs = start + 2 + (4 * j)
-                data[i[0]].append(int.from_bytes(stream[offs : offs + 4], "little"))
-
-            # Update end
-            end = start + 2 + (4 * length)
-        elif i[1] == dataTypes.STRING:
-            # Check empty string
-            if stream[start] != 0:
-                # real string; \x0b[uleb][string]
-                uleb_val, uleb_len = uleb128Decode(stream[start + 1 :])
-                end = start + uleb_val + uleb_len + 1
-
-                data[i[0]] = stream[start + 1 + uleb_len : end].decode()
-            else:
-                # empty string; \x00
-                data[i[0]] = ""
-                end = start + 1
-        else:
-            fmt = _default_packs[i[1]]
-            end = start + fmt.size
-            data[i[0]] = fmt.unpack(stream[start:end])[0]
-
-    return {"data": data, "end": end}
+    return compile_reader(structure).read(stream, has_packet_header=has_packet_header)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import settings
+from objects import stream_messages
+
+# Set on shutdown, to hand held polls back to their clients immediately
+_release_event = asyncio.Event()
+
+_held_polls = 0
+
+
+def get_held_polls_count() -> int:
+    return _held_polls
+
+
+def release_held_polls() -> None:
+    """Return all held polls (with no data) and stop holding new ones"""
+    _release_event.set()
+
+
+async def hold_poll(token_id: str) -> bytes:
+    """
+    Hold a poll with no pending data until data arrives for the token,
+    or until the long poll timeout is reached.
+
+    :param token_id: token id
+    :return: pending data, or empty bytes if nothing arrived in time
+    """
+    global _held_polls
+
+    if _release_event.is_set() or _held_polls >= settings.APP_LONG_POLL_MAX_HELD:
+        return b""
+
+    _held_polls += 1
+    try:
+        deadline = time.monotonic() + settings.APP_LONG_POLL_TIMEOUT
+        while (remaining_time := deadline - time.monotonic()) > 0:
+            wait_task = asyncio.create_task(
+                stream_messages.wait_for_new_messages(token_id, remaining_time),
+            )
+            release_task = asyncio.create_task(_release_event.wait())
+            done, pending = await asyncio.wait(
+                {wait_task, release_task},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in pending:
+                task.cancel()
+
+            if wait_task not in done or not wait_task.result():
+                return b""
+
+            # New messages may all be ones the token is excluded
+            # from, in which case we keep waiting for the remaining time
+            pending_data = await stream_messages.read_all_pending_data(token_id)
+            if pending_data:
+                return pending_data
+
+        return b""
+    finally:
+        _held_polls -= 1
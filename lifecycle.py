@@ -1,12 +1,16 @@
 from __future__ import annotations
 
 import aio_pika
-import redis.asyncio as redis
 
 import settings
+from common import compression
+from common import password_hashing
 from common.log import logger
+from common.redis import command_counting
 from objects import banchoConfig
 from objects import glob
+from objects import redisLock
+from objects import stream_messages
 from objects.dbPool import DBPool
 
 
@@ -28,7 +32,7 @@ async def startup() -> None:
     # Connect to redis
     logger.info("Connecting to redis")
     try:
-        glob.redis = redis.Redis(
+        glob.redis = command_counting.CountingRedis(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
             db=settings.REDIS_DB,
@@ -92,6 +96,9 @@ async def shutdown() -> None:
         extra={"component": settings.APP_COMPONENT},
     )
 
+    redisLock.shutdown()
+    stream_messages.shutdown()
+
     logger.info("Closing connection to redis")
     await glob.redis.close()
     logger.info("Closed connection to redis")
@@ -99,3 +106,6 @@ async def shutdown() -> None:
     logger.info("Closing connection(s) to MySQL")
     await glob.db.stop()
     logger.info("Closed connection(s) to MySQL")
+
+    password_hashing.shutdown()
+    compression.shutdown()
@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import asyncio
 import atexit
+import functools
 import logging
 import os
 import signal
@@ -15,9 +16,15 @@ import tornado.web
 
 import lifecycle
 import settings
+from common import compression
 from common import exception_handling
+from common import password_hashing
+from common import process_supervisor
+from common import runtime
 from common.log import logger
 from common.log import logging_config
+from common.redis import pubSub
+from common.redis.pubsubs import AbstractPubSubHandler
 from constants import CHATBOT_USER_NAME
 from handlers import apiChatbotMessageHandler
 from handlers import apiIsOnlineHandler
@@ -27,14 +34,49 @@ from handlers import apiServerStatusHandler
 from handlers import apiVerifiedStatusHandler
 from handlers import healthHandler
 from handlers import mainHandler
+from helpers import pollHelper
 from objects import channelList
 from objects import chatbot
 from objects import glob
+from objects import match
+from objects import migrations
+from objects import osuToken
+from objects import redisLock
+from objects import stream_messages
 from objects import streamList
+from objects.broadcastCache import BroadcastCache
+from pubSubHandlers import changePasswordHandler
+
+# Pubsub channels which affect in-process state, so they
+# must be handled by every replica (rather than by a worker)
+LOCAL_PUBSUB_HANDLERS: dict[str, AbstractPubSubHandler] = {
+    "peppy:change_password": changePasswordHandler.ChangePasswordPubSubHandler(),
+}
+
+RUNTIME_STATS_REPORT_INTERVAL = 60  # in seconds
+
+# Streams read by (nearly) every client, served from memory on each replica
+HOT_STREAM_NAMES = ["main", "lobby", "staff"]
 
 SHUTDOWN_EVENT: asyncio.Event | None = None
 
 
+async def get_hot_stream_keys() -> list[str]:
+    """The streams to serve from the broadcast cache, incl. public channels"""
+    hot_stream_names = HOT_STREAM_NAMES + [
+        f"chat/{channel['name']}"
+        for channel in await channelList.getChannels()
+        if not channel["instance"]
+    ]
+    return [
+        stream_messages.make_key(physical_stream_name)
+        for stream_name in hot_stream_names
+        for physical_stream_name in stream_messages.get_physical_stream_names(
+            stream_name,
+        )
+    ]
+
+
 def handle_shutdown_event(signum: int, frame: FrameType | None) -> None:
     logging.info("Received shutdown signal", extra={"signum": signal.strsignal(signum)})
     if SHUTDOWN_EVENT is not None:
@@ -44,9 +86,51 @@ def handle_shutdown_event(signum: int, frame: FrameType | None) -> None:
 signal.signal(signal.SIGTERM, handle_shutdown_event)
 
 
+async def consume_local_pubsub_events() -> None:
+    pubsub_listener = pubSub.listener(
+        redis_connection=glob.redis,
+        handlers=LOCAL_PUBSUB_HANDLERS,
+    )
+    pubsub = glob.redis.pubsub()
+    await pubsub.subscribe(*LOCAL_PUBSUB_HANDLERS)
+
+    async for item in pubsub.listen():
+        try:
+            await pubsub_listener.processItem(item)
+        except Exception:
+            logger.exception(
+                "An error occurred while processing a pubsub item",
+                extra={"item": item},
+            )
+
+
+async def report_runtime_stats() -> None:
+    while True:
+        await asyncio.sleep(RUNTIME_STATS_REPORT_INTERVAL)
+        logger.info(
+            "Runtime stats report",
+            extra={
+                "worker_id": glob.worker_id,
+                "bcrypt_cache": glob.bcrypt_cache.get_stats(),
+                "bcrypt_queue_depth": password_hashing.get_queue_depth(),
+                "held_polls": pollHelper.get_held_polls_count(),
+                "compression": compression.get_stats(),
+                "match_packet_cache": glob.match_packet_cache.get_stats(),
+                "locks": redisLock.get_stats(),
+                "broadcast_cache": (
+                    glob.broadcast_cache.get_stats()
+                    if glob.broadcast_cache is not None
+                    else None
+                ),
+            },
+        )
+
+
 async def main() -> int:
+    global SHUTDOWN_EVENT
     SHUTDOWN_EVENT = asyncio.Event()
     http_server: tornado.httpserver.HTTPServer | None = None
+    background_tasks: list[asyncio.Task[None]] = []
     try:
         # TODO: do we need this anymore now with stateless design?
         # (not using filesystem anymore for things like .data/)
@@ -54,6 +138,31 @@ async def main() -> int:
 
         await lifecycle.startup()
 
+        # Data migrations. Processes wait for one which another is running.
+        # Deploy order: stop the processes still on the legacy layouts before
+        # starting new ones. Otherwise, during a rolling deploy:
+        # - tokens created by old processes are only moved over by the
+        #   inactive token cron (every few minutes); until then, new
+        #   processes don't see them and their users have to log in again.
+        # - matches created by old processes after the match migration ran
+        #   stay in the legacy layout, which new processes can't read.
+        await migrations.run_once(
+            "tokens_field_hashes",
+            osuToken.migrate_legacy_tokens,
+        )
+        await migrations.run_once(
+            "token_presence_indexes",
+            osuToken.backfill_presence_indexes,
+        )
+        await migrations.run_once("token_ping_times", osuToken.backfill_ping_times)
+        await migrations.run_once("match_hashes", match.migrate_legacy_matches)
+        await migrations.run_once("lobby_snapshot", match.rebuild_lobby_snapshot)
+        for stream_name in stream_messages.STREAM_SHARD_COUNTS:
+            await migrations.run_once(
+                f"reshard_stream_offsets:{stream_name}",
+                functools.partial(osuToken.reshard_stream_offsets, stream_name),
+            )
+
         await channelList.loadChannels()
 
         # Initialize stremas
@@ -68,6 +177,16 @@ async def main() -> int:
 
         await chatbot.connect()
 
+        if settings.BROADCAST_CACHE_ENABLED:
+            glob.broadcast_cache = BroadcastCache(
+                get_stream_keys=get_hot_stream_keys,
+                max_messages=settings.BROADCAST_CACHE_MAX_MESSAGES,
+            )
+            background_tasks.append(asyncio.create_task(glob.broadcast_cache.run()))
+
+        background_tasks.append(asyncio.create_task(consume_local_pubsub_events()))
+        background_tasks.append(asyncio.create_task(report_runtime_stats()))
+
         # Start the HTTP server
         API_ENDPOINTS = [
             (r"/", mainHandler.handler),
@@ -85,11 +204,14 @@ async def main() -> int:
             handlers=API_ENDPOINTS,  # type: ignore[arg-type]
         )
         http_server = tornado.httpserver.HTTPServer(glob.application)
-        http_server.listen(settings.APP_PORT)
+        # With multiple workers, each has its own listening socket
+        # on the same port and the kernel balances connections
+        http_server.listen(settings.APP_PORT, reuse_port=settings.APP_WORKERS > 1)
         logger.info(
             f"HTTP server listening for clients on port {settings.APP_PORT}",
             extra={
                 "port": settings.APP_PORT,
+                "worker_id": glob.worker_id,
                 "endpoints": [e[0] for e in API_ENDPOINTS],
             },
         )
@@ -102,6 +224,9 @@ async def main() -> int:
             http_server.stop()
             logger.info("Closed HTTP listener")
 
+            # Hand back any held polls so their connections can finish
+            pollHelper.release_held_polls()
+
             logger.info("Closing HTTP connections")
             # Allow grace period for ongoing connections to finish
             try:
@@ -114,6 +239,9 @@ async def main() -> int:
 
             logger.info("Closed HTTP connections")
 
+        for task in background_tasks:
+            task.cancel()
+
         await lifecycle.shutdown()
 
         logger.info("Goodbye!")
@@ -121,12 +249,18 @@ async def main() -> int:
     return 0
 
 
+def run_worker(worker_id: int) -> int:
+    glob.worker_id = worker_id
+    return runtime.run(main)
+
+
 if __name__ == "__main__":
     logging_config.configure_logging()
     exception_handling.hook_exception_handlers()
     atexit.register(exception_handling.unhook_exception_handlers)
-    try:
-        exit_code = asyncio.run(main())
-    except KeyboardInterrupt:
-        exit_code = 0
+    if settings.APP_WORKERS > 1:
+        # Each worker sets up its own event loop & connections after forking
+        exit_code = process_supervisor.run_workers(settings.APP_WORKERS, run_worker)
+    else:
+        exit_code = runtime.run(main)
     exit(exit_code)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from typing import TypedDict
+
+
+class _CacheEntry(NamedTuple):
+    bcrypt_hash: bytes
+    password_md5: bytes
+    expires_at: float
+
+
+class BcryptCacheStats(TypedDict):
+    entries: int
+    max_entries: int
+    memory_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+
+
+class BcryptCache:
+    """\
+    A bounded LRU cache of successful bcrypt checks, per user.
+
+    Entries expire after `ttl` seconds, and are dropped early if the user's
+    stored bcrypt hash no longer matches (e.g. their password was changed).
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries: OrderedDict[int, _CacheEntry] = OrderedDict()
+        self._memory_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int, bcrypt_hash: bytes) -> bytes | None:
+        """
+        Get the password md5 which was last verified against `bcrypt_hash`
+
+        :return: password md5, or None if it's not cached
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry.expires_at <= time.monotonic():
+            self._remove(user_id)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        if entry.bcrypt_hash != bcrypt_hash:
+            # The password was changed since this was cached
+            self._remove(user_id)
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry.password_md5
+
+    def set(self, user_id: int, bcrypt_hash: bytes, password_md5: bytes) -> None:
+        if user_id in self._entries:
+            self._remove(user_id)
+
+        entry = _CacheEntry(
+            bcrypt_hash=bcrypt_hash,
+            password_md5=password_md5,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        self._entries[user_id] = entry
+        self._memory_bytes += _entry_size(entry)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        if user_id in self._entries:
+            self._remove(user_id)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._memory_bytes = 0
+
+    def get_stats(self) -> BcryptCacheStats:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_bytes": self._memory_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id)
+        self._memory_bytes -= _entry_size(entry)
+
+
+def _entry_size(entry: _CacheEntry) -> int:
+    # Only the variable-size payloads; per-entry overhead is roughly constant
+    return len(entry.bcrypt_hash) + len(entry.password_md5)
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Mapping
+from typing import NamedTuple
+from typing import TypedDict
+
+from common.log import logger
+from objects import glob
+
+TAIL_BLOCK_MS = 5_000
+TAIL_BATCH_SIZE = 1_000
+
+# How often the list of streams to cache is refreshed, e.g. for new channels
+STREAM_KEYS_REFRESH_INTERVAL = 60  # in seconds
+
+
+def parse_message_id(message_id: str) -> tuple[int, int]:
+    milliseconds, _, sequence = message_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class _CachedMessage(NamedTuple):
+    message_id: tuple[int, int]
+    raw_message_id: str
+    packet_data: bytes
+    excluded_token_ids: str
+
+
+class _CachedStream:
+    __slots__ = ("messages", "covered_from", "last_message_id")
+
+    def __init__(self, last_message_id: str, max_messages: int) -> None:
+        self.messages: deque[_CachedMessage] = deque(maxlen=max_messages)
+        # Every message after this id, up to `last_message_id`, is cached
+        self.covered_from = parse_message_id(last_message_id)
+        self.last_message_id = last_message_id
+
+
+class BroadcastCacheStats(TypedDict):
+    streams: int
+    messages: int
+    hits: int
+    misses: int
+
+
+class BroadcastCache:
+    """\
+    An in-process copy of the most recent messages of hot shared streams.
+
+    A single reader tails the streams from redis into a bounded ring buffer
+    per stream, so that polls can be served from memory rather than every
+    client reading the same messages from redis. The streams to cache are
+    listed by `get_stream_keys`, which is called again every so often.
+    """
+
+    def __init__(
+        self,
+        get_stream_keys: Callable[[], Awaitable[list[str]]],
+        max_messages: int,
+    ) -> None:
+        self.get_stream_keys = get_stream_keys
+        self.max_messages = max_messages
+        self._stream_keys_refreshed_at = 0.0
+
+        # Only contains streams once they're being tailed
+        self._streams: dict[str, _CachedStream] = {}
+
+        # Set when their streams get new messages, see `add_waiter`
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_cached_stream_keys(self) -> list[str]:
+        return list(self._streams)
+
+    def read(
+        self,
+        stream_key: str,
+        offset: str,
+        token_id: str,
+    ) -> list[tuple[str, bytes]] | None:
+        """
+        Read the messages of a stream after `offset`
+
+        :return: [(message id, packet data)], where the packet data is empty
+                 for messages which the token is excluded from, or None if
+                 the messages after `offset` are not (or no longer) cached
+        """
+        stream = self._streams.get(stream_key)
+        offset_id = parse_message_id(offset)
+        if stream is None or offset_id < stream.covered_from:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        new_messages: list[_CachedMessage] = []
+        for message in reversed(stream.messages):
+            if message.message_id <= offset_id:
+                break
+            new_messages.append(message)
+
+        excluded_token_id = f",{token_id},"
+        return [
+            (
+                message.raw_message_id,
+                (
+                    message.packet_data
+                    if excluded_token_id not in f",{message.excluded_token_ids},"
+                    else b""
+                ),
+            )
+            for message in reversed(new_messages)
+        ]
+
+    def add_waiter(
+        self,
+        stream_offsets: Mapping[str, str],
+        event: asyncio.Event,
+    ) -> None:
+        """
+        Set `event` once any of the streams has messages after its offset
+
+        :param stream_offsets: {stream key: offset}, of cached streams
+        """
+        for stream_key, offset in stream_offsets.items():
+            self._waiters.setdefault(stream_key, set()).add(event)
+
+            stream = self._streams.get(stream_key)
+            if stream is not None and parse_message_id(
+                stream.last_message_id,
+            ) > parse_message_id(offset):
+                event.set()
+
+    def remove_waiter(self, stream_keys: Iterable[str], event: asyncio.Event) -> None:
+        for stream_key in stream_keys:
+            waiters = self._waiters.get(stream_key)
+            if waiters is None:
+                continue
+
+            waiters.discard(event)
+            if not waiters:
+                del self._waiters[stream_key]
+
+    async def run(self) -> None:
+        """Tail the streams into the cache until cancelled"""
+        while True:
+            try:
+                await self._reset()
+                await self._tail()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("An error occurred while tailing broadcast streams")
+                await asyncio.sleep(1)
+
+    async def _reset(self) -> None:
+        # We may have missed messages, start over from the latest ones
+        self._remove_streams(list(self._streams))
+        await self._refresh_stream_keys()
+
+    def _remove_streams(self, stream_keys: list[str]) -> None:
+        for stream_key in stream_keys:
+            del self._streams[stream_key]
+
+            # Have waiters check for messages we may have missed, and
+            # watch the stream by themselves if it's no longer cached
+            for event in self._waiters.get(stream_key, ()):
+                event.set()
+
+    async def _refresh_stream_keys(self) -> None:
+        stream_keys = await self.get_stream_keys()
+        self._stream_keys_refreshed_at = time.monotonic()
+
+        self._remove_streams(
+            [
+                stream_key
+                for stream_key in self._streams
+                if stream_key not in stream_keys
+            ],
+        )
+
+        new_stream_keys = [
+            stream_key for stream_key in stream_keys if stream_key not in self._streams
+        ]
+        if not new_stream_keys:
+            return
+
+        async with glob.redis.pipeline() as pipe:
+            for stream_key in new_stream_keys:
+                await pipe.xrevrange(stream_key, count=1)
+            latest_messages = await pipe.execute()
+
+        for stream_key, latest_message in zip(new_stream_keys, latest_messages):
+            last_message_id = latest_message[0][0].decode() if latest_message else "0-0"
+            self._streams[stream_key] = _CachedStream(
+                last_message_id,
+                self.max_messages,
+            )
+
+    async def _tail(self) -> None:
+        while True:
+            if (
+                time.monotonic() - self._stream_keys_refreshed_at
+                >= STREAM_KEYS_REFRESH_INTERVAL
+            ):
+                await self._refresh_stream_keys()
+
+            if not self._streams:
+                await asyncio.sleep(TAIL_BLOCK_MS / 1000)
+                continue
+
+            data = await glob.redis.xread(
+                {
+                    stream_key: stream.last_message_id
+                    for stream_key, stream in self._streams.items()
+                },
+                count=TAIL_BATCH_SIZE,
+                block=TAIL_BLOCK_MS,
+            )
+
+            for raw_stream_key, messages in data:
+                stream = self._streams[raw_stream_key.decode()]
+
+                for raw_message_id, fields in messages:
+                    if len(stream.messages) == stream.messages.maxlen:
+                        stream.covered_from = stream.messages[0].message_id
+
+                    message_id = raw_message_id.decode()
+                    stream.messages.append(
+                        _CachedMessage(
+                            message_id=parse_message_id(message_id),
+                            raw_message_id=message_id,
+                            packet_data=fields.get(b"packet_data", b""),
+                            excluded_token_ids=fields.get(
+                                b"excluded_token_ids",
+                                b"",
+                            ).decode(),
+                        ),
+                    )
+                    stream.last_message_id = message_id
+
+                for event in self._waiters.get(raw_stream_key.decode(), ()):
+                    event.set()
+
+    def get_stats(self) -> BroadcastCacheStats:
+        return {
+            "streams": len(self._streams),
+            "messages": sum(len(stream.messages) for stream in self._streams.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
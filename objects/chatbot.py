@@ -46,10 +46,12 @@ async def connect() -> None:
         await stream_messages.broadcast_data(
             "main",
             await serverPackets.userPanel(CHATBOT_USER_ID),
+            shard_key=CHATBOT_USER_ID,
         )
         await stream_messages.broadcast_data(
             "main",
             await serverPackets.userStats(CHATBOT_USER_ID),
+            shard_key=CHATBOT_USER_ID,
         )
 
         for channel_name in await channelList.getChannelNames():
@@ -9,6 +9,8 @@ from amplitude import Amplitude
 from amplitude import Config as AmplitudeConfig
 
 import settings
+from objects.bcryptCache import BcryptCache
+from objects.matchPacketCache import MatchPacketCache
 
 if TYPE_CHECKING:
     import aio_pika
@@ -16,6 +18,7 @@ if TYPE_CHECKING:
     from redis.asyncio import Redis
 
     from objects.banchoConfig import banchoConfig
+    from objects.broadcastCache import BroadcastCache
     from objects.dbPool import DBPool
 
 
@@ -25,7 +28,17 @@ redis: Redis[Any]
 banchoConf: banchoConfig
 
 groupPrivileges: dict[str, int] = {}
-bcrypt_cache: dict[bytes, bytes] = {}
+bcrypt_cache = BcryptCache(
+    max_entries=settings.BCRYPT_CACHE_MAX_ENTRIES,
+    ttl=settings.BCRYPT_CACHE_TTL,
+)
+match_packet_cache = MatchPacketCache(
+    max_entries=settings.MATCH_PACKET_CACHE_MAX_ENTRIES,
+)
+
+# only set on api replicas, see main.py
+worker_id: int | None = None
+broadcast_cache: BroadcastCache | None = None
 
 amplitude: Amplitude | None = None
 if settings.AMPLITUDE_API_KEY:
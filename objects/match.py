@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-from copy import deepcopy
 from datetime import datetime
 from typing import Any
 from typing import TypedDict
@@ -16,10 +15,12 @@ from constants import dataTypes
 from constants import matchModModes
 from constants import matchTeams
 from constants import matchTeamTypes
+from constants import packetIDs
 from constants import serverPackets
 from constants import slotStatuses
 from constants.match_events import MatchEvents
 from helpers import chatHelper as chat
+from helpers import packetHelper
 from helpers.scoreHelper import calculate_accuracy
 from objects import channelList
 from objects import glob
@@ -29,13 +30,20 @@ from objects import osuToken
 from objects import slot
 from objects import stream_messages
 from objects import streamList
-from objects import tokenList
+from objects.matchPacketCache import MatchPacketData
+from objects.redisScript import redisScript
 
 # (set) bancho:matches
-# (json obj) bancho:matches:{match_id}
-# (set? list?) bancho:matches:{match_id}:slots
-# (json obj) bancho:matches:{match_id}:slots:{index}
+# (hash) bancho:matches:{match_id}
+#   match: json obj
+#   slots:{slot_id}: json obj, see slot.py
+#   version: int, bumped on every change to the match or its slots
 # (set) bancho:matches:{match_id}:referees
+# (hash) bancho:matches:{match_id}:live_scores
+#   {slot_id}:score: int, total score of the slot's latest score frame
+#   {slot_id}:failed: 0/1, whether the slot's user was failing at that frame
+# (hash) bancho:lobby:match_packets: match_id -> censored server_newMatch packet
+# (hash) bancho:lobby:match_versions: match_id -> version of the above
 
 
 class Match(TypedDict):
@@ -75,6 +83,10 @@ def make_lock_key(match_id: int) -> str:
     return f"bancho:matches:{match_id}:lock"
 
 
+def make_live_scores_key(match_id: int) -> str:
+    return f"bancho:matches:{match_id}:live_scores"
+
+
 async def create_match(
     match_name: str,
     match_password: str,
@@ -104,9 +116,6 @@ async def create_match(
     match_id = await insert_match(match_name, match_history_private)
     await insert_match_event(match_id, MatchEvents.MATCH_CREATION, user_id=host_user_id)
 
-    await glob.redis.sadd("bancho:matches", match_id)
-    for slot_id in range(16):
-        await slot.create_slot(match_id, slot_id)
     match: Match = {
         "match_id": match_id,
         "match_name": match_name,
@@ -130,7 +139,22 @@ async def create_match(
         "match_history_private": match_history_private,
         "current_game_id": current_game_id,
     }
-    await glob.redis.set(make_key(match_id), orjson.dumps(match))
+
+    async with glob.redis.pipeline() as pipe:
+        await pipe.hset(
+            make_key(match_id),
+            mapping={
+                "match": orjson.dumps(match),
+                "version": 1,
+                **{
+                    slot.make_field(slot_id): orjson.dumps(slot.make_empty_slot())
+                    for slot_id in range(slot.SLOT_COUNT)
+                },
+            },
+        )
+        await pipe.sadd("bancho:matches", match_id)
+        await pipe.execute()
+
     return match
 
 
@@ -140,13 +164,30 @@ async def get_match_ids() -> set[int]:
 
 
 async def get_match(match_id: int) -> Match | None:
-    raw_match = await glob.redis.get(make_key(match_id))
+    raw_match = await glob.redis.hget(make_key(match_id), "match")
     if raw_match is None:
         return None
 
     return cast(Match, orjson.loads(raw_match))
 
 
+async def get_match_with_slots(
+    match_id: int,
+) -> tuple[Match, list[slot.Slot]] | None:
+    """Read a match along with its slots, in a single round trip"""
+    raw_match, *raw_slots = await glob.redis.hmget(
+        make_key(match_id),
+        ["match", *slot.SLOT_FIELDS],
+    )
+    if raw_match is None:
+        return None
+
+    return (
+        cast(Match, orjson.loads(raw_match)),
+        [cast(slot.Slot, orjson.loads(raw_slot)) for raw_slot in raw_slots],
+    )
+
+
 async def update_match(
     match_id: int,
     *,
@@ -216,19 +257,211 @@ async def update_match(
     if not isinstance(current_game_id, Unset):
         match["current_game_id"] = current_game_id
 
-    await glob.redis.set(make_key(match_id), orjson.dumps(match))
+    async with glob.redis.pipeline() as pipe:
+        await pipe.hset(make_key(match_id), "match", orjson.dumps(match))
+        await pipe.hincrby(make_key(match_id), "version", 1)
+        await pipe.execute()
+
     return match
 
 
+# Bumps a match's version, unless the match was deleted
+BUMP_VERSION_SCRIPT = redisScript(
+    """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+return redis.call("HINCRBY", KEYS[1], "version", 1)
+""",
+)
+
+
+async def bump_version(match_id: int) -> None:
+    """
+    Mark a match as changed without changing its data, e.g. when one of its
+    users' tokens goes away, so that its packets are encoded again
+    """
+    await BUMP_VERSION_SCRIPT(keys=[make_key(match_id)])
+
+
 async def delete_match(match_id: int) -> None:
     # TODO: should we throw error when no match exists?
     async with glob.redis.pipeline() as pipe:
         await pipe.srem("bancho:matches", match_id)
-        await pipe.delete(make_key(match_id))
+        await pipe.delete(make_key(match_id), make_live_scores_key(match_id))
+        await pipe.hdel(LOBBY_PACKETS_KEY, match_id)
+        await pipe.hdel(LOBBY_VERSIONS_KEY, match_id)
         await pipe.execute()
 
-    # TODO: should devs have to do this separately?
-    await slot.delete_slots(match_id)
+    glob.match_packet_cache.invalidate(match_id)
+
+
+# Moves a match stored with the legacy layout (a json string for the match,
+# and one for each of its slots) into its hash, unless it was already moved.
+# KEYS: match key, then the legacy slot keys in order
+MIGRATE_LEGACY_MATCH_SCRIPT = redisScript(
+    """
+if redis.call("TYPE", KEYS[1]).ok ~= "string" then
+    return 0
+end
+
+local fields = {"match", redis.call("GET", KEYS[1])}
+for i = 2, #KEYS do
+    local raw_slot = redis.call("GET", KEYS[i])
+    if raw_slot then
+        fields[#fields + 1] = "slots:" .. (i - 2)
+        fields[#fields + 1] = raw_slot
+    end
+end
+
+redis.call("DEL", unpack(KEYS))
+redis.call("HSET", KEYS[1], unpack(fields))
+return 1
+""",
+)
+
+
+async def migrate_legacy_matches() -> None:
+    """
+    Move matches stored with the legacy layout (separate json objects for
+    the match and each of its slots) over to a single hash per match.
+    """
+    migrated_matches = 0
+    for match_id in await get_match_ids():
+        migrated_matches += await MIGRATE_LEGACY_MATCH_SCRIPT(
+            keys=[
+                make_key(match_id),
+                *(
+                    f"bancho:matches:{match_id}:slots:{slot_id}"
+                    for slot_id in range(slot.SLOT_COUNT)
+                ),
+            ],
+        )
+
+    if migrated_matches:
+        logger.info(
+            "Migrated matches to the hash storage layout",
+            extra={"match_count": migrated_matches},
+        )
+
+
+LOBBY_PACKETS_KEY = "bancho:lobby:match_packets"
+LOBBY_VERSIONS_KEY = "bancho:lobby:match_versions"
+
+# Stores a match's packet in the lobby snapshot, unless the match was deleted
+# or a newer version of it was stored in the meantime.
+# KEYS: lobby packets, lobby versions, match key
+# ARGV: match id, version, packet
+SET_LOBBY_PACKET_SCRIPT = redisScript(
+    """
+if redis.call("EXISTS", KEYS[3]) == 0 then
+    return 0
+end
+
+local stored_version = redis.call("HGET", KEYS[2], ARGV[1])
+if stored_version and tonumber(stored_version) >= tonumber(ARGV[2]) then
+    return 0
+end
+
+redis.call("HSET", KEYS[1], ARGV[1], ARGV[3])
+redis.call("HSET", KEYS[2], ARGV[1], ARGV[2])
+return 1
+""",
+)
+
+
+async def update_lobby_snapshot(
+    match_id: int,
+    match_packet_data: MatchPacketData,
+) -> None:
+    """
+    Store a match's censored packet in the lobby snapshot
+
+    :param match_id: Match ID
+    :param match_packet_data: the match's encoded data
+    """
+    await SET_LOBBY_PACKET_SCRIPT(
+        keys=[LOBBY_PACKETS_KEY, LOBBY_VERSIONS_KEY, make_key(match_id)],
+        args=[
+            match_id,
+            match_packet_data.version,
+            packetHelper.build_packet_from_body(
+                packetIDs.server_newMatch,
+                match_packet_data.censored,
+            ),
+        ],
+    )
+
+
+async def get_lobby_snapshot() -> bytes:
+    """
+    Get the packets of all matches, as sent to users joining the lobby
+
+    :return: concatenated server_newMatch packets
+    """
+    return b"".join(await glob.redis.hvals(LOBBY_PACKETS_KEY))
+
+
+async def rebuild_lobby_snapshot() -> None:
+    """
+    Bring the lobby snapshot in line with the stored matches, e.g. for
+    matches created before it was maintained.
+    """
+    match_ids = await get_match_ids()
+
+    stale_match_ids = [
+        int(match_id)
+        for match_id in await glob.redis.hkeys(LOBBY_PACKETS_KEY)
+        if int(match_id) not in match_ids
+    ]
+    if stale_match_ids:
+        async with glob.redis.pipeline() as pipe:
+            await pipe.hdel(LOBBY_PACKETS_KEY, *stale_match_ids)
+            await pipe.hdel(LOBBY_VERSIONS_KEY, *stale_match_ids)
+            await pipe.execute()
+
+    for match_id in match_ids:
+        match_packet_data = await get_match_packet_data(match_id)
+        if match_packet_data is not None:
+            await update_lobby_snapshot(match_id, match_packet_data)
+
+
+# Stores a slot's live score, unless the match was deleted. Deleting a match
+# deletes its live scores with it, so this can't leave any behind.
+# KEYS: live scores, match key
+# ARGV: score field, score, failed field, failed
+# Returns 1 if the score was stored, 0 if the match doesn't exist.
+SET_LIVE_SCORE_SCRIPT = redisScript(
+    """
+if redis.call("EXISTS", KEYS[2]) == 0 then
+    return 0
+end
+
+redis.call("HSET", KEYS[1], ARGV[1], ARGV[2], ARGV[3], ARGV[4])
+return 1
+""",
+)
+
+
+async def set_live_score(
+    match_id: int,
+    slot_id: int,
+    score: int,
+    failed: bool,
+) -> bool:
+    """
+    Store the score of a slot's latest score frame
+
+    Score frames are sent many times per second by every player, so they're
+    kept out of the slots, and cleared when the game ends.
+
+    :return: whether the score was stored, i.e. the match still exists
+    """
+    stored: int = await SET_LIVE_SCORE_SCRIPT(
+        keys=[make_live_scores_key(match_id), make_key(match_id)],
+        args=[f"{slot_id}:score", score, f"{slot_id}:failed", int(failed)],
+    )
+    return stored == 1
 
 
 def create_stream_name(match_id: int) -> str:
@@ -239,25 +472,70 @@ def create_playing_stream_name(match_id: int) -> str:
     return f"multi/{match_id}/playing"
 
 
-async def getMatchData(
-    match_id: int,
+async def get_match_packet_data(match_id: int) -> MatchPacketData | None:
+    """
+    Get the encoded match data for match packets, cached per match version
+
+    :param match_id: Match ID
+    :return: encoded match data, or None if the match doesn't exist
+    """
+    raw_version = await glob.redis.hget(make_key(match_id), "version")
+    if raw_version is not None:
+        match_packet_data = glob.match_packet_cache.get(match_id, int(raw_version))
+        if match_packet_data is not None:
+            return match_packet_data
+
+    raw_version, raw_match, *raw_slots = await glob.redis.hmget(
+        make_key(match_id),
+        ["version", "match", *slot.SLOT_FIELDS],
+    )
+    if raw_match is None:
+        return None
+
+    multiplayer_match = cast(Match, orjson.loads(raw_match))
+    slots = [cast(slot.Slot, orjson.loads(raw_slot)) for raw_slot in raw_slots]
+
+    # Deleting a token bumps the version of its match, so the cached data
+    # never lists users whose tokens are gone
+    existing_token_ids = await osuToken.get_existing_token_ids(
+        [_slot["user_token"] for _slot in slots if _slot["user_token"] is not None],
+    )
+
+    match_packet_data = MatchPacketData(
+        version=int(raw_version or 0),
+        uncensored=packetHelper.build_packet_body(
+            _make_match_data(multiplayer_match, slots, existing_token_ids),
+        ),
+        censored=packetHelper.build_packet_body(
+            _make_match_data(
+                multiplayer_match,
+                slots,
+                existing_token_ids,
+                censored=True,
+            ),
+        ),
+    )
+    if raw_version is not None:
+        glob.match_packet_cache.set(match_id, match_packet_data)
+
+    return match_packet_data
+
+
+def _make_match_data(
+    multiplayer_match: Match,
+    slots: list[slot.Slot],
+    existing_token_ids: set[str],
     censored: bool = False,
 ) -> tuple[tuple[object, int], ...]:
     """
     Return binary match data structure for packetHelper
 
-    :param match_id: Match ID
+    :param existing_token_ids: tokens of the slots' users which still exist
     :param censored: Whether to censor password
     :return:
     """
     # General match info
 
-    multiplayer_match = await get_match(match_id)
-    assert multiplayer_match is not None
-
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
     struct: list[tuple[object, int]] = [
         (multiplayer_match["match_id"], dataTypes.UINT16),
         (int(multiplayer_match["is_in_progress"]), dataTypes.BYTE),
@@ -283,12 +561,9 @@ async def getMatchData(
 
     struct.extend(
         [
-            (await tokenList.getUserIDFromToken(slot["user_token"]), dataTypes.UINT32)
+            (slot["user_id"], dataTypes.UINT32)
             for slot in slots
-            if (
-                slot["user_token"]
-                and await osuToken.get_token(slot["user_token"]) is not None
-            )
+            if slot["user_token"] in existing_token_ids
         ],
     )
 
@@ -337,13 +612,12 @@ async def setHost(match_id: int, new_host_id: int) -> bool:
 
     await add_referee(match_id, new_host_id)
 
-    slot_id = await getUserSlotID(match_id, new_host_id)
+    slots = await slot.get_slots(match_id)
+    slot_id = _find_user_slot_id(slots, new_host_id)
     if slot_id is None:
         return False
 
-    _slot = await slot.get_slot(match_id, slot_id)
-    assert _slot is not None
-
+    _slot = slots[slot_id]
     if _slot["user_token"] is None:
         return False
 
@@ -412,9 +686,6 @@ async def setSlot(
     skip: bool | None = None,
     complete: bool | None = None,
 ) -> slot.Slot:
-    _slot = await slot.get_slot(match_id, slot_id)
-    assert _slot is not None
-
     _slot = await slot.update_slot(
         match_id,
         slot_id,
@@ -453,23 +724,29 @@ async def toggleSlotReady(match_id: int, slot_id: int) -> None:
     :return:
     """
 
-    multiplayer_match = await get_match(match_id)
-    assert multiplayer_match is not None
-
-    _slot = await slot.get_slot(match_id, slot_id)
-    assert _slot is not None
+    # Update ready status and send update
+    result = await slot.transition_slots(
+        match_id,
+        [
+            {
+                "slot_id": slot_id,
+                "where": {"status": slotStatuses.READY},
+                "where_not": {"user_token": None},
+                "set": {"status": slotStatuses.NOT_READY},
+            },
+            {
+                "slot_id": slot_id,
+                "where_not": {"status": slotStatuses.READY, "user_token": None},
+                "set": {"status": slotStatuses.READY},
+            },
+        ],
+        match_where={"is_starting": False},
+    )
+    assert result is not None
 
-    # Update ready status and setnd update
-    if not _slot["user_token"] or multiplayer_match["is_starting"]:
+    if not result.applied or not any(result.changed_slot_ids):
         return
 
-    oldStatus = _slot["status"]
-    if oldStatus == slotStatuses.READY:
-        newStatus = slotStatuses.NOT_READY
-    else:
-        newStatus = slotStatuses.READY
-
-    await setSlot(match_id, slot_id, newStatus)
     await sendUpdates(match_id)
 
 
@@ -492,7 +769,7 @@ async def toggleSlotLocked(match_id: int, slot_id: int) -> None:
         newStatus = slotStatuses.LOCKED
 
     # Send updated settings to kicked user, so he returns to lobby
-    if _slot["user_token"] and _slot["user_token"] in await osuToken.get_token_ids():
+    if _slot["user_token"] and await osuToken.token_exists(_slot["user_token"]):
         packet_data = await serverPackets.updateMatch(match_id)
         if packet_data is None:
             # TODO: is this correct behaviour?
@@ -525,19 +802,12 @@ async def playerLoaded(match_id: int, user_id: int) -> None:
     :param userID: ID of user
     :return:
     """
-    slot_id = await getUserSlotID(match_id, user_id)
-    if slot_id is None:
-        return
-
     # Set loaded to True
-    _slot = await slot.get_slot(match_id, slot_id)
-    assert _slot is not None
-
-    _slot = await slot.update_slot(match_id, slot_id, loaded=True)
-    assert _slot is not None
+    result = await _update_user_slot(match_id, user_id, {"loaded": True})
+    if result is None:
+        return
 
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
+    _, slots = result
 
     # Check whether all players are loaded
     playing = 0
@@ -575,25 +845,18 @@ async def playerSkip(match_id: int, user_id: int) -> None:
     :param userID: ID of user
     :return:
     """
-    slot_id = await getUserSlotID(match_id, user_id)
-    if slot_id is None:
+    # Set skip to True
+    result = await _update_user_slot(match_id, user_id, {"skip": True})
+    if result is None:
         return
 
-    _slot = await slot.get_slot(match_id, slot_id)
-    assert _slot is not None
-
-    # Set skip to True
-    _slot = await slot.update_slot(match_id, slot_id, skip=True)
-    assert _slot is not None
+    slot_id, slots = result
 
     # Send skip packet to every playing user
     playing_stream_name = create_playing_stream_name(match_id)
     packet_data = serverPackets.playerSkipped(slot_id)
     await stream_messages.broadcast_data(playing_stream_name, packet_data)
 
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
     # Check all skipped
     total_playing = 0
     skipped = 0
@@ -627,14 +890,11 @@ async def playerCompleted(match_id: int, user_id: int) -> None:
 
     :param userID: ID of user
     """
-    slot_id = await getUserSlotID(match_id, user_id)
-    if slot_id is None:
+    result = await _update_user_slot(match_id, user_id, {"complete": True})
+    if result is None:
         return
 
-    await setSlot(match_id, slot_id, complete=True)
-
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
+    _, slots = result
 
     # Check all completed
     total_playing = 0
@@ -655,18 +915,13 @@ async def allPlayersCompleted(match_id: int) -> None:
 
     :return:
     """
-    multiplayer_match = await get_match(match_id)
-    assert multiplayer_match is not None
-
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
     # Reset inProgress
     multiplayer_match = await update_match(match_id, is_in_progress=False)
     assert multiplayer_match is not None
 
     # Reset slots
     await resetSlots(match_id)
+    await glob.redis.delete(make_live_scores_key(match_id))
 
     # Send match update
     await sendUpdates(match_id)
@@ -702,25 +957,33 @@ async def allPlayersCompleted(match_id: int) -> None:
 
 
 async def resetSlots(match_id: int) -> None:
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
+    """Reset the slots which were playing, once the game is over"""
+    await slot.transition_slots(
+        match_id,
+        [
+            {
+                "where": {"status": slotStatuses.PLAYING},
+                "where_not": {"user_token": None},
+                "set": {
+                    "status": slotStatuses.NOT_READY,
+                    "loaded": False,
+                    "skip": False,
+                    "complete": False,
+                    "score": 0,
+                    "failed": False,
+                    "passed": True,
+                },
+            },
+        ],
+    )
 
-    # TODO: make sure slot_id is right?
-    # not sure about the order.
-    # also not sure we start from 0.
+
+def _find_user_slot_id(slots: list[slot.Slot], user_id: int) -> int | None:
     for slot_id, _slot in enumerate(slots):
-        if _slot["user_token"] is not None and _slot["status"] == slotStatuses.PLAYING:
-            await slot.update_slot(
-                match_id,
-                slot_id,
-                status=slotStatuses.NOT_READY,
-                loaded=False,
-                skip=False,
-                complete=False,
-                score=0,
-                failed=False,
-                passed=True,
-            )
+        if _slot["user_id"] == user_id:
+            return slot_id
+
+    return None
 
 
 async def getUserSlotID(match_id: int, user_id: int) -> int | None:
@@ -732,11 +995,27 @@ async def getUserSlotID(match_id: int, user_id: int) -> int | None:
     slots = await slot.get_slots(match_id)
     assert len(slots) == 16
 
-    for slot_id, _slot in enumerate(slots):
-        if _slot["user_id"] == user_id:
-            return slot_id
+    return _find_user_slot_id(slots, user_id)
 
-    return None
+
+async def _update_user_slot(
+    match_id: int,
+    user_id: int,
+    fields: slot.SlotFields,
+) -> tuple[int, list[slot.Slot]] | None:
+    """
+    Update the slot occupied by a user
+
+    :return: (slot id, resulting slots), or None if the user is not in the room
+    """
+    result = await slot.transition_slots(
+        match_id,
+        [{"where": {"user_id": user_id}, "first": True, "set": fields}],
+    )
+    if result is None or not result.changed_slot_ids[0]:
+        return None
+
+    return result.changed_slot_ids[0][0], result.slots
 
 
 async def userJoin(match_id: int, token_id: str) -> int | None:
@@ -746,95 +1025,87 @@ async def userJoin(match_id: int, token_id: str) -> int | None:
     :param user: user object of the user
     :return: The slot id if join success, None if fail (room is full)
     """
-    multiplayer_match = await get_match(match_id)
-    assert multiplayer_match is not None
-
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
+    match_with_slots = await get_match_with_slots(match_id)
+    assert match_with_slots is not None
+    multiplayer_match, slots = match_with_slots
 
     token = await osuToken.get_token(token_id)
     assert token is not None
 
-    # Make sure we're not in this match
-    for slot_id, _slot in enumerate(slots):
-        if _slot["user_token"] == token_id:
-            # Set bugged slot to free
-            await setSlot(
-                match_id,
-                slot_id,
-                status=slotStatuses.FREE,
-                team=0,
-                user_token=None,
-                mods=0,
-                user_id=-1,
-            )
+    while True:
+        # Find first free slot
+        # Allow mods+ to join into locked but empty slots.
+        slot_id = _find_free_slot_id(
+            slots,
+            can_use_locked_slots=osuToken.is_staff(token["privileges"]),
+        )
+        if slot_id is None:
+            return None
+
+        # Occupy slot
+        team = matchTeams.NO_TEAM
+        if multiplayer_match["match_team_type"] in (
+            matchTeamTypes.TEAM_VS,
+            matchTeamTypes.TAG_TEAM_VS,
+        ):
+            team = matchTeams.RED if slot_id % 2 == 0 else matchTeams.BLUE
+
+        result = await slot.transition_slots(
+            match_id,
+            [
+                # Make sure we're not in this match (set bugged slot to free)
+                {"where": {"user_token": token_id}, "set": slot.FREE_SLOT},
+                {
+                    "slot_id": slot_id,
+                    "where": {
+                        "status": slots[slot_id]["status"],
+                        "user_id": -1,
+                    },
+                    "required": True,
+                    "set": {
+                        "status": slotStatuses.NOT_READY,
+                        "team": team,
+                        "user_token": token_id,
+                        "mods": 0,
+                        "user_id": token["user_id"],
+                    },
+                },
+            ],
+        )
+        assert result is not None
+
+        if result.applied:
             break
 
-    # Find first free slot
+        # Someone else took the slot in the meantime
+        slots = result.slots
+
+    if osuToken.is_staff(token["privileges"]):
+        await add_referee(match_id, token["user_id"])
+
+    await insert_match_event(
+        match_id,
+        MatchEvents.MATCH_USER_JOIN,
+        user_id=token["user_id"],
+    )
+
+    # Send updated match data
+    await sendUpdates(match_id)
+    return slot_id
+
+
+def _find_free_slot_id(
+    slots: list[slot.Slot],
+    *,
+    can_use_locked_slots: bool,
+) -> int | None:
     for slot_id, _slot in enumerate(slots):
         if _slot["status"] == slotStatuses.FREE:
-            # Occupy slot
-            team = matchTeams.NO_TEAM
-            if (
-                multiplayer_match["match_team_type"] == matchTeamTypes.TEAM_VS
-                or multiplayer_match["match_team_type"] == matchTeamTypes.TAG_TEAM_VS
-            ):
-                team = matchTeams.RED if slot_id % 2 == 0 else matchTeams.BLUE
-
-            await setSlot(
-                match_id,
-                slot_id,
-                status=slotStatuses.NOT_READY,
-                team=team,
-                user_token=token_id,
-                mods=0,
-                user_id=token["user_id"],
-            )
-
-            if osuToken.is_staff(token["privileges"]):
-                await add_referee(match_id, token["user_id"])
-
-            await insert_match_event(
-                match_id,
-                MatchEvents.MATCH_USER_JOIN,
-                user_id=token["user_id"],
-            )
-
-            # Send updated match data
-            await sendUpdates(match_id)
             return slot_id
 
-    if osuToken.is_staff(
-        token["privileges"],
-    ):  # Allow mods+ to join into locked but empty slots.
+    if can_use_locked_slots:
         for slot_id, _slot in enumerate(slots):
             if _slot["status"] == slotStatuses.LOCKED and _slot["user_id"] == -1:
-                if multiplayer_match["match_team_type"] in (
-                    matchTeamTypes.TEAM_VS,
-                    matchTeamTypes.TAG_TEAM_VS,
-                ):
-                    team = matchTeams.RED if slot_id % 2 == 0 else matchTeams.BLUE
-                else:
-                    team = matchTeams.NO_TEAM
-
-                await setSlot(
-                    match_id,
-                    slot_id,
-                    status=slotStatuses.NOT_READY,
-                    team=team,
-                    user_token=token["token_id"],
-                    mods=0,
-                    user_id=token["user_id"],
-                )
-
-                await insert_match_event(
-                    match_id,
-                    MatchEvents.MATCH_USER_JOIN,
-                    user_id=token["user_id"],
-                )
-
-                # Send updated match data
-                await sendUpdates(match_id)
                 return slot_id
 
     return None
@@ -854,21 +1125,12 @@ async def userLeft(match_id: int, token_id: str, disposeMatch: bool = True) -> N
     token = await osuToken.get_token(token_id)
     assert token is not None
 
-    # Make sure the user is in room
-    slot_id = await getUserSlotID(match_id, token["user_id"])
-    if slot_id is None:
+    # Make sure the user is in room, and set their slot to free
+    result = await _update_user_slot(match_id, token["user_id"], slot.FREE_SLOT)
+    if result is None:
         return
 
-    # Set that slot to free
-    await setSlot(
-        match_id,
-        slot_id,
-        status=slotStatuses.FREE,
-        team=0,
-        user_token=None,
-        mods=0,
-        user_id=-1,
-    )
+    _, slots = result
 
     await osuToken.update_token(
         token_id,
@@ -884,7 +1146,7 @@ async def userLeft(match_id: int, token_id: str, disposeMatch: bool = True) -> N
 
     # Check if everyone left
     if (
-        await countUsers(match_id) == 0
+        sum(1 for _slot in slots if _slot["user_token"] is not None) == 0
         and disposeMatch
         and not multiplayer_match["is_tourney"]
     ):
@@ -898,9 +1160,6 @@ async def userLeft(match_id: int, token_id: str, disposeMatch: bool = True) -> N
         # log.info("MPROOM{}: Room disposed because all users left.".format(self.matchID))
         return
 
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
     # Check if host left
     if token["user_id"] == multiplayer_match["host_user_id"]:
         # Give host to someone else
@@ -928,56 +1187,49 @@ async def userChangeSlot(match_id: int, user_id: int, new_slot_id: int) -> bool:
     :return:
     """
 
-    multiplayer_match = await get_match(match_id)
-    assert multiplayer_match is not None
-
     slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
-    # Make sure the match is not locked
-    if multiplayer_match["is_locked"] or multiplayer_match["is_starting"]:
-        return False
 
     # Make sure the user is in room
-    old_slot_id = await getUserSlotID(match_id, user_id)
+    old_slot_id = _find_user_slot_id(slots, user_id)
     if old_slot_id is None:
         return False
 
-    # Make sure there is no one inside new slot
-    if (
-        slots[new_slot_id]["user_token"] is not None
-        or slots[new_slot_id]["status"] != slotStatuses.FREE
-    ):
-        return False
-
-    # Get old slot data
-    # TODO: do we need to deepcopy this after the stateless refactor?
-    old_data = deepcopy(slots[old_slot_id])
+    old_data = slots[old_slot_id]
 
-    # Free old slot
-    await setSlot(
+    result = await slot.transition_slots(
         match_id,
-        old_slot_id,
-        status=slotStatuses.FREE,
-        team=0,
-        user_token=None,
-        mods=0,
-        loaded=False,
-        skip=False,
-        complete=False,
-        user_id=-1,
-    )
-
-    # Occupy new slot
-    await setSlot(
-        match_id,
-        new_slot_id,
-        status=old_data["status"],
-        team=old_data["team"],
-        user_token=old_data["user_token"],
-        mods=old_data["mods"],
-        user_id=old_data["user_id"],
+        [
+            # Free old slot
+            {
+                "slot_id": old_slot_id,
+                "where": {"user_id": user_id},
+                "required": True,
+                "set": {
+                    **slot.FREE_SLOT,
+                    "loaded": False,
+                    "skip": False,
+                    "complete": False,
+                },
+            },
+            # Occupy new slot, if there is no one inside
+            {
+                "slot_id": new_slot_id,
+                "where": {"user_token": None, "status": slotStatuses.FREE},
+                "required": True,
+                "set": {
+                    "status": old_data["status"],
+                    "team": old_data["team"],
+                    "user_token": old_data["user_token"],
+                    "mods": old_data["mods"],
+                    "user_id": old_data["user_id"],
+                },
+            },
+        ],
+        # Make sure the match is not locked
+        match_where={"is_locked": False, "is_starting": False},
     )
+    if result is None or not result.applied:
+        return False
 
     # Send updated match data
     await sendUpdates(match_id)
@@ -1033,18 +1285,15 @@ async def userHasBeatmap(match_id: int, user_id: int, has_beatmap: bool = True)
     :param has: True if has beatmap, false if not
     :return:
     """
-    # Make sure the user is in room
-    slot_id = await getUserSlotID(match_id, user_id)
-    if slot_id is None:
-        return
-
     # Set slot
     if has_beatmap:
         new_status = slotStatuses.NOT_READY
     else:
         new_status = slotStatuses.NO_MAP
 
-    await setSlot(match_id, slot_id, new_status)
+    # Make sure the user is in room
+    if await _update_user_slot(match_id, user_id, {"status": new_status}) is None:
+        return
 
     # Send updates
     await sendUpdates(match_id)
@@ -1061,10 +1310,7 @@ async def transferHost(match_id: int, slot_id: int) -> None:
     assert _slot is not None
 
     # Make sure there is someone in that slot
-    if (
-        not _slot["user_token"]
-        or _slot["user_token"] not in await osuToken.get_token_ids()
-    ):
+    if not _slot["user_token"] or not await osuToken.token_exists(_slot["user_token"]):
         return
 
     # Transfer host
@@ -1079,14 +1325,11 @@ async def playerFailed(match_id: int, user_id: int) -> None:
     :return:
     """
     # Make sure the user is in room
-    slot_id = await getUserSlotID(match_id, user_id)
-    if slot_id is None:
+    result = await _update_user_slot(match_id, user_id, {"passed": False})
+    if result is None:
         return
 
-    _slot = await slot.get_slot(match_id, slot_id)
-    assert _slot is not None
-
-    _slot = await slot.update_slot(match_id, slot_id, passed=False)
+    slot_id, _ = result
 
     # Send packet to all players
     playing_stream_name = create_playing_stream_name(match_id)
@@ -1162,26 +1405,34 @@ async def changeTeam(
     ):
         return
 
-    # Make sure the match is not locked
-    if multiplayer_match["is_locked"] or multiplayer_match["is_starting"]:
-        return
+    # Update slot and send update
+    transitions: list[slot.SlotTransition]
+    if new_team is None:
+        transitions = [
+            {
+                "where": {"user_id": user_id, "team": matchTeams.RED},
+                "set": {"team": matchTeams.BLUE},
+            },
+            {
+                "where": {"user_id": user_id},
+                "where_not": {"team": matchTeams.RED},
+                "set": {"team": matchTeams.RED},
+            },
+        ]
+    else:
+        transitions = [{"where": {"user_id": user_id}, "set": {"team": new_team}}]
+
+    result = await slot.transition_slots(
+        match_id,
+        transitions,
+        # Make sure the match is not locked
+        match_where={"is_locked": False, "is_starting": False},
+    )
 
     # Make sure the user is in room
-    slot_id = await getUserSlotID(match_id, user_id)
-    if slot_id is None:
+    if result is None or not any(result.changed_slot_ids):
         return
 
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
-    # Update slot and send update
-    if new_team is None:
-        if slots[slot_id]["team"] == matchTeams.RED:
-            new_team = matchTeams.BLUE
-        else:
-            new_team = matchTeams.RED
-
-    await setSlot(match_id, slot_id, status=None, team=new_team)
     await sendUpdates(match_id)
 
 
@@ -1191,14 +1442,24 @@ async def sendUpdates(match_id: int) -> None:
 
     :return:
     """
-    uncensored_data = await serverPackets.updateMatch(match_id)
-    if uncensored_data is not None:
+    match_packet_data = await get_match_packet_data(match_id)
+    if match_packet_data is not None:
         stream_name = create_stream_name(match_id)
-        await stream_messages.broadcast_data(stream_name, uncensored_data)
-
-    censored_data = await serverPackets.updateMatch(match_id, censored=True)
-    if censored_data is not None:
-        await stream_messages.broadcast_data("lobby", censored_data)
+        await stream_messages.broadcast_data(
+            stream_name,
+            packetHelper.build_packet_from_body(
+                packetIDs.server_updateMatch,
+                match_packet_data.uncensored,
+            ),
+        )
+        await stream_messages.broadcast_data(
+            "lobby",
+            packetHelper.build_packet_from_body(
+                packetIDs.server_updateMatch,
+                match_packet_data.censored,
+            ),
+        )
+        await update_lobby_snapshot(match_id, match_packet_data)
     else:
         logger.error(
             f"Failed to send updates to a multiplayer match",
@@ -1213,9 +1474,14 @@ async def checkTeams(match_id: int) -> bool:
     :return: True if valid, False if invalid
     :return:
     """
-    multiplayer_match = await get_match(match_id)
-    assert multiplayer_match is not None
+    match_with_slots = await get_match_with_slots(match_id)
+    assert match_with_slots is not None
+    multiplayer_match, slots = match_with_slots
+
+    return _check_teams(multiplayer_match, slots)
+
 
+def _check_teams(multiplayer_match: Match, slots: list[slot.Slot]) -> bool:
     if (
         multiplayer_match["match_team_type"] != matchTeamTypes.TEAM_VS
         and multiplayer_match["match_team_type"] != matchTeamTypes.TAG_TEAM_VS
@@ -1226,9 +1492,6 @@ async def checkTeams(match_id: int) -> bool:
     # We have teams, check if they are valid
     firstTeam = -1
 
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
     for _slot in slots:
         if _slot["user_token"] and (_slot["status"] & slotStatuses.NO_MAP) == 0:
             if firstTeam == -1:
@@ -1238,7 +1501,7 @@ async def checkTeams(match_id: int) -> bool:
 
     logger.warning(
         "Invalid teams detected for multiplayer match",
-        extra={"match_id": match_id},
+        extra={"match_id": multiplayer_match["match_id"]},
     )
     return False
 
@@ -1249,38 +1512,52 @@ async def start(match_id: int) -> bool:
 
     :return:
     """
-    multiplayer_match = await get_match(match_id)
-    assert multiplayer_match is not None
+    match_with_slots = await get_match_with_slots(match_id)
+    assert match_with_slots is not None
+    multiplayer_match, slots = match_with_slots
 
     # Make sure we have enough players
-    if not await checkTeams(match_id):
+    if not _check_teams(multiplayer_match, slots):
         return False
 
     # Create playing channel
     playing_stream_name = create_playing_stream_name(match_id)
     await streamList.add(playing_stream_name)
 
-    # Set playing to ready players and set load, skip and complete to False
-    # Make clients join playing stream
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
-    for slot_id, _slot in enumerate(slots):
-        if _slot["user_token"] is None:
-            continue
+    # Clear scores left over from an aborted game
+    await glob.redis.delete(make_live_scores_key(match_id))
 
-        user_token = await osuToken.get_token(_slot["user_token"])
-        if user_token is not None:
-            await slot.update_slot(
-                match_id,
-                slot_id,
-                status=slotStatuses.PLAYING,
-                loaded=False,
-                skip=False,
-                complete=False,
-            )
+    # Set playing to ready players and set load, skip and complete to False
+    existing_token_ids = await osuToken.get_existing_token_ids(
+        [_slot["user_token"] for _slot in slots if _slot["user_token"] is not None],
+    )
+    result = await slot.transition_slots(
+        match_id,
+        [
+            {
+                "slot_id": slot_id,
+                "where": {"user_token": _slot["user_token"]},
+                "set": {
+                    "status": slotStatuses.PLAYING,
+                    "loaded": False,
+                    "skip": False,
+                    "complete": False,
+                    "score": 0,
+                    "failed": False,
+                },
+            }
+            for slot_id, _slot in enumerate(slots)
+            if _slot["user_token"] in existing_token_ids
+        ],
+    )
+    assert result is not None
 
-            await osuToken.joinStream(user_token["token_id"], playing_stream_name)
+    # Make clients join playing stream
+    for slot_ids in result.changed_slot_ids:
+        for slot_id in slot_ids:
+            user_token_id = result.slots[slot_id]["user_token"]
+            assert user_token_id is not None
+            await osuToken.joinStream(user_token_id, playing_stream_name)
 
     # Send match start packet
     await stream_messages.broadcast_data(
@@ -1296,13 +1573,13 @@ async def start(match_id: int) -> bool:
         multiplayer_match["match_scoring_type"],
         multiplayer_match["match_team_type"],
     )
-    multiplayer_match = await update_match(
+    updated_match = await update_match(
         match_id,
         current_game_id=game_id,
         is_in_progress=True,
         is_starting=False,
     )
-    assert multiplayer_match is not None
+    assert updated_match is not None
 
     # Send updates
     await sendUpdates(match_id)
@@ -1341,6 +1618,7 @@ async def abort(match_id: int) -> None:
     assert multiplayer_match is not None
 
     await resetSlots(match_id)
+    await glob.redis.delete(make_live_scores_key(match_id))
     await sendUpdates(match_id)
 
     playing_stream_name = create_playing_stream_name(match_id)
@@ -1352,40 +1630,45 @@ async def initializeTeams(match_id: int) -> None:
     multiplayer_match = await get_match(match_id)
     assert multiplayer_match is not None
 
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
     if multiplayer_match["match_team_type"] in {
         matchTeamTypes.TEAM_VS,
         matchTeamTypes.TAG_TEAM_VS,
     }:
         # Set teams
-        for slot_id in range(len(slots)):
-            new_team = matchTeams.RED if slot_id % 2 == 0 else matchTeams.BLUE
-            await slot.update_slot(match_id, slot_id, team=new_team)
+        await slot.transition_slots(
+            match_id,
+            [
+                {
+                    "slot_id": slot_id,
+                    "set": {
+                        "team": matchTeams.RED if slot_id % 2 == 0 else matchTeams.BLUE,
+                    },
+                }
+                for slot_id in range(slot.SLOT_COUNT)
+            ],
+        )
     else:
         # Reset teams
-        for slot_id in range(len(slots)):
-            new_team = matchTeams.NO_TEAM
-            await slot.update_slot(match_id, slot_id, team=new_team)
+        await slot.transition_slots(
+            match_id,
+            [{"set": {"team": matchTeams.NO_TEAM}}],
+        )
 
 
 async def resetMods(match_id: int) -> None:
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
-    for slot_id in range(len(slots)):
-        await slot.update_slot(match_id, slot_id, mods=0)
+    await slot.transition_slots(match_id, [{"set": {"mods": 0}}])
 
 
 async def resetReady(match_id: int) -> None:
-    slots = await slot.get_slots(match_id)
-    assert len(slots) == 16
-
-    for slot_id, _slot in enumerate(slots):
-        if _slot["status"] == slotStatuses.READY:
-            new_status = slotStatuses.NOT_READY
-            await slot.update_slot(match_id, slot_id, status=new_status)
+    await slot.transition_slots(
+        match_id,
+        [
+            {
+                "where": {"status": slotStatuses.READY},
+                "set": {"status": slotStatuses.NOT_READY},
+            },
+        ],
+    )
 
 
 async def sendReadyStatus(match_id: int) -> None:
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import NamedTuple
+from typing import TypedDict
+
+
+class MatchPacketData(NamedTuple):
+    """Encoded match data, as sent in the match packets"""
+
+    version: int  # of the match it was encoded from
+    uncensored: bytes
+    censored: bytes  # with the password redacted, for the lobby
+
+
+class MatchPacketCacheStats(TypedDict):
+    entries: int
+    max_entries: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class MatchPacketCache:
+    """\
+    A bounded LRU cache of encoded match data, per match.
+
+    Entries are tagged with the match's version, which is bumped on every
+    change to the match, so a match only ever needs to be encoded once per
+    change rather than once per packet sent.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[int, MatchPacketData] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, match_id: int, version: int) -> MatchPacketData | None:
+        """
+        Get a match's encoded data at `version`
+
+        :return: encoded match data, or None if it's not cached
+        """
+        packet_data = self._entries.get(match_id)
+        if packet_data is None or packet_data.version != version:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(match_id)
+        self.hits += 1
+        return packet_data
+
+    def set(self, match_id: int, packet_data: MatchPacketData) -> None:
+        cached_packet_data = self._entries.get(match_id)
+        if (
+            cached_packet_data is not None
+            and cached_packet_data.version > packet_data.version
+        ):
+            # A newer version was cached in the meantime
+            return
+
+        self._entries[match_id] = packet_data
+        self._entries.move_to_end(match_id)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, match_id: int) -> None:
+        self._entries.pop(match_id, None)
+
+    def get_stats(self) -> MatchPacketCacheStats:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
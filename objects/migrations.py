@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable
+from collections.abc import Callable
+
+from common.log import logger
+from objects import glob
+
+# (string) bancho:migrations:{name}: "running" while a process runs it, then "done"
+
+# A process which dies while running a migration releases it after this
+MIGRATION_CLAIM_EXPIRY = 5 * 60  # in seconds
+
+# How often processes waiting for another's migration check whether it's done
+MIGRATION_POLL_INTERVAL = 1.0  # in seconds
+
+
+def make_key(name: str) -> str:
+    return f"bancho:migrations:{name}"
+
+
+async def run_once(name: str, migrate: Callable[[], Awaitable[None]]) -> None:
+    """
+    Run a data migration, unless it has already been run by any process.
+
+    If another process is running it, wait for it to finish, so that the
+    caller never carries on with half-migrated data.
+
+    :param name: unique name of the migration
+    :param migrate: the migration; it should be safe to run again in full,
+                    in case a process dies while running it
+    """
+    waiting = False
+    while True:
+        claimed = await glob.redis.set(
+            make_key(name),
+            "running",
+            nx=True,
+            ex=MIGRATION_CLAIM_EXPIRY,
+        )
+        if claimed:
+            break
+
+        # Claimed by another process; if it gives up (or dies), the claim
+        # is released and this process takes over
+        status = await glob.redis.get(make_key(name))
+        if status == b"done":
+            return
+
+        if not waiting:
+            logger.info(
+                "Waiting for another process' data migration",
+                extra={"migration": name},
+            )
+            waiting = True
+        await asyncio.sleep(MIGRATION_POLL_INTERVAL)
+
+    try:
+        await migrate()
+    except BaseException:
+        await glob.redis.delete(make_key(name))
+        raise
+
+    await glob.redis.set(make_key(name), "done")
+    logger.info("Completed data migration", extra={"migration": name})
@@ -1,11 +1,20 @@
 from __future__ import annotations
 
 import logging
+from collections.abc import AsyncIterator
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Mapping
+from collections.abc import Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
 from time import localtime
 from time import strftime
 from time import time
+from typing import Any
 from typing import TypedDict
 from typing import cast
+from typing import overload
 from uuid import uuid4
 
 import orjson
@@ -25,11 +34,17 @@ from helpers import chatHelper as chat
 from objects import channelList
 from objects import glob
 from objects import match
+from objects import stream
 from objects import stream_messages
 from objects import streamList
+from objects.redisScript import redisScript
 
 # (set) bancho:tokens
-# (json obj) bancho:tokens:{token_id}
+# (set[userid]) bancho:tokens:online_user_ids
+# (set[userid]) bancho:tokens:non_restricted_user_ids
+# (set) bancho:tokens:by_user_id:{user_id}
+# (zset[token_id, ping_time]) bancho:tokens:ping_times
+# (hash[field, json value]) bancho:tokens:{token_id}
 # (set) bancho:tokens:{token_id}:streams
 # (set) bancho:tokens:{token_id}:channels
 # (set[userid]) bancho:tokens:{token_id}:spectators
@@ -55,6 +70,7 @@ class Token(TypedDict):
     # restricted: bool
     kicked: bool
     login_time: float
+    # NOTE: pings only update PING_TIMES_KEY, use get_ping_time for the latest
     ping_time: float
     utc_offset: int
     # streams: list[stream.Stream]
@@ -79,7 +95,6 @@ class Token(TypedDict):
     last_np: LastNp | None
     silence_end_time: int
     protocol_version: int
-    spam_rate: int
 
     # stats
     action_id: int
@@ -115,10 +130,146 @@ def safeUsername(username: str) -> str:
 # CRUD
 
 
+TOKENS_KEY = "bancho:tokens"
+
+# legacy layout, where each token was a json object in a single hash
+LEGACY_TOKENS_KEY = "bancho:tokens:json"
+MIGRATION_BATCH_SIZE = 1000
+
+
+# presence indexes, maintained by create_token, update_token and delete_token
+ONLINE_USER_IDS_KEY = "bancho:tokens:online_user_ids"
+NON_RESTRICTED_USER_IDS_KEY = "bancho:tokens:non_restricted_user_ids"
+
+# latest ping time of each token, so inactive tokens can be found by score
+PING_TIMES_KEY = "bancho:tokens:ping_times"
+
+
 def make_key(token_id: str) -> str:
     return f"bancho:tokens:{token_id}"
 
 
+def make_user_token_ids_key(user_id: int) -> str:
+    return f"bancho:tokens:by_user_id:{user_id}"
+
+
+# Tokens are stored as a redis hash with one json-encoded value per field,
+# so that updates only need to write (and reads only need to fetch) the
+# fields they're interested in.
+
+
+def _serialize_fields(fields: Mapping[str, object]) -> dict[str, bytes]:
+    return {field: orjson.dumps(value) for field, value in fields.items()}
+
+
+def _deserialize_token(raw_token: dict[bytes, bytes]) -> Token:
+    return cast(
+        Token,
+        {field.decode(): orjson.loads(value) for field, value in raw_token.items()},
+    )
+
+
+# Request-scoped identity map of tokens, so that handling a single request
+# doesn't fetch the same token from redis over and over. Entries are updated
+# by writes made through this module during the request; writes made by
+# other requests are seen on the next request.
+
+
+class _TokenCache:
+    __slots__ = ("tokens", "closed")
+
+    def __init__(self) -> None:
+        self.tokens: dict[str, Token | None] = {}
+        self.closed = False
+
+
+_TOKEN_CACHE: ContextVar[_TokenCache | None] = ContextVar(
+    "_TOKEN_CACHE",
+    default=None,
+)
+
+
+@contextmanager
+def request_token_cache() -> Iterator[None]:
+    """Cache tokens read or written within this context (i.e. a request)"""
+    token_cache = _TokenCache()
+    reset_token = _TOKEN_CACHE.set(token_cache)
+    try:
+        yield
+    finally:
+        # Tasks spawned during the request inherit the context,
+        # make sure they don't keep reading from the cache
+        token_cache.closed = True
+        token_cache.tokens.clear()
+        _TOKEN_CACHE.reset(reset_token)
+
+
+@contextmanager
+def bypass_token_cache() -> Iterator[None]:
+    """Read & write tokens straight from/to redis within this context,
+    e.g. to see changes made by other requests during this one"""
+    reset_token = _TOKEN_CACHE.set(None)
+    try:
+        yield
+    finally:
+        _TOKEN_CACHE.reset(reset_token)
+
+
+def _get_token_cache() -> dict[str, Token | None] | None:
+    token_cache = _TOKEN_CACHE.get()
+    if token_cache is None or token_cache.closed:
+        return None
+    return token_cache.tokens
+
+
+def _copy_token(token: Token) -> Token:
+    # Callers are free to mutate the tokens they're given
+    token_copy = token.copy()
+    if token["last_np"] is not None:
+        token_copy["last_np"] = token["last_np"].copy()
+    return token_copy
+
+
+# Only write fields if the token still exists, so that an update racing with
+# a logout can't resurrect a partial token. Optionally returns the whole token.
+# When the privileges change, the user is added to (ARGV[2] == "1") or removed
+# from (ARGV[2] == "0") the non-restricted users index in the same step, so
+# a logout can't leave them behind in it either.
+# KEYS: token, non-restricted user ids
+# ARGV: whether to return the token, index change, then field/value pairs
+UPDATE_TOKEN_SCRIPT = redisScript(
+    """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return false
+end
+redis.call("HSET", KEYS[1], unpack(ARGV, 3))
+if ARGV[2] ~= "" then
+    local user_id = redis.call("HGET", KEYS[1], "user_id")
+    if ARGV[2] == "1" then
+        redis.call("SADD", KEYS[2], user_id)
+    else
+        redis.call("SREM", KEYS[2], user_id)
+    end
+end
+if ARGV[1] == "1" then
+    return redis.call("HGETALL", KEYS[1])
+end
+return {}
+""",
+)
+
+# A user stays online until their last token is deleted
+REMOVE_TOKEN_FROM_INDEXES_SCRIPT = redisScript(
+    """
+redis.call("SREM", KEYS[1], ARGV[1])
+if redis.call("SCARD", KEYS[1]) == 0 then
+    redis.call("SREM", KEYS[2], ARGV[2])
+    redis.call("SREM", KEYS[3], ARGV[2])
+end
+""",
+)
+
+
 async def create_token(
     *,
     user_id: int,
@@ -158,7 +309,6 @@ async def create_token(
         "last_np": None,
         "silence_end_time": 0,
         "protocol_version": 0,
-        "spam_rate": 0,
         "action_id": actions.IDLE,
         "action_text": "",
         "action_md5": "",
@@ -179,7 +329,13 @@ async def create_token(
     safe_name = safeUsername(username)
 
     async with glob.redis.pipeline() as pipe:
-        await pipe.hset("bancho:tokens:json", token_id, orjson.dumps(token))
+        await pipe.hset(make_key(token_id), mapping=_serialize_fields(token))
+        await pipe.sadd(TOKENS_KEY, token_id)
+        await pipe.zadd(PING_TIMES_KEY, {token_id: creation_time})
+        await pipe.sadd(make_user_token_ids_key(user_id), token_id)
+        await pipe.sadd(ONLINE_USER_IDS_KEY, user_id)
+        if not is_restricted(privileges):
+            await pipe.sadd(NON_RESTRICTED_USER_IDS_KEY, user_id)
         await pipe.set(f"bancho:tokens:ids:{user_id}", token_id)
         await pipe.set(f"bancho:tokens:names:{safe_name}", token_id)
         await pipe.hset(
@@ -189,31 +345,151 @@ async def create_token(
         )
         await pipe.execute()
 
+    token_cache = _get_token_cache()
+    if token_cache is not None:
+        token_cache[token_id] = _copy_token(token)
+
     return token
 
 
 async def get_token_ids() -> set[str]:
-    raw_token_ids: list[bytes] = await glob.redis.hkeys("bancho:tokens:json")
+    raw_token_ids: set[bytes] = await glob.redis.smembers(TOKENS_KEY)
     return {token_id.decode() for token_id in raw_token_ids}
 
 
+async def token_exists(token_id: str) -> bool:
+    return bool(await glob.redis.sismember(TOKENS_KEY, token_id))
+
+
+async def get_existing_token_ids(token_ids: Sequence[str]) -> set[str]:
+    """Filter some token ids down to those of tokens which exist"""
+    if not token_ids:
+        return set()
+
+    exists = await glob.redis.smismember(TOKENS_KEY, token_ids)  # type: ignore[arg-type]
+    return {token_id for token_id, exist in zip(token_ids, exists) if exist}
+
+
 async def get_online_players_count() -> int:
-    return await glob.redis.hlen("bancho:tokens:json")
+    return await glob.redis.scard(TOKENS_KEY)
 
 
 async def get_token(token_id: str) -> Token | None:
-    token = await glob.redis.hget("bancho:tokens:json", token_id)
-    if token is None:
+    token_cache = _get_token_cache()
+    if token_cache is not None and token_id in token_cache:
+        cached_token = token_cache[token_id]
+        return _copy_token(cached_token) if cached_token is not None else None
+
+    raw_token: dict[bytes, bytes] = await glob.redis.hgetall(make_key(token_id))
+    token = _deserialize_token(raw_token) if raw_token else None
+
+    if token_cache is not None:
+        token_cache[token_id] = token
+        if token is not None:
+            return _copy_token(token)
+
+    return token
+
+
+async def get_token_fields(token_id: str, *fields: str) -> dict[str, Any] | None:
+    """
+    Fetch only some fields of a token
+
+    :param token_id: token id
+    :param fields: names of the token fields to fetch
+    :return: {field: value} or None if the token does not exist
+    """
+    token_cache = _get_token_cache()
+    if token_cache is not None and token_id in token_cache:
+        cached_token = token_cache[token_id]
+        if cached_token is None:
+            return None
+        return {
+            field: cached_token[field]  # type: ignore[literal-required]
+            for field in fields
+        }
+
+    raw_values: list[bytes | None] = await glob.redis.hmget(
+        make_key(token_id),
+        fields,
+    )
+    if any(raw_value is None for raw_value in raw_values):
         return None
-    return cast(Token, orjson.loads(token))
+    return {
+        field: orjson.loads(raw_value)
+        for field, raw_value in zip(fields, raw_values)
+        if raw_value is not None
+    }
+
+
+@overload
+def iter_tokens(
+    *,
+    batch_size: int = ...,
+    fields: None = ...,
+) -> AsyncIterator[Token]: ...
+
+
+@overload
+def iter_tokens(
+    *,
+    batch_size: int = ...,
+    fields: Sequence[str],
+) -> AsyncIterator[dict[str, Any]]: ...
+
+
+async def iter_tokens(
+    *,
+    batch_size: int = 100,
+    fields: Sequence[str] | None = None,
+) -> AsyncIterator[Token] | AsyncIterator[dict[str, Any]]:
+    """
+    Iterate over all tokens, fetching them from redis in batches
+
+    Tokens created or deleted while iterating may or may not be yielded,
+    and a token may be yielded more than once (as SSCAN may return an
+    element more than once); callers must tolerate duplicates, rather than
+    this keeping track of every token id seen.
+
+    :param batch_size: approximate number of tokens to fetch per round trip
+    :param fields: if set, only these fields are fetched and decoded
+    :return: tokens, or {field: value} projections of them
+    """
+    cursor = 0
+
+    while True:
+        cursor, token_ids = await glob.redis.sscan(
+            TOKENS_KEY,
+            cursor,
+            count=batch_size,
+        )
+
+        if token_ids:
+            async with glob.redis.pipeline() as pipe:
+                for token_id in token_ids:
+                    if fields is None:
+                        await pipe.hgetall(make_key(token_id.decode()))
+                    else:
+                        await pipe.hmget(make_key(token_id.decode()), fields)
+                results = await pipe.execute()
+
+            for result in results:
+                if fields is None:
+                    if result:
+                        yield _deserialize_token(result)
+                elif not any(raw_value is None for raw_value in result):
+                    yield {
+                        field: orjson.loads(raw_value)
+                        for field, raw_value in zip(fields, result)
+                    }
+
+        if cursor == 0:
+            break
 
 
 async def get_tokens() -> list[Token]:
-    # TODO: use an iterative approach for these, provide a generator api
-    # to allow callers to reduce memory usage and improve performance.
-    # (If callers really want all the data, they can exhaust the iterator)
-    raw_tokens = (await glob.redis.hgetall("bancho:tokens:json")).values()
-    return cast(list[Token], [orjson.loads(token) for token in raw_tokens])
+    tokens = {token["token_id"]: token async for token in iter_tokens()}
+    return list(tokens.values())
 
 
 # TODO: get_limited_tokens with a more basic model
@@ -245,13 +521,38 @@ async def get_token_by_username(username: str) -> Token | None:
     return None
 
 
+async def get_online_user_ids() -> set[int]:
+    raw_user_ids: set[bytes] = await glob.redis.smembers(ONLINE_USER_IDS_KEY)
+    return {int(user_id) for user_id in raw_user_ids}
+
+
+async def get_non_restricted_user_ids() -> set[int]:
+    raw_user_ids: set[bytes] = await glob.redis.smembers(NON_RESTRICTED_USER_IDS_KEY)
+    return {int(user_id) for user_id in raw_user_ids}
+
+
+async def get_token_ids_by_user_id(user_id: int) -> set[str]:
+    raw_token_ids: set[bytes] = await glob.redis.smembers(
+        make_user_token_ids_key(user_id),
+    )
+    return {token_id.decode() for token_id in raw_token_ids}
+
+
 async def get_all_tokens_by_user_id(user_id: int) -> list[Token]:
-    tokens = await get_tokens()
-    return [token for token in tokens if token["user_id"] == user_id]
+    tokens: list[Token] = []
+    for token_id in await get_token_ids_by_user_id(user_id):
+        token = await get_token(token_id)
+        if token is not None:
+            tokens.append(token)
+    return tokens
 
 
 async def get_all_tokens_by_username(username: str) -> list[Token]:
-    tokens = await get_tokens()
+    token = await get_token_by_username(username)
+    if token is None:
+        return []
+
+    tokens = await get_all_tokens_by_user_id(token["user_id"])
     return [token for token in tokens if token["username"] == username]
 
 
@@ -281,7 +582,6 @@ async def update_token(
     last_np: LastNp | None | Unset = UNSET,
     silence_end_time: int | None = None,
     protocol_version: int | None = None,
-    spam_rate: int | None = None,
     action_id: int | None = None,
     action_text: str | None = None,
     action_md5: str | None = None,
@@ -298,9 +598,7 @@ async def update_token(
     pp: int | None = None,
     amplitude_device_id: str | None = None,
 ) -> Token | None:
-    token = await get_token(token_id)
-    if token is None:
-        return None
+    token: dict[str, object] = {}
 
     if username is not None:
         token["username"] = username
@@ -338,8 +636,6 @@ async def update_token(
         token["silence_end_time"] = silence_end_time
     if protocol_version is not None:
         token["protocol_version"] = protocol_version
-    if spam_rate is not None:
-        token["spam_rate"] = spam_rate
     if action_id is not None:
         token["action_id"] = action_id
     if action_text is not None:
@@ -371,11 +667,215 @@ async def update_token(
     if amplitude_device_id is not None:
         token["amplitude_device_id"] = amplitude_device_id
 
-    async with glob.redis.pipeline() as pipe:
-        await pipe.hset("bancho:tokens:json", token_id, orjson.dumps(token))
-        await pipe.execute()
+    if not token:
+        return await get_token(token_id)
 
-    return token
+    raw_token = await _write_token_fields(token_id, token, fetch_token=True)
+    if raw_token is None:
+        return None
+
+    updated_token = _deserialize_token(raw_token)
+
+    if ping_time is not None:
+        await glob.redis.zadd(PING_TIMES_KEY, {token_id: ping_time}, xx=True)
+
+    token_cache = _get_token_cache()
+    if token_cache is not None:
+        token_cache[token_id] = updated_token
+        return _copy_token(updated_token)
+
+    return updated_token
+
+
+async def _write_token_fields(
+    token_id: str,
+    fields: Mapping[str, object],
+    *,
+    fetch_token: bool,
+) -> dict[bytes, bytes] | None:
+    """
+    Write `fields` to an existing token, keeping the presence indexes
+    in line with its privileges
+
+    :return: the raw token if `fetch_token` is True (otherwise an empty dict),
+             or None if the token does not exist
+    """
+    privileges = fields.get("privileges")
+    index_change = ""
+    if isinstance(privileges, int):
+        index_change = "0" if is_restricted(privileges) else "1"
+
+    args: list[str | bytes] = ["1" if fetch_token else "0", index_change]
+    for field, value in _serialize_fields(fields).items():
+        args += [field, value]
+
+    raw_token: list[bytes] | None = await UPDATE_TOKEN_SCRIPT(
+        keys=[make_key(token_id), NON_RESTRICTED_USER_IDS_KEY],
+        args=args,
+    )
+    token_cache = _get_token_cache()
+    if raw_token is None:
+        if token_cache is not None:
+            token_cache[token_id] = None
+        return None
+
+    if not fetch_token and token_cache is not None:
+        cached_token = token_cache.get(token_id)
+        if cached_token is not None:
+            cached_token.update(fields)  # type: ignore[typeddict-item]
+
+    return dict(zip(raw_token[::2], raw_token[1::2]))
+
+
+async def migrate_legacy_tokens() -> None:
+    """
+    Move tokens stored with the legacy layout (a json object per token,
+    in the `bancho:tokens:json` hash) over to per-token field hashes, and
+    add them to the presence & ping time indexes.
+
+    Tokens are moved in batches, each removed from the legacy hash as it's
+    moved, so the migration can be resumed if interrupted. It's cheap when
+    there's nothing to move, so it's also rerun periodically, to pick up
+    tokens which processes still on the legacy layout create during a
+    rolling deploy.
+    """
+    migrated_tokens = 0
+    cursor = 0
+    while True:
+        raw_tokens: dict[bytes, bytes]
+        cursor, raw_tokens = await glob.redis.hscan(
+            LEGACY_TOKENS_KEY,
+            cursor,
+            count=MIGRATION_BATCH_SIZE,
+        )
+
+        if raw_tokens:
+            async with glob.redis.pipeline() as pipe:
+                for raw_token_id, raw_token in raw_tokens.items():
+                    token_id = raw_token_id.decode()
+                    token = orjson.loads(raw_token)
+                    await pipe.hset(
+                        make_key(token_id),
+                        mapping=_serialize_fields(token),
+                    )
+                    await pipe.sadd(TOKENS_KEY, token_id)
+                    await pipe.zadd(PING_TIMES_KEY, {token_id: token["ping_time"]})
+                    await pipe.sadd(
+                        make_user_token_ids_key(token["user_id"]),
+                        token_id,
+                    )
+                    await pipe.sadd(ONLINE_USER_IDS_KEY, token["user_id"])
+                    if not is_restricted(token["privileges"]):
+                        await pipe.sadd(NON_RESTRICTED_USER_IDS_KEY, token["user_id"])
+                await pipe.hdel(LEGACY_TOKENS_KEY, *raw_tokens)
+                await pipe.execute()
+
+            migrated_tokens += len(raw_tokens)
+
+        if cursor == 0:
+            break
+
+    if migrated_tokens:
+        logger.info(
+            "Migrated tokens to the field-level storage layout",
+            extra={"token_count": migrated_tokens},
+        )
+
+
+async def backfill_presence_indexes() -> None:
+    """Add tokens created before the presence indexes existed to them"""
+    tokens = iter_tokens(
+        batch_size=MIGRATION_BATCH_SIZE,
+        fields=("token_id", "user_id", "privileges"),
+    )
+    async for batch in _iter_batches(tokens, MIGRATION_BATCH_SIZE):
+        async with glob.redis.pipeline() as pipe:
+            for token in batch:
+                await pipe.sadd(
+                    make_user_token_ids_key(token["user_id"]),
+                    token["token_id"],
+                )
+                await pipe.sadd(ONLINE_USER_IDS_KEY, token["user_id"])
+                if not is_restricted(token["privileges"]):
+                    await pipe.sadd(NON_RESTRICTED_USER_IDS_KEY, token["user_id"])
+            await pipe.execute()
+
+
+async def backfill_ping_times() -> None:
+    """Add tokens created before the ping time index existed to it"""
+    tokens = iter_tokens(
+        batch_size=MIGRATION_BATCH_SIZE,
+        fields=("token_id", "ping_time"),
+    )
+    async for batch in _iter_batches(tokens, MIGRATION_BATCH_SIZE):
+        await glob.redis.zadd(
+            PING_TIMES_KEY,
+            {token["token_id"]: token["ping_time"] for token in batch},
+            nx=True,
+        )
+
+
+async def _iter_batches(
+    tokens: AsyncIterator[dict[str, Any]],
+    batch_size: int,
+) -> AsyncIterator[list[dict[str, Any]]]:
+    batch: list[dict[str, Any]] = []
+    async for token in tokens:
+        batch.append(token)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+# Moves tokens' offsets in a stream's unsharded physical stream over to its
+# shards, for those tokens which have one.
+# KEYS: stream offsets of tokens
+# ARGV: unsharded stream key, then (shard stream key, offset) pairs
+# Returns the number of tokens whose offsets were moved.
+RESHARD_STREAM_OFFSETS_SCRIPT = redisScript(
+    """
+local resharded = 0
+for _, stream_offsets_key in ipairs(KEYS) do
+    if redis.call("HDEL", stream_offsets_key, ARGV[1]) == 1 then
+        redis.call("HSET", stream_offsets_key, unpack(ARGV, 2))
+        resharded = resharded + 1
+    end
+end
+return resharded
+""",
+)
+
+
+async def reshard_stream_offsets(stream_name: str) -> None:
+    """
+    Move tokens reading a stream from its unsharded physical stream over
+    to its shards (i.e. after the stream became sharded)
+    """
+    unsharded_stream_key = stream_messages.make_key(stream_name)
+    stream_offsets = await stream_messages.get_latest_message_ids(stream_name)
+    if unsharded_stream_key in stream_offsets:
+        return
+
+    args = [unsharded_stream_key]
+    for stream_key, offset in stream_offsets.items():
+        args += [stream_key, offset]
+
+    resharded_tokens = 0
+    tokens = iter_tokens(batch_size=MIGRATION_BATCH_SIZE, fields=("token_id",))
+    async for batch in _iter_batches(tokens, MIGRATION_BATCH_SIZE):
+        resharded_tokens += await RESHARD_STREAM_OFFSETS_SCRIPT(
+            keys=[f"{make_key(token['token_id'])}:stream_offsets" for token in batch],
+            args=args,
+        )
+
+    if resharded_tokens:
+        logger.info(
+            "Moved token stream offsets over to stream shards",
+            extra={"stream_name": stream_name, "token_count": resharded_tokens},
+        )
 
 
 async def delete_token(token_id: str) -> None:
@@ -386,7 +886,9 @@ async def delete_token(token_id: str) -> None:
     async with glob.redis.pipeline() as pipe:
         await pipe.delete(f"bancho:tokens:ids:{token['user_id']}")
         await pipe.delete(f"bancho:tokens:names:{safeUsername(token['username'])}")
-        await pipe.hdel("bancho:tokens:json", token_id)
+        await pipe.delete(make_key(token_id))
+        await pipe.srem(TOKENS_KEY, token_id)
+        await pipe.zrem(PING_TIMES_KEY, token_id)
         await pipe.delete(f"{make_key(token_id)}:channels")
         await pipe.delete(f"{make_key(token_id)}:spectators")
         await pipe.delete(f"{make_key(token_id)}:streams")
@@ -395,6 +897,23 @@ async def delete_token(token_id: str) -> None:
         await pipe.delete(f"{make_key(token_id)}:processing_lock")
         await pipe.execute()
 
+    await REMOVE_TOKEN_FROM_INDEXES_SCRIPT(
+        keys=[
+            make_user_token_ids_key(token["user_id"]),
+            ONLINE_USER_IDS_KEY,
+            NON_RESTRICTED_USER_IDS_KEY,
+        ],
+        args=[token_id, token["user_id"]],
+    )
+
+    # Its match's packets filter out users whose tokens are gone
+    if token["match_id"] is not None:
+        await match.bump_version(token["match_id"])
+
+    token_cache = _get_token_cache()
+    if token_cache is not None:
+        token_cache[token_id] = None
+
 
 # joined channels
 
@@ -433,25 +952,6 @@ async def get_streams(token_id: str) -> set[str]:
     return {raw_stream.decode() for raw_stream in raw_streams}
 
 
-async def add_stream(token_id: str, stream_name: str) -> None:
-    await glob.redis.sadd(f"{make_key(token_id)}:streams", stream_name)
-
-    stream_offset = await stream_messages.get_latest_message_id(stream_name)
-    await glob.redis.hset(
-        f"{make_key(token_id)}:stream_offsets",
-        stream_messages.make_key(stream_name),
-        stream_offset,
-    )
-
-
-async def remove_stream(token_id: str, stream_name: str) -> None:
-    await glob.redis.srem(f"{make_key(token_id)}:streams", stream_name)
-    await glob.redis.hdel(
-        f"{make_key(token_id)}:stream_offsets",
-        stream_messages.make_key(stream_name),
-    )
-
-
 # messages
 # (list) bancho:tokens:{token_id}:message_history
 
@@ -592,10 +1092,6 @@ async def setLocation(token_id: str, latitude: float, longitude: float) -> None:
     :param latitude: latitude
     :param longitude: longitude
     """
-    token = await get_token(token_id)
-    if token is None:
-        return
-
     await update_token(
         token_id,
         latitude=latitude,
@@ -760,14 +1256,34 @@ async def updatePingTime(token_id: str) -> None:
 
     :return:
     """
-    token = await get_token(token_id)
-    if token is None:
-        return
+    ping_time = time()
 
-    await update_token(
-        token_id,
-        ping_time=time(),
+    # XX: don't resurrect a token which was deleted in the meantime
+    await glob.redis.zadd(PING_TIMES_KEY, {token_id: ping_time}, xx=True)
+
+    token_cache = _get_token_cache()
+    if token_cache is not None:
+        cached_token = token_cache.get(token_id)
+        if cached_token is not None:
+            cached_token["ping_time"] = ping_time
+
+
+async def get_ping_time(token_id: str) -> float | None:
+    return await glob.redis.zscore(PING_TIMES_KEY, token_id)
+
+
+async def get_inactive_token_ids(oldest_ping_time: float) -> list[str]:
+    """Get the ids of tokens which haven't pinged since `oldest_ping_time`"""
+    raw_token_ids: list[bytes] = await glob.redis.zrangebyscore(
+        PING_TIMES_KEY,
+        "-inf",
+        f"({oldest_ping_time}",
     )
+    return [token_id.decode() for token_id in raw_token_ids]
+
+
+async def remove_ping_time(token_id: str) -> None:
+    await glob.redis.zrem(PING_TIMES_KEY, token_id)
 
 
 async def joinMatch(token_id: str, match_id: int) -> bool:
@@ -969,49 +1485,21 @@ async def silence(
     await stream_messages.broadcast_data(
         "main",
         serverPackets.userSilenced(token["user_id"]),
+        shard_key=token["user_id"],
     )
 
 
-async def chat_spam_protection(
-    token_id: str,
-    *,
-    increase_spam_rate: bool = True,
-) -> None:
-    """
-    Silences the user if they are spamming chat messages.
-
-    :param increaseSpamRate: set to True if the user has sent a new message. Default: True
-    :return:
-    """
-    token = await get_token(token_id)
-    if token is None:
-        return
-
-    spam_rate = token["spam_rate"]
-
-    # Increase the spam rate if needed
-    if increase_spam_rate:
-        spam_rate += 1
-        await update_token(token_id, spam_rate=spam_rate)
-
-    ACCEPTABLE_SPAM_RATE = 10
-
-    # Silence the user if they exceed the acceptable rate
-    if spam_rate > ACCEPTABLE_SPAM_RATE:
-        await silence(token_id, 5 * 60, "Spamming (auto spam protection)")
-
-
 async def isSilenced(token_id: str) -> bool:
     """
     Returns True if this user is silenced, otherwise False
 
     :return: True if this user is silenced, otherwise False
     """
-    token = await get_token(token_id)
+    token = await get_token_fields(token_id, "silence_end_time")
     if token is None:
         return False
 
-    return token["silence_end_time"] - time() > 0
+    return bool(token["silence_end_time"] - time() > 0)
 
 
 async def getSilenceSecondsLeft(token_id: str) -> int:
@@ -1021,11 +1509,11 @@ async def getSilenceSecondsLeft(token_id: str) -> int:
 
     :return: silence seconds left (or 0)
     """
-    token = await get_token(token_id)
+    token = await get_token_fields(token_id, "silence_end_time")
     if token is None:
         return 0
 
-    return max(0, token["silence_end_time"] - int(time()))
+    return max(0, int(token["silence_end_time"]) - int(time()))
 
 
 async def updateCachedStats(token_id: str) -> None:
@@ -1145,20 +1633,153 @@ async def informUserOfUnrestriction(token_id: str) -> None:
     )
 
 
+# Stream membership is two-way: the stream's set of clients, and the token's
+# set of streams (plus its read offsets in each of the stream's physical
+# streams). These scripts update both sides for many streams in one call.
+# NOTE: like the inbox drain, they derive keys from their arguments, so they
+# rely on all keys living on the same (non-cluster) redis.
+# ARGV: token id, then for each stream: its name, its number of physical
+# streams, and the keys of its physical streams.
+JOIN_STREAMS_SCRIPT = redisScript(
+    """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return {}
+end
+
+local unknown_stream_names = {}
+local i = 2
+while i <= #ARGV do
+    local stream_name = ARGV[i]
+    local num_physical_streams = tonumber(ARGV[i + 1])
+
+    if redis.call("SISMEMBER", KEYS[4], stream_name) == 1 then
+        redis.call("SADD", KEYS[4] .. ":" .. stream_name, ARGV[1])
+    else
+        unknown_stream_names[#unknown_stream_names + 1] = stream_name
+    end
+
+    if redis.call("SADD", KEYS[2], stream_name) == 1 then
+        for j = i + 2, i + 1 + num_physical_streams do
+            local latest_messages = redis.call("XREVRANGE", ARGV[j], "+", "-", "COUNT", 1)
+            local offset = "0-0"
+            if #latest_messages > 0 then
+                offset = latest_messages[1][1]
+            end
+            redis.call("HSET", KEYS[3], ARGV[j], offset)
+        end
+    end
+
+    i = i + 2 + num_physical_streams
+end
+return unknown_stream_names
+""",
+)
+
+LEAVE_STREAMS_SCRIPT = redisScript(
+    """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return
+end
+
+local i = 2
+while i <= #ARGV do
+    local stream_name = ARGV[i]
+    local num_physical_streams = tonumber(ARGV[i + 1])
+
+    redis.call("SREM", KEYS[4] .. ":" .. stream_name, ARGV[1])
+    if redis.call("SREM", KEYS[2], stream_name) == 1 then
+        for j = i + 2, i + 1 + num_physical_streams do
+            redis.call("HDEL", KEYS[3], ARGV[j])
+        end
+    end
+
+    i = i + 2 + num_physical_streams
+end
+""",
+)
+
+# The token's streams are read in the script, so this only takes the token id.
+# Offsets are recognised by their key prefix, so physical streams don't matter.
+LEAVE_ALL_STREAMS_SCRIPT = redisScript(
+    """
+for _, stream_name in ipairs(redis.call("SMEMBERS", KEYS[2])) do
+    redis.call("SREM", KEYS[4] .. ":" .. stream_name, ARGV[1])
+end
+redis.call("DEL", KEYS[2])
+
+local stream_key_prefix = KEYS[4] .. ":"
+for _, stream_key in ipairs(redis.call("HKEYS", KEYS[3])) do
+    if string.sub(stream_key, 1, #stream_key_prefix) == stream_key_prefix then
+        redis.call("HDEL", KEYS[3], stream_key)
+    end
+end
+""",
+)
+
+
+def _make_stream_membership_script_keys(token_id: str) -> list[str]:
+    return [
+        make_key(token_id),
+        f"{make_key(token_id)}:streams",
+        f"{make_key(token_id)}:stream_offsets",
+        streamList.make_key(),
+    ]
+
+
+def _make_stream_membership_script_args(
+    token_id: str,
+    stream_names: Iterable[str],
+) -> list[str | int]:
+    args: list[str | int] = [token_id]
+    for stream_name in stream_names:
+        physical_stream_names = stream_messages.get_physical_stream_names(stream_name)
+        args += [stream_name, len(physical_stream_names)]
+        args += [
+            stream_messages.make_key(physical_stream_name)
+            for physical_stream_name in physical_stream_names
+        ]
+    return args
+
+
+async def join_many(token_id: str, stream_names: Iterable[str]) -> None:
+    """
+    Join many packet streams at once
+
+    :param stream_names: stream names
+    :return:
+    """
+    unknown_stream_names: list[bytes] = await JOIN_STREAMS_SCRIPT(
+        keys=_make_stream_membership_script_keys(token_id),
+        args=_make_stream_membership_script_args(token_id, stream_names),
+    )
+    for stream_name in unknown_stream_names:
+        logging.warning(
+            "Could not join stream which does not exist",
+            extra={"stream_name": stream_name.decode(), "token_id": token_id},
+        )
+
+
 async def joinStream(token_id: str, name: str) -> None:
     """
-    Join a packet stream, or create it if the stream doesn't exist.
+    Join a packet stream
 
     :param name: stream name
     :return:
     """
-    token = await get_token(token_id)
-    if token is None:
-        return
+    await join_many(token_id, [name])
 
-    await streamList.join(name, token_id=token_id)
-    if name not in await get_streams(token_id):
-        await add_stream(token_id, name)
+
+async def leave_many(token_id: str, stream_names: Iterable[str]) -> None:
+    """
+    Leave many packet streams at once
+
+    :param stream_names: stream names
+    :return:
+    """
+    await LEAVE_STREAMS_SCRIPT(
+        keys=_make_stream_membership_script_keys(token_id),
+        args=_make_stream_membership_script_args(token_id, stream_names),
+    )
 
 
 async def leaveStream(token_id: str, name: str) -> None:
@@ -1172,13 +1793,7 @@ async def leaveStream(token_id: str, name: str) -> None:
     :param name: stream name
     :return:
     """
-    token = await get_token(token_id)
-    if token is None:
-        return
-
-    await streamList.leave(name, token_id)
-    if name in await get_streams(token_id):
-        await remove_stream(token_id, name)
+    await leave_many(token_id, [name])
 
 
 async def leaveAllStreams(token_id: str) -> None:
@@ -1187,12 +1802,10 @@ async def leaveAllStreams(token_id: str) -> None:
 
     :return:
     """
-    token = await get_token(token_id)
-    if token is None:
-        return
-
-    for stream in await get_streams(token_id):
-        await leaveStream(token_id, stream)
+    await LEAVE_ALL_STREAMS_SCRIPT(
+        keys=_make_stream_membership_script_keys(token_id),
+        args=[token_id],
+    )
 
 
 async def leaveAllChannels(token_id: str) -> None:
@@ -1201,12 +1814,24 @@ async def leaveAllChannels(token_id: str) -> None:
 
     :return:
     """
-    token = await get_token(token_id)
-    if token is None:
+    channel_names = await get_joined_channels(token_id)
+    if not channel_names:
         return
 
-    for channel_name in await get_joined_channels(token_id):
-        await chat.part_channel(token_id=token_id, channel_name=channel_name)
+    await glob.redis.delete(f"{make_key(token_id)}:channels")
+    await leave_many(token_id, [f"chat/{name}" for name in channel_names])
+
+    # Delete instance channels (#mp_, #spect_) if everyone left
+    for channel_name in channel_names:
+        if channel_utils.get_client_name(channel_name) == channel_name:
+            continue
+
+        channel = await channelList.getChannel(channel_name)
+        if channel is None or not channel["instance"]:
+            continue
+
+        if (await stream.get_client_count(f"chat/{channel_name}")) - 1 == 0:
+            await channelList.removeChannel(channel_name)
 
 
 async def awayCheck(token_id: str, user_id: int) -> bool:
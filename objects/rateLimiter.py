@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from time import time
+from typing import NamedTuple
+
+from objects import glob
+from objects.redisScript import redisScript
+
+# (string) bancho:rate_limits:{name}:{subject}:{window_index}
+
+
+class RateLimit(NamedTuple):
+    max_hits: int
+    window: int  # seconds
+
+
+def make_key(name: str, subject: int | str, window_index: int) -> str:
+    return f"bancho:rate_limits:{name}:{subject}:{window_index}"
+
+
+# Sliding window counter: hits are counted in fixed windows, and the previous
+# window's count is weighted by how much of it still overlaps the sliding one.
+# Returns the estimated number of hits in the sliding window, this one included.
+RECORD_HIT_SCRIPT = redisScript(
+    """
+local current_hits = redis.call("INCR", KEYS[1])
+if current_hits == 1 then
+    redis.call("EXPIRE", KEYS[1], ARGV[1] * 2)
+end
+
+local previous_hits = tonumber(redis.call("GET", KEYS[2]) or "0")
+return current_hits + math.floor(previous_hits * tonumber(ARGV[2]))
+""",
+)
+
+
+async def hit(name: str, subject: int | str, rate_limit: RateLimit) -> bool:
+    """
+    Record a hit against a rate limit
+
+    :param name: name of the rate limit (e.g. "chat")
+    :param subject: what is being limited (e.g. a user id)
+    :param rate_limit: the limit to apply
+    :return: True if the hit is within the limit, otherwise False
+    """
+    current_time = time()
+    window_index, window_elapsed = divmod(current_time, rate_limit.window)
+    previous_window_weight = 1 - window_elapsed / rate_limit.window
+
+    hits: int = await RECORD_HIT_SCRIPT(
+        keys=[
+            make_key(name, subject, int(window_index)),
+            make_key(name, subject, int(window_index) - 1),
+        ],
+        args=[rate_limit.window, previous_window_weight],
+    )
+    return hits <= rate_limit.max_hits
@@ -1,31 +1,292 @@
 from __future__ import annotations
 
 import asyncio
+import secrets
+import time
 from types import TracebackType
+from typing import Any
+from typing import TypedDict
 
+from common.log import logger
 from objects import glob
+from objects.redisScript import redisScript
+
+# (string) {key}: owner token of the lock's holder
+# (zset) {key}:queue: owner tokens of waiters, by arrival (fair locks only)
+# (hash) {key}:queue_deadlines: owner token -> until when it's waiting
+# (pubsub) bancho:locks:released: keys of locks as they're released
 
 DEFAULT_LOCK_EXPIRY = 10  # in seconds
-DEFAULT_RETRY_DELAY = 0.05  # in seconds
+
+RELEASED_CHANNEL = "bancho:locks:released"
+
+# Waiters are woken up when a lock is released; this is only a safety net,
+# in case a release notification is missed or the lock's holder went away.
+MAX_NOTIFICATION_WAIT = 1.0  # in seconds
+
+# Waiters of fair locks which haven't retried within this are skipped
+QUEUE_ENTRY_TTL = 5_000  # in milliseconds
+
+
+# Returns {1} if the lock was acquired, otherwise {0, ms until it expires}
+# (or -1 if it's free, but other waiters are first in line).
+ACQUIRE_SCRIPT = redisScript(
+    """
+local owner_token = ARGV[1]
+local fair = ARGV[3] == "1"
+
+if fair then
+    local now = redis.call("TIME")
+    now = now[1] * 1000 + math.floor(now[2] / 1000)
+
+    -- skip waiters which stopped waiting
+    local head = nil
+    while true do
+        head = redis.call("ZRANGE", KEYS[2], 0, 0)[1]
+        if not head or head == owner_token then
+            break
+        end
+        local deadline = redis.call("HGET", KEYS[3], head)
+        if deadline and tonumber(deadline) >= now then
+            break
+        end
+        redis.call("ZREM", KEYS[2], head)
+        redis.call("HDEL", KEYS[3], head)
+    end
+
+    redis.call("ZADD", KEYS[2], "NX", now, owner_token)
+    redis.call("HSET", KEYS[3], owner_token, now + tonumber(ARGV[4]))
+    redis.call("PEXPIRE", KEYS[2], ARGV[4])
+    redis.call("PEXPIRE", KEYS[3], ARGV[4])
+
+    if head and head ~= owner_token then
+        local lock_ttl = redis.call("PTTL", KEYS[1])
+        return {0, lock_ttl > 0 and lock_ttl or -1}
+    end
+end
+
+if redis.call("SET", KEYS[1], owner_token, "NX", "PX", ARGV[2]) then
+    if fair then
+        redis.call("ZREM", KEYS[2], owner_token)
+        redis.call("HDEL", KEYS[3], owner_token)
+    end
+    return {1}
+end
+
+return {0, redis.call("PTTL", KEYS[1])}
+""",
+)
+
+# Releases the lock if it's still held by the owner, and wakes up its waiters.
+# Returns 1 if the lock was released, 0 if it had expired (or been taken over).
+RELEASE_SCRIPT = redisScript(
+    """
+if redis.call("GET", KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+
+redis.call("DEL", KEYS[1])
+redis.call("PUBLISH", ARGV[2], KEYS[1])
+return 1
+""",
+)
+
+# Removes a waiter from a fair lock's queue, when it stops waiting early
+LEAVE_QUEUE_SCRIPT = redisScript(
+    """
+if redis.call("ZREM", KEYS[1], ARGV[1]) == 1 then
+    redis.call("HDEL", KEYS[2], ARGV[1])
+    redis.call("PUBLISH", ARGV[2], ARGV[3])
+end
+return 0
+""",
+)
+
+
+class LockStats(TypedDict):
+    acquisitions: int
+    contended_acquisitions: int
+    wait_seconds: float
+    max_wait_seconds: float
+    hold_seconds: float
+    max_hold_seconds: float
+    expired_before_release: int
+
+
+_stats: LockStats = {
+    "acquisitions": 0,
+    "contended_acquisitions": 0,
+    "wait_seconds": 0.0,
+    "max_wait_seconds": 0.0,
+    "hold_seconds": 0.0,
+    "max_hold_seconds": 0.0,
+    "expired_before_release": 0,
+}
+
+
+class _ReleaseNotifier:
+    """Wakes up this process' waiters when the lock they wait for is released"""
+
+    def __init__(self) -> None:
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+        self._subscribed = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def register(self, key: str) -> asyncio.Event:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        event = asyncio.Event()
+        self._waiters.setdefault(key, set()).add(event)
+        return event
+
+    def unregister(self, key: str, event: asyncio.Event) -> None:
+        waiters = self._waiters.get(key)
+        if waiters is None:
+            return
+
+        waiters.discard(event)
+        if not waiters:
+            del self._waiters[key]
+
+    async def wait_until_subscribed(self) -> None:
+        """Wait (for a bounded time) until releases are being listened for"""
+        try:
+            await asyncio.wait_for(
+                self._subscribed.wait(),
+                timeout=MAX_NOTIFICATION_WAIT,
+            )
+        except TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("An error occurred while listening for lock releases")
+                await asyncio.sleep(1)
+
+    async def _listen(self) -> None:
+        pubsub = glob.redis.pubsub()
+        try:
+            await pubsub.subscribe(RELEASED_CHANNEL)
+            self._subscribed.set()
+
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+
+                for event in self._waiters.get(message["data"].decode(), ()):
+                    event.set()
+        finally:
+            self._subscribed.clear()
+            await pubsub.aclose()  # type: ignore[no-untyped-call]
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+_release_notifier = _ReleaseNotifier()
 
 
 class redisLock:
-    def __init__(self, key: str) -> None:
+    """\
+    A distributed lock, held by one owner at a time.
+
+    Waiters are woken up as soon as the lock is released. With `fair=True`,
+    the lock is handed to waiters in the order they started waiting.
+    """
+
+    def __init__(self, key: str, *, fair: bool = False) -> None:
         self.key = key
+        self.fair = fair
+        self._owner_token: str | None = None
+        self._acquired_at: float | None = None
 
-    async def _try_acquire(self, expiry: int) -> bool | None:
-        return await glob.redis.set(self.key, "1", ex=expiry, nx=True)
+    def _make_queue_keys(self) -> list[str]:
+        return [f"{self.key}:queue", f"{self.key}:queue_deadlines"]
 
-    async def acquire(
-        self,
-        expiry: int = DEFAULT_LOCK_EXPIRY,
-        retry_delay: float = DEFAULT_RETRY_DELAY,
-    ) -> None:
-        while not await self._try_acquire(expiry):
-            await asyncio.sleep(retry_delay)
+    async def _try_acquire(self, owner_token: str, expiry: int) -> tuple[bool, int]:
+        response: list[Any] = await ACQUIRE_SCRIPT(
+            keys=[self.key, *self._make_queue_keys()],
+            args=[owner_token, expiry * 1000, int(self.fair), QUEUE_ENTRY_TTL],
+        )
+        if response[0]:
+            return True, 0
+        return False, response[1]
+
+    async def acquire(self, expiry: int = DEFAULT_LOCK_EXPIRY) -> None:
+        owner_token = secrets.token_hex(16)
+        start_time = time.perf_counter()
+
+        acquired, lock_ttl = await self._try_acquire(owner_token, expiry)
+        if not acquired:
+            released = _release_notifier.register(self.key)
+            try:
+                # Retry once releases are listened for; one which happened
+                # before that wasn't notified, but is seen by the retry
+                await _release_notifier.wait_until_subscribed()
+                acquired, lock_ttl = await self._try_acquire(owner_token, expiry)
+
+                while not acquired:
+                    wait_time = MAX_NOTIFICATION_WAIT
+                    if lock_ttl > 0:
+                        wait_time = min(lock_ttl / 1000, wait_time)
+
+                    try:
+                        await asyncio.wait_for(released.wait(), timeout=wait_time)
+                    except TimeoutError:
+                        pass
+
+                    released.clear()
+                    acquired, lock_ttl = await self._try_acquire(owner_token, expiry)
+            except BaseException:
+                if self.fair:
+                    await LEAVE_QUEUE_SCRIPT(
+                        keys=self._make_queue_keys(),
+                        args=[owner_token, RELEASED_CHANNEL, self.key],
+                    )
+                raise
+            finally:
+                _release_notifier.unregister(self.key, released)
+
+            _stats["contended_acquisitions"] += 1
+
+        self._owner_token = owner_token
+        self._acquired_at = time.perf_counter()
+
+        wait_seconds = self._acquired_at - start_time
+        _stats["acquisitions"] += 1
+        _stats["wait_seconds"] += wait_seconds
+        _stats["max_wait_seconds"] = max(_stats["max_wait_seconds"], wait_seconds)
 
     async def release(self) -> None:
-        await glob.redis.delete(self.key)
+        if self._owner_token is None or self._acquired_at is None:
+            return
+
+        released = await RELEASE_SCRIPT(
+            keys=[self.key],
+            args=[self._owner_token, RELEASED_CHANNEL],
+        )
+
+        hold_seconds = time.perf_counter() - self._acquired_at
+        _stats["hold_seconds"] += hold_seconds
+        _stats["max_hold_seconds"] = max(_stats["max_hold_seconds"], hold_seconds)
+
+        if not released:
+            _stats["expired_before_release"] += 1
+            logger.warning(
+                "Lock expired before it was released",
+                extra={"key": self.key, "hold_seconds": hold_seconds},
+            )
+
+        self._owner_token = None
+        self._acquired_at = None
 
     async def __aenter__(self) -> None:
         await self.acquire()
@@ -37,3 +298,11 @@ class redisLock:
         exc_tb: TracebackType | None,
     ) -> None:
         await self.release()
+
+
+def get_stats() -> LockStats:
+    return _stats.copy()
+
+
+def shutdown() -> None:
+    _release_notifier.stop()
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+from typing import Any
+
+from objects import glob
+
+if TYPE_CHECKING:
+    from redis.commands.core import AsyncScript
+
+
+class redisScript:
+    """\
+    A lua script, registered with redis on first use.
+
+    Scripts are invoked with EVALSHA, falling back to EVAL
+    (and caching the script) if redis has not seen it yet. They're
+    registered again if the redis client is replaced (e.g. in tests).
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self._script: AsyncScript | None = None
+
+    async def __call__(
+        self,
+        keys: list[str] | None = None,
+        args: list[Any] | None = None,
+    ) -> Any:
+        if self._script is None or self._script.registered_client is not glob.redis:
+            self._script = glob.redis.register_script(self.source)
+
+        return await self._script(keys=keys, args=args)
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from typing import Literal
+from collections.abc import Mapping
+from collections.abc import Sequence
+from typing import Any
+from typing import NamedTuple
 from typing import TypedDict
 from typing import cast
 
@@ -9,6 +12,12 @@ import orjson
 from constants import matchTeams
 from constants import slotStatuses
 from objects import glob
+from objects.redisScript import redisScript
+
+# Slots are stored in their match's hash, see match.py
+# (hash) bancho:matches:{match_id} -> slots:{slot_id}: json obj
+
+SLOT_COUNT = 16
 
 
 class Slot(TypedDict):
@@ -25,12 +34,56 @@ class Slot(TypedDict):
     passed: bool
 
 
-def make_key(match_id: int, slot_id: int | Literal["*"]) -> str:
-    return f"bancho:matches:{match_id}:slots:{slot_id}"
+class SlotFields(TypedDict, total=False):
+    status: int
+    team: int
+    user_id: int
+    user_token: str | None
+    mods: int
+    loaded: bool
+    skip: bool
+    complete: bool
+    score: int
+    failed: bool
+    passed: bool
+
+
+class SlotTransition(TypedDict, total=False):
+    slot_id: int  # only this slot, otherwise any slot
+    where: SlotFields  # only slots with these values
+    where_not: SlotFields  # only slots without these values
+    first: bool  # only the first matching slot
+    required: bool  # apply no transitions unless this one matches a slot
+    set: SlotFields
+
 
+class SlotTransitionResult(NamedTuple):
+    applied: bool
+    slots: list[Slot]
+    changed_slot_ids: list[list[int]]  # for each transition
 
-async def create_slot(match_id: int, slot_id: int) -> Slot:
-    slot: Slot = {
+
+def make_key(match_id: int) -> str:
+    return f"bancho:matches:{match_id}"
+
+
+def make_field(slot_id: int) -> str:
+    return f"slots:{slot_id}"
+
+
+SLOT_FIELDS = [make_field(slot_id) for slot_id in range(SLOT_COUNT)]
+
+FREE_SLOT: SlotFields = {
+    "status": slotStatuses.FREE,
+    "team": matchTeams.NO_TEAM,
+    "user_id": -1,
+    "user_token": None,
+    "mods": 0,
+}
+
+
+def make_empty_slot() -> Slot:
+    return {
         "status": slotStatuses.FREE,
         "team": matchTeams.NO_TEAM,
         "user_id": -1,
@@ -43,20 +96,17 @@ async def create_slot(match_id: int, slot_id: int) -> Slot:
         "failed": False,
         "passed": True,
     }
-    await glob.redis.set(make_key(match_id, slot_id), orjson.dumps(slot))
-    return slot
 
 
 async def get_slot(match_id: int, slot_id: int) -> Slot | None:
-    slot = await glob.redis.get(make_key(match_id, slot_id))
+    slot = await glob.redis.hget(make_key(match_id), make_field(slot_id))
     if slot is None:
         return None
     return cast(Slot, orjson.loads(slot))
 
 
 async def get_slots(match_id: int) -> list[Slot]:
-    keys = [make_key(match_id, slot_id) for slot_id in range(16)]
-    raw_slots = await glob.redis.mget(keys)
+    raw_slots = await glob.redis.hmget(make_key(match_id), SLOT_FIELDS)
     slots = []
     for raw_slot in raw_slots:
         assert raw_slot is not None
@@ -64,6 +114,125 @@ async def get_slots(match_id: int) -> list[Slot]:
     return cast(list[Slot], slots)
 
 
+# Applies a list of transitions to a match's slots, atomically. Transitions
+# are matched against the slots as they were before any of them applied, and
+# their changes are applied in order. A transition can also be made to depend
+# on the state of the match itself (ARGV[2]).
+# Returns {applied (0/1), slots, {changed slot ids, for each transition}}.
+TRANSITION_SLOTS_SCRIPT = redisScript(
+    """
+local slot_fields = {}
+for slot_id = 0, 15 do
+    slot_fields[slot_id + 1] = "slots:" .. slot_id
+end
+
+local raw_slots = redis.call("HMGET", KEYS[1], unpack(slot_fields))
+if not raw_slots[1] then
+    return false
+end
+
+local match_where = cjson.decode(ARGV[2])
+if next(match_where) ~= nil then
+    local match = cjson.decode(redis.call("HGET", KEYS[1], "match"))
+    for field, value in pairs(match_where) do
+        if match[field] ~= value then
+            return {0, raw_slots, {}}
+        end
+    end
+end
+
+local function slot_matches(slot, transition)
+    for field, value in pairs(transition.where or {}) do
+        if slot[field] ~= value then
+            return false
+        end
+    end
+    for field, value in pairs(transition.where_not or {}) do
+        if slot[field] == value then
+            return false
+        end
+    end
+    return true
+end
+
+local old_slots = {}
+local new_slots = {}
+for i = 1, #raw_slots do
+    old_slots[i] = cjson.decode(raw_slots[i])
+    new_slots[i] = cjson.decode(raw_slots[i])
+end
+
+local changed = {}
+local changed_slot_ids = {}
+for t, transition in ipairs(cjson.decode(ARGV[1])) do
+    local slot_ids = {}
+    for i = 1, #old_slots do
+        if (transition.slot_id == nil or transition.slot_id == i - 1)
+            and slot_matches(old_slots[i], transition) then
+            for field, value in pairs(transition.set or {}) do
+                new_slots[i][field] = value
+            end
+            changed[i] = true
+            slot_ids[#slot_ids + 1] = i - 1
+            if transition.first then
+                break
+            end
+        end
+    end
+
+    if transition.required and #slot_ids == 0 then
+        return {0, raw_slots, {}}
+    end
+    changed_slot_ids[t] = slot_ids
+end
+
+local updates = {}
+for i = 1, #new_slots do
+    if changed[i] then
+        raw_slots[i] = cjson.encode(new_slots[i])
+        updates[#updates + 1] = slot_fields[i]
+        updates[#updates + 1] = raw_slots[i]
+    end
+end
+if #updates > 0 then
+    redis.call("HSET", KEYS[1], unpack(updates))
+    redis.call("HINCRBY", KEYS[1], "version", 1)
+end
+
+return {1, raw_slots, changed_slot_ids}
+""",
+)
+
+
+async def transition_slots(
+    match_id: int,
+    transitions: Sequence[SlotTransition],
+    *,
+    match_where: Mapping[str, Any] | None = None,
+) -> SlotTransitionResult | None:
+    """
+    Atomically apply some transitions to a match's slots
+
+    :param transitions: changes to make, see `SlotTransition`
+    :param match_where: only apply them if the match has these values
+    :return: whether the transitions were applied, and the resulting
+             slots; or None if the match doesn't exist
+    """
+    response: list[Any] | None = await TRANSITION_SLOTS_SCRIPT(
+        keys=[make_key(match_id)],
+        args=[orjson.dumps(transitions), orjson.dumps(dict(match_where or {}))],
+    )
+    if response is None:
+        return None
+
+    applied, raw_slots, changed_slot_ids = response
+    return SlotTransitionResult(
+        applied=bool(applied),
+        slots=[cast(Slot, orjson.loads(raw_slot)) for raw_slot in raw_slots],
+        changed_slot_ids=changed_slot_ids,
+    )
+
+
 async def update_slot(
     match_id: int,
     slot_id: int,
@@ -80,42 +249,34 @@ async def update_slot(
     failed: bool | None = None,
     passed: bool | None = None,
 ) -> Slot | None:
-    slot = await get_slot(match_id, slot_id)
-    if slot is None:
-        return None
-
+    fields: SlotFields = {}
     if status is not None:
-        slot["status"] = status
+        fields["status"] = status
     if team is not None:
-        slot["team"] = team
+        fields["team"] = team
     if user_id is not None:
-        slot["user_id"] = user_id
+        fields["user_id"] = user_id
     if user_token != "":
-        slot["user_token"] = user_token
+        fields["user_token"] = user_token
     if mods is not None:
-        slot["mods"] = mods
+        fields["mods"] = mods
     if loaded is not None:
-        slot["loaded"] = loaded
+        fields["loaded"] = loaded
     if skip is not None:
-        slot["skip"] = skip
+        fields["skip"] = skip
     if complete is not None:
-        slot["complete"] = complete
+        fields["complete"] = complete
     if score is not None:
-        slot["score"] = score
+        fields["score"] = score
     if failed is not None:
-        slot["failed"] = failed
+        fields["failed"] = failed
     if passed is not None:
-        slot["passed"] = passed
+        fields["passed"] = passed
 
-    await glob.redis.set(make_key(match_id, slot_id), orjson.dumps(slot))
-    return slot
-
-
-async def delete_slot(match_id: int, slot_id: int) -> None:
-    # TODO: should we throw error when no slot exists?
-    await glob.redis.delete(make_key(match_id, slot_id))
-
-
-async def delete_slots(match_id: int) -> None:
-    # TODO: should we throw error when no slots exist?
-    await glob.redis.delete(*await glob.redis.keys(make_key(match_id, "*")))
+    result = await transition_slots(
+        match_id,
+        [{"slot_id": slot_id, "set": fields}],
+    )
+    if result is None:
+        return None
+    return result.slots[slot_id]
@@ -23,16 +23,11 @@ async def get_client_count(stream_name: str) -> int:
 
 async def add_client(stream_name: str, token_id: str) -> None:
     """Add a client to this stream if they are not a member."""
-    client_token_ids = await get_client_token_ids(stream_name)
-
-    if token_id in client_token_ids:
+    if not await glob.redis.sadd(make_key(stream_name), token_id):
         logging.warning(
             "Attempted to add client to stream which is already in",
             extra={"stream_name": stream_name, "token_id": token_id},
         )
-        return
-
-    await glob.redis.sadd(make_key(stream_name), token_id)
 
 
 async def remove_client(
@@ -40,16 +35,11 @@ async def remove_client(
     token_id: str,
 ) -> None:
     """Remove a client from this stream if they are a member."""
-    client_token_ids = await get_client_token_ids(stream_name)
-
-    if token_id not in client_token_ids:
+    if not await glob.redis.srem(make_key(stream_name), token_id):
         logging.warning(
             "Attempted to remove client from stream which is not in",
             extra={"stream_name": stream_name, "token_id": token_id},
         )
-        return
-
-    await glob.redis.srem(make_key(stream_name), token_id)
 
 
 async def dispose(stream_name: str) -> None:
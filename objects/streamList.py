@@ -33,30 +33,6 @@ async def add(stream_name: str) -> None:
     await glob.redis.sadd(make_key(), stream_name)
 
 
-async def join(stream_name: str, token_id: str) -> None:
-    """Add a client to a stream."""
-    if not await stream_exists(stream_name):
-        logging.warning(
-            "Could not join stream which does not exist",
-            extra={"stream_name": stream_name, "token_id": token_id},
-        )
-        return
-
-    await stream.add_client(stream_name, token_id)
-
-
-async def leave(stream_name: str, token_id: str) -> None:
-    """Remove a client from a stream."""
-    if not await stream_exists(stream_name):
-        logging.warning(
-            "Could not leave stream which does not exist",
-            extra={"stream_name": stream_name, "token_id": token_id},
-        )
-        return
-
-    await stream.remove_client(stream_name, token_id)
-
-
 async def dispose(stream_name: str) -> None:
     """Removes an existing stream and kicks every user in it."""
     if not await stream_exists(stream_name):
@@ -1,13 +1,92 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from collections.abc import AsyncIterator
+from collections.abc import Iterable
+from collections.abc import Mapping
+from time import time
+from typing import Any
 from typing import TypedDict
 
+import settings
+from common.log import logger
 from objects import glob
+from objects.broadcastCache import parse_message_id
+from objects.redisScript import redisScript
+
+
+STREAM_KEY_PREFIX = "bancho:streams:"
 
 
 def make_key(stream_name: str) -> str:
-    return f"bancho:streams:{stream_name}:messages"
+    return f"{STREAM_KEY_PREFIX}{stream_name}:messages"
+
+
+def make_key_prefix(stream_name_prefix: str) -> str:
+    """Key prefix of the streams whose names start with `stream_name_prefix`"""
+    return f"{STREAM_KEY_PREFIX}{stream_name_prefix}"
+
+
+# How long messages are kept in a stream, by stream name prefix.
+# Streams are trimmed as they're written to, and expire once they've
+# been idle for longer than their retention.
+DEFAULT_RETENTION_SECONDS = 5 * 60
+RETENTION_SECONDS_BY_PREFIX: dict[str, int] = {
+    "spect/": 30,
+    # match state (e.g. updateMatch, matchStart) is sent through these
+    "multi/": 5 * 60,
+    "chat/": 5 * 60,
+    "tokens/": 5 * 60,
+}
+
+
+def get_retention_seconds(stream_name: str) -> int:
+    for prefix, retention_seconds in RETENTION_SECONDS_BY_PREFIX.items():
+        if stream_name.startswith(prefix):
+            return retention_seconds
+    return DEFAULT_RETENTION_SECONDS
+
+
+def make_min_id(retention_seconds: int) -> str:
+    """The oldest message id which is still within `retention_seconds`"""
+    return f"{int((time() - retention_seconds) * 1000)}-0"
+
+
+# Logical streams backed by several physical streams (shards), so that no
+# single stream takes every write and trim of a hot stream. Writers pick a
+# shard by key, and readers keep an offset per shard.
+# NOTE: this is not redis cluster support. The shard keys have no hash tags,
+# and the inbox drain and stream membership scripts derive keys from their
+# arguments or from the offsets hash, so all keys must live on one redis.
+STREAM_SHARD_COUNTS: dict[str, int] = {
+    "main": 8,
+}
+
+
+def make_shard_stream_name(stream_name: str, shard: int) -> str:
+    return f"{stream_name}/shards/{shard}"
+
+
+def get_physical_stream_names(stream_name: str) -> list[str]:
+    shard_count = STREAM_SHARD_COUNTS.get(stream_name)
+    if shard_count is None:
+        return [stream_name]
+    return [make_shard_stream_name(stream_name, shard) for shard in range(shard_count)]
+
+
+def get_shard_stream_name(stream_name: str, shard_key: int | None) -> str:
+    """
+    Get the physical stream to write a message to
+
+    :param shard_key: messages with the same key (e.g. a user id) go to the
+                      same shard, and so are read in order. Default: shard 0
+    """
+    shard_count = STREAM_SHARD_COUNTS.get(stream_name)
+    if shard_count is None:
+        return stream_name
+    shard = shard_key % shard_count if shard_key is not None else 0
+    return make_shard_stream_name(stream_name, shard)
 
 
 class StreamMessage(TypedDict):
@@ -21,80 +100,556 @@ async def broadcast_data(
     data: bytes,
     *,
     excluded_token_ids: list[str] | None = None,
+    shard_key: int | None = None,
 ) -> None:
     """Send some data to all clients connected to this stream, with optional exclusions"""
     if excluded_token_ids is None:
         excluded_token_ids = []
 
+    stream_name = get_shard_stream_name(stream_name, shard_key)
     stream_key = make_key(stream_name)
     fields: StreamMessage = {
         "stream_key": stream_key,
         "packet_data": data,
         "excluded_token_ids": ",".join(excluded_token_ids),
     }
-    await glob.redis.xadd(stream_key, fields)
+    retention_seconds = get_retention_seconds(stream_name)
 
+    async with glob.redis.pipeline(transaction=False) as pipe:
+        await pipe.xadd(
+            stream_key,
+            fields,
+            minid=make_min_id(retention_seconds),
+            approximate=True,
+        )
+        await pipe.expire(stream_key, retention_seconds)
+        await pipe.execute()
 
-async def _get_token_stream_offsets(token_id: str) -> dict[str, str]:
-    return {
-        stream_key.decode(): stream_offset.decode()
-        for stream_key, stream_offset in (
-            await glob.redis.hgetall(f"bancho:tokens:{token_id}:stream_offsets")
-        ).items()
-    }
 
+# When a poll's response is capped, streams are drained in priority order
+# (lowest first) and whatever doesn't fit is left for the next poll.
+DEFAULT_STREAM_PRIORITY = 2
+STREAM_PRIORITIES_BY_PREFIX: dict[str, int] = {
+    "tokens/": 0,
+    "chat/": 1,
+    "multi/": 1,
+    "spect/": 3,
+}
 
-async def _set_token_stream_offsets(
-    token_id: str,
-    stream_offsets: dict[str, str],
-) -> None:
-    await glob.redis.hmset(
-        f"bancho:tokens:{token_id}:stream_offsets",
-        stream_offsets,  # type: ignore[arg-type]
-    )
+
+def get_stream_priority(stream_key: str) -> int:
+    stream_name = stream_key.removeprefix(STREAM_KEY_PREFIX)
+    for prefix, priority in STREAM_PRIORITIES_BY_PREFIX.items():
+        if stream_name.startswith(prefix):
+            return priority
+    return DEFAULT_STREAM_PRIORITY
+
+
+# Reads a token's inbox in a single round trip: reads its stream offsets,
+# fetches up to ARGV[2] new messages from each of its streams, blanking out
+# messages the token is excluded from, and takes as many as fit in a response
+# (ARGV[2] messages and ARGV[3] bytes) by stream priority. The offsets of the
+# streams read are advanced past what was taken, so only streams the token
+# is still in are advanced.
+# ARGV[4] is the default priority, followed by the number of (key prefix,
+# priority) pairs and the pairs. Streams listed after that are served by the
+# broadcast cache; their offsets are returned as-is, for the caller to serve
+# (and advance) with what's left of the response.
+# NOTE: the stream keys are read from the offsets hash rather than passed in
+# KEYS, so this relies on all keys living on the same (non-cluster) redis.
+READ_PENDING_MESSAGES_SCRIPT = redisScript(
+    """
+local offsets = redis.call("HGETALL", KEYS[1])
+if #offsets == 0 then
+    return false
+end
+
+local max_messages = tonumber(ARGV[2])
+local max_bytes = tonumber(ARGV[3])
+local default_priority = tonumber(ARGV[4])
+local cached_stream_keys_start = 6 + 2 * tonumber(ARGV[5])
+
+local cached_stream_keys = {}
+for i = cached_stream_keys_start, #ARGV do
+    cached_stream_keys[ARGV[i]] = true
+end
+
+local function get_priority(stream_key)
+    for i = 6, cached_stream_keys_start - 1, 2 do
+        if string.sub(stream_key, 1, #ARGV[i]) == ARGV[i] then
+            return tonumber(ARGV[i + 1])
+        end
+    end
+    return default_priority
+end
+
+local stream_keys = {}
+local stream_offsets = {}
+local cached_offsets = {}
+for i = 1, #offsets, 2 do
+    if cached_stream_keys[offsets[i]] then
+        cached_offsets[#cached_offsets + 1] = offsets[i]
+        cached_offsets[#cached_offsets + 1] = offsets[i + 1]
+    else
+        stream_keys[#stream_keys + 1] = offsets[i]
+        stream_offsets[#stream_offsets + 1] = offsets[i + 1]
+    end
+end
+
+if #stream_keys == 0 then
+    return {cached_offsets, {}, 0, 0, 0}
+end
+
+local xread_args = {"COUNT", max_messages, "STREAMS"}
+for i = 1, #stream_keys do
+    xread_args[3 + i] = stream_keys[i]
+    xread_args[3 + #stream_keys + i] = stream_offsets[i]
+end
+
+local streams = redis.call("XREAD", unpack(xread_args))
+if not streams then
+    return {cached_offsets, {}, 0, 0, 0}
+end
+
+local priorities = {}
+for _, stream in ipairs(streams) do
+    priorities[stream[1]] = get_priority(stream[1])
+end
+table.sort(streams, function(a, b)
+    if priorities[a[1]] ~= priorities[b[1]] then
+        return priorities[a[1]] < priorities[b[1]]
+    end
+    return a[1] < b[1]
+end)
+
+local excluded_token_id = "," .. ARGV[1] .. ","
+local num_bytes = 0
+local num_messages = 0
+local capped = false
+local pending_streams = {}
+
+for _, stream in ipairs(streams) do
+    local packets = {}
+    local new_offset = nil
+    for _, message in ipairs(stream[2]) do
+        local fields = message[2]
+        local packet_data = ""
+        local excluded_token_ids = ""
+        for i = 1, #fields, 2 do
+            if fields[i] == "packet_data" then
+                packet_data = fields[i + 1]
+            elseif fields[i] == "excluded_token_ids" then
+                excluded_token_ids = fields[i + 1]
+            end
+        end
+
+        if string.find("," .. excluded_token_ids .. ",", excluded_token_id, 1, true) then
+            packet_data = ""
+        end
+
+        if packet_data ~= "" then
+            -- Always send at least one message, however big
+            if num_messages > 0 and (
+                num_bytes + #packet_data > max_bytes
+                or num_messages >= max_messages
+            ) then
+                capped = true
+                break
+            end
+
+            packets[#packets + 1] = packet_data
+            num_bytes = num_bytes + #packet_data
+            num_messages = num_messages + 1
+        end
+        new_offset = message[1]
+    end
+
+    if new_offset then
+        redis.call("HSET", KEYS[1], stream[1], new_offset)
+    end
+    if #packets > 0 then
+        pending_streams[#pending_streams + 1] = {stream[1], packets}
+    end
+    if capped then
+        break
+    end
+end
+
+return {cached_offsets, pending_streams, num_bytes, num_messages, capped and 1 or 0}
+""",
+)
+
+# Advances a token's offsets in streams read outside of the script above,
+# but only where they still hold the offset that was read. Otherwise another
+# poll already delivered those messages, or the token left the stream.
+# ARGV: (stream key, offset read, new offset) triples
+# Returns 1 for each offset which was advanced, 0 otherwise.
+ADVANCE_STREAM_OFFSETS_SCRIPT = redisScript(
+    """
+local advanced = {}
+for i = 1, #ARGV, 3 do
+    if redis.call("HGET", KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call("HSET", KEYS[1], ARGV[i], ARGV[i + 2])
+        advanced[#advanced + 1] = 1
+    else
+        advanced[#advanced + 1] = 0
+    end
+end
+return advanced
+""",
+)
+
+# (message id, packet data) pairs of a stream; the packet data is empty
+# for messages which the token is excluded from
+PendingMessages = list[tuple[str, bytes]]
 
 
 async def read_all_pending_data(token_id: str) -> bytes:
-    """Read all data sent to these streams, excluding data sent by the client."""
-    stream_offsets = await _get_token_stream_offsets(token_id)
-    if not stream_offsets:
+    """
+    Read the data sent to the token's streams, excluding data sent by the client.
+
+    Responses are capped in size; the rest is read by the next poll.
+    """
+    stream_offsets_key = f"bancho:tokens:{token_id}:stream_offsets"
+    cached_stream_keys = (
+        glob.broadcast_cache.get_cached_stream_keys()
+        if glob.broadcast_cache is not None
+        else []
+    )
+
+    response: list[Any] | None = await READ_PENDING_MESSAGES_SCRIPT(
+        keys=[stream_offsets_key],
+        args=[
+            token_id,
+            settings.APP_POLL_MAX_MESSAGES,
+            settings.APP_POLL_MAX_BYTES,
+            DEFAULT_STREAM_PRIORITY,
+            len(STREAM_PRIORITIES_BY_PREFIX),
+            *(
+                value
+                for prefix, priority in STREAM_PRIORITIES_BY_PREFIX.items()
+                for value in (make_key_prefix(prefix), priority)
+            ),
+            *cached_stream_keys,
+        ],
+    )
+    if response is None:
         logging.warning(
             "Token is connected to no streams",
             extra={"token_id": token_id},
         )
         return b""
 
-    data = await glob.redis.xread(stream_offsets)
+    raw_cached_offsets, raw_pending_streams, num_bytes, num_messages, capped = response
+    pending_data_chunks: dict[str, list[bytes]] = {
+        raw_stream_key.decode(): packets
+        for raw_stream_key, packets in raw_pending_streams
+    }
+
+    # Streams served by the broadcast cache get what's left of the response
+    if raw_cached_offsets and not capped:
+        assert glob.broadcast_cache is not None
+
+        cached_offsets: dict[str, str] = {}
+        uncached_offsets: dict[str, str] = {}
+        pending_streams: dict[str, PendingMessages] = {}
+        for raw_stream_key, raw_offset in zip(
+            raw_cached_offsets[::2],
+            raw_cached_offsets[1::2],
+        ):
+            stream_key = raw_stream_key.decode()
+            offset = raw_offset.decode()
+            cached_offsets[stream_key] = offset
+
+            cached_messages = glob.broadcast_cache.read(stream_key, offset, token_id)
+            if cached_messages is None:
+                uncached_offsets[stream_key] = offset
+            elif cached_messages:
+                pending_streams[stream_key] = cached_messages
+
+        if uncached_offsets:
+            pending_streams |= await _read_pending_messages_from_redis(
+                token_id,
+                uncached_offsets,
+            )
 
-    pending_data = bytearray()
-    new_stream_offsets: dict[str, str] = {}
+        cached_data_chunks, new_offsets = _take_pending_data(
+            pending_streams,
+            num_bytes=num_bytes,
+            num_messages=num_messages,
+        )
+
+        # These offsets are only advanced if no other poll did so meanwhile;
+        # if one did, it sent their messages already
+        if new_offsets:
+            advanced: list[int] = await ADVANCE_STREAM_OFFSETS_SCRIPT(
+                keys=[stream_offsets_key],
+                args=[
+                    value
+                    for stream_key, new_offset in new_offsets.items()
+                    for value in (stream_key, cached_offsets[stream_key], new_offset)
+                ],
+            )
+            for stream_key, was_advanced in zip(new_offsets, advanced):
+                if not was_advanced:
+                    cached_data_chunks.pop(stream_key, None)
+
+        pending_data_chunks |= cached_data_chunks
+
+    return b"".join(
+        chunk
+        for stream_key in sorted(pending_data_chunks, key=get_stream_priority)
+        for chunk in pending_data_chunks[stream_key]
+    )
+
+
+def _take_pending_data(
+    pending_streams: dict[str, PendingMessages],
+    *,
+    num_bytes: int = 0,
+    num_messages: int = 0,
+) -> tuple[dict[str, list[bytes]], dict[str, str]]:
+    """
+    Take as much pending data as fits in a response, by stream priority
+
+    :param num_bytes: size of the data already in the response
+    :param num_messages: number of messages already in the response
+    :return: ({stream key: data to send}, {stream key: new offset})
+    """
+    pending_data_chunks: dict[str, list[bytes]] = {}
+    new_offsets: dict[str, str] = {}
+
+    for stream_key in sorted(pending_streams, key=get_stream_priority):
+        for message_id, packet_data in pending_streams[stream_key]:
+            if packet_data:
+                # Always send at least one message, however big
+                if num_messages and (
+                    num_bytes + len(packet_data) > settings.APP_POLL_MAX_BYTES
+                    or num_messages >= settings.APP_POLL_MAX_MESSAGES
+                ):
+                    return pending_data_chunks, new_offsets
+
+                pending_data_chunks.setdefault(stream_key, []).append(packet_data)
+                num_bytes += len(packet_data)
+                num_messages += 1
+
+            new_offsets[stream_key] = message_id
+
+    return pending_data_chunks, new_offsets
+
+
+async def _read_pending_messages_from_redis(
+    token_id: str,
+    stream_offsets: dict[str, str],
+) -> dict[str, PendingMessages]:
+    """Read the messages sent to some streams after the given offsets"""
+    streams = await glob.redis.xread(
+        stream_offsets,  # type: ignore[arg-type]
+        count=settings.APP_POLL_MAX_MESSAGES,
+    )
+
+    excluded_token_id = f",{token_id},"
+    pending_streams: dict[str, PendingMessages] = {}
+
+    for raw_stream_key, messages in streams:
+        pending_messages: PendingMessages = []
+        for raw_message_id, fields in messages:
+            excluded_token_ids = fields.get(b"excluded_token_ids", b"").decode()
+            if excluded_token_id in f",{excluded_token_ids},":
+                pending_messages.append((raw_message_id.decode(), b""))
+            else:
+                pending_messages.append(
+                    (raw_message_id.decode(), fields[b"packet_data"])
+                )
+        pending_streams[raw_stream_key.decode()] = pending_messages
+
+    return pending_streams
+
+
+# How long the watcher blocks for, at most; streams of newly held polls are
+# only watched from its next read, though no messages are missed meanwhile.
+WATCH_BLOCK_MS = 100
+WATCH_BATCH_SIZE = 100
+
+
+class _StreamWatcher:
+    """\
+    Wakes up held polls when streams not served by the broadcast cache get
+    new messages, with a single blocking read for all of this process' polls.
+    """
+
+    def __init__(self) -> None:
+        # {stream key: id of the latest message seen}
+        self._cursors: dict[str, str] = {}
+        # {stream key: {event: offset of its waiter}}
+        self._waiters: dict[str, dict[asyncio.Event, str]] = {}
+        self._has_waiters = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def add_waiter(
+        self,
+        stream_offsets: Mapping[str, str],
+        event: asyncio.Event,
+    ) -> None:
+        """Set `event` once any of the streams has messages after its offset"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        for stream_key, offset in stream_offsets.items():
+            self._waiters.setdefault(stream_key, {})[event] = offset
+
+            cursor = self._cursors.get(stream_key)
+            if cursor is None or parse_message_id(offset) < parse_message_id(cursor):
+                self._cursors[stream_key] = offset
+
+        self._has_waiters.set()
 
-    for stream_key, stream_data in data:
-        message_id: bytes | None = None
-        for message_id, fields in stream_data:
-            excluded_token_ids = fields[b"excluded_token_ids"].decode().split(",")
-            if token_id in excluded_token_ids:
+    def remove_waiter(self, stream_keys: Iterable[str], event: asyncio.Event) -> None:
+        for stream_key in stream_keys:
+            waiters = self._waiters.get(stream_key)
+            if waiters is None:
                 continue
 
-            pending_data += fields[b"packet_data"]
+            waiters.pop(event, None)
+            if not waiters:
+                del self._waiters[stream_key]
+                del self._cursors[stream_key]
 
-        if message_id is not None:
-            new_stream_offsets[stream_key.decode()] = message_id.decode()
+        if not self._waiters:
+            self._has_waiters.clear()
 
-    if new_stream_offsets:
-        await _set_token_stream_offsets(token_id, new_stream_offsets)
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._has_waiters.wait()
 
-    return pending_data
+                streams = await glob.redis.xread(
+                    dict(self._cursors),  # type: ignore[arg-type]
+                    count=WATCH_BATCH_SIZE,
+                    block=WATCH_BLOCK_MS,
+                )
+                for raw_stream_key, messages in streams:
+                    stream_key = raw_stream_key.decode()
+                    if stream_key not in self._cursors:
+                        continue
 
+                    last_message_id = messages[-1][0].decode()
+                    self._cursors[stream_key] = last_message_id
 
-async def get_latest_message_id(stream_name: str) -> str:
-    data = await glob.redis.xrevrange(make_key(stream_name), count=1)
-    if not data:
-        return "0-0"
-    message_id: bytes = data[0][0]
-    return message_id.decode()
+                    for event, offset in self._waiters[stream_key].items():
+                        if parse_message_id(last_message_id) > parse_message_id(
+                            offset,
+                        ):
+                            event.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("An error occurred while watching streams")
+                await asyncio.sleep(1)
 
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+_stream_watcher = _StreamWatcher()
+
+
+async def wait_for_new_messages(token_id: str, timeout: float) -> bool:
+    """
+    Wait until any of the token's streams has new messages, or `timeout`
+
+    Streams served by the broadcast cache are watched through it, and the
+    others by this process' stream watcher, so waiting holds no connection.
+    """
+    stream_offsets = {
+        stream_key.decode(): stream_offset.decode()
+        for stream_key, stream_offset in (
+            await glob.redis.hgetall(f"bancho:tokens:{token_id}:stream_offsets")
+        ).items()
+    }
+    if not stream_offsets:
+        return False
+
+    cached_stream_offsets: dict[str, str] = {}
+    if glob.broadcast_cache is not None:
+        for stream_key in glob.broadcast_cache.get_cached_stream_keys():
+            if stream_key in stream_offsets:
+                cached_stream_offsets[stream_key] = stream_offsets.pop(stream_key)
+
+    new_messages = asyncio.Event()
+    if cached_stream_offsets:
+        assert glob.broadcast_cache is not None
+        glob.broadcast_cache.add_waiter(cached_stream_offsets, new_messages)
+    if stream_offsets:
+        _stream_watcher.add_waiter(stream_offsets, new_messages)
+
+    try:
+        await asyncio.wait_for(new_messages.wait(), timeout=timeout)
+        return True
+    except TimeoutError:
+        return False
+    finally:
+        if cached_stream_offsets:
+            assert glob.broadcast_cache is not None
+            glob.broadcast_cache.remove_waiter(cached_stream_offsets, new_messages)
+        if stream_offsets:
+            _stream_watcher.remove_waiter(stream_offsets, new_messages)
+
+
+async def get_latest_message_ids(stream_name: str) -> dict[str, str]:
+    """
+    Get the latest message id of each of a stream's physical streams
+
+    :return: {physical stream key: latest message id}
+    """
+    stream_keys = [
+        make_key(physical_stream_name)
+        for physical_stream_name in get_physical_stream_names(stream_name)
+    ]
+
+    async with glob.redis.pipeline() as pipe:
+        for stream_key in stream_keys:
+            await pipe.xrevrange(stream_key, count=1)
+        latest_messages = await pipe.execute()
+
+    return {
+        stream_key: latest_message[0][0].decode() if latest_message else "0-0"
+        for stream_key, latest_message in zip(stream_keys, latest_messages)
+    }
+
+
+async def iter_stream_keys() -> AsyncIterator[str]:
+    async for stream_key in glob.redis.scan_iter(
+        match=make_key("*"),
+        count=1000,
+        _type="stream",
+    ):
+        yield stream_key.decode()
+
+
+async def expire_idle_stream(stream_key: str) -> int | None:
+    """
+    Trim & set an expiry on a stream which has none (i.e. one which hasn't
+    been written to since trimming moved to write time).
+
+    :return: number of messages trimmed, or None if the stream already expires
+    """
+    if await glob.redis.ttl(stream_key) != -1:
+        return None
+
+    stream_name = stream_key.removeprefix(STREAM_KEY_PREFIX).removesuffix(":messages")
+    retention_seconds = get_retention_seconds(stream_name)
+
+    async with glob.redis.pipeline(transaction=False) as pipe:
+        await pipe.xtrim(stream_key, minid=make_min_id(retention_seconds))
+        await pipe.expire(stream_key, retention_seconds)
+        num_messages: int
+        num_messages, _ = await pipe.execute()
 
-async def trim_stream_messages(stream_name: str, min_id: str) -> int:
-    num_messages: int = await glob.redis.xtrim(make_key(stream_name), minid=min_id)
     return num_messages
+
+
+def shutdown() -> None:
+    _stream_watcher.stop()
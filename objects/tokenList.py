@@ -46,11 +46,11 @@ async def addToken(
 
     token_stream_name = f"tokens/{original_token['token_id']}:messages"
     await streamList.add(token_stream_name)
-    await osuToken.joinStream(original_token["token_id"], token_stream_name)
 
-    await osuToken.joinStream(original_token["token_id"], "main")
+    stream_names = [token_stream_name, "main"]
     if osuToken.is_staff(original_token["privileges"]):
-        await osuToken.joinStream(original_token["token_id"], "staff")
+        stream_names.append("staff")
+    await osuToken.join_many(original_token["token_id"], stream_names)
 
     token = await osuToken.get_token(original_token["token_id"])
     assert token is not None
@@ -107,13 +107,8 @@ async def deleteOldTokens(userID: int) -> None:
     :return:
     """
     # Delete older tokens
-    delete: list[osuToken.Token] = []
-    for token in await osuToken.get_tokens():
-        if token["user_id"] == userID:
-            delete.append(token)
-
-    for i in delete:
-        await logoutEvent.handle(i)
+    for token in await osuToken.get_all_tokens_by_user_id(userID):
+        await logoutEvent.handle(token)
 
 
 async def multipleEnqueue(packet: bytes, who: list[int], but: bool = False) -> None:
@@ -125,15 +120,15 @@ async def multipleEnqueue(packet: bytes, who: list[int], but: bool = False) -> N
     :param but: if True, enqueue to everyone but users in `who` array
     :return:
     """
-    for value in await osuToken.get_tokens():
-        shouldEnqueue = False
-        if value["user_id"] in who and not but:
-            shouldEnqueue = True
-        elif value["user_id"] not in who and but:
-            shouldEnqueue = True
-
-        if shouldEnqueue:
-            await osuToken.enqueue(value["token_id"], packet)
+    token_ids: set[str] = set()
+    for user_id in who:
+        token_ids |= await osuToken.get_token_ids_by_user_id(user_id)
+
+    if but:
+        token_ids = await osuToken.get_token_ids() - token_ids
+
+    for token_id in token_ids:
+        await osuToken.enqueue(token_id, packet)
 
 
 async def enqueueAll(packet: bytes) -> None:
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from common.log import logger
+from common.redis.pubsubs import AbstractPubSubHandler
+from objects import glob
+
+
+class ChangePasswordPubSubHandler(AbstractPubSubHandler):
+    async def handle(self, raw_data: bytes) -> None:
+        userID = int(raw_data.decode("utf-8"))
+
+        logger.info(
+            "Handling change password event for user",
+            extra={"user_id": userID},
+        )
+
+        glob.bcrypt_cache.invalidate(userID)
+
+        logger.info(
+            "Successfully handled change password event for user",
+            extra={"user_id": userID},
+        )
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark poll throughput & latency under each supported event loop.
+
+Simulates clients polling their inbox (as `/` does for every osu! client)
+while messages are broadcast to their stream, against the redis set up in
+.env. Each event loop is benchmarked in a fresh process.
+
+usage: python3 scripts/benchmark_event_loops.py [--clients N] [--duration S]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(1, os.path.join(sys.path[0], ".."))
+
+import settings
+from common import runtime
+from common.redis import command_counting
+from objects import glob
+from objects import stream_messages
+
+BROADCASTS_PER_SECOND = 100
+PACKET_DATA = b"\x00" * 64
+
+
+def make_token_stream_offsets_key(token_id: str) -> str:
+    return f"bancho:tokens:{token_id}:stream_offsets"
+
+
+async def _poll(token_id: str, deadline: float, latencies: list[float]) -> None:
+    while time.perf_counter() < deadline:
+        start_time = time.perf_counter()
+        await stream_messages.read_all_pending_data(token_id)
+        latencies.append(time.perf_counter() - start_time)
+
+
+async def _broadcast(stream_name: str, deadline: float) -> None:
+    while time.perf_counter() < deadline:
+        await stream_messages.broadcast_data(stream_name, PACKET_DATA)
+        await asyncio.sleep(1 / BROADCASTS_PER_SECOND)
+
+
+async def benchmark(num_clients: int, duration: float) -> dict[str, object]:
+    glob.redis = command_counting.CountingRedis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        password=settings.REDIS_PASS,
+        username=settings.REDIS_USER,
+        ssl=settings.REDIS_USE_SSL,
+        max_connections=num_clients + 1,
+    )
+
+    stream_name = f"benchmark/{uuid4().hex}"
+    stream_key = stream_messages.make_key(stream_name)
+    token_ids = [f"benchmark-{uuid4().hex}" for _ in range(num_clients)]
+
+    async with glob.redis.pipeline() as pipe:
+        for token_id in token_ids:
+            await pipe.hset(make_token_stream_offsets_key(token_id), stream_key, "0-0")
+        await pipe.execute()
+
+    latencies: list[float] = []
+    try:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            _broadcast(stream_name, deadline),
+            *(_poll(token_id, deadline, latencies) for token_id in token_ids),
+        )
+    finally:
+        await glob.redis.delete(
+            stream_key,
+            *(make_token_stream_offsets_key(token_id) for token_id in token_ids),
+        )
+        await glob.redis.close()
+
+    latencies.sort()
+    return {
+        # the loop actually used, in case of falling back to asyncio
+        "event_loop": type(asyncio.get_running_loop()).__module__.split(".")[0],
+        "polls": len(latencies),
+        "polls_per_second": round(len(latencies) / duration),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+
+        async def run_child() -> int:
+            print(json.dumps(await benchmark(args.clients, args.duration)))
+            return 0
+
+        return runtime.run(run_child)
+
+    for event_loop in runtime.EVENT_LOOPS:
+        if event_loop == "uvloop" and runtime.uvloop is None:
+            print("uvloop: not installed, skipped")
+            continue
+
+        result = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--child",
+                f"--clients={args.clients}",
+                f"--duration={args.duration}",
+            ],
+            env={**os.environ, "APP_EVENT_LOOP": event_loop},
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        stats = json.loads(result.stdout.splitlines()[-1])
+        print(
+            f"{stats['event_loop']}: {stats['polls_per_second']} polls/s, "
+            f"p50 {stats['p50_ms']}ms, p99 {stats['p99_ms']}ms "
+            f"({args.clients} clients, {stats['polls']} polls)",
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -14,10 +14,20 @@ def read_bool(val: str) -> bool:
 APP_ENV = os.environ["APP_ENV"]
 APP_COMPONENT = os.environ["APP_COMPONENT"]
 APP_PORT = int(os.environ["APP_PORT"])
+APP_WORKERS = int(os.environ["APP_WORKERS"])
+APP_EVENT_LOOP = os.environ["APP_EVENT_LOOP"]
 APP_GZIP = read_bool(os.environ["APP_GZIP"])
 APP_GZIP_LEVEL = int(os.environ["APP_GZIP_LEVEL"])
+APP_GZIP_MIN_SIZE = int(os.environ["APP_GZIP_MIN_SIZE"])
+APP_GZIP_OFFLOAD_SIZE = int(os.environ["APP_GZIP_OFFLOAD_SIZE"])
+APP_GZIP_WORKERS = int(os.environ["APP_GZIP_WORKERS"])
 APP_CI_KEY = os.environ["APP_CI_KEY"]
 APP_API_KEY = os.environ["APP_API_KEY"]
+APP_LONG_POLL_ENABLED = read_bool(os.environ["APP_LONG_POLL_ENABLED"])
+APP_LONG_POLL_TIMEOUT = float(os.environ["APP_LONG_POLL_TIMEOUT"])
+APP_LONG_POLL_MAX_HELD = int(os.environ["APP_LONG_POLL_MAX_HELD"])
+APP_POLL_MAX_BYTES = int(os.environ["APP_POLL_MAX_BYTES"])
+APP_POLL_MAX_MESSAGES = int(os.environ["APP_POLL_MAX_MESSAGES"])
 
 DB_HOST = os.environ["DB_HOST"]
 DB_PORT = int(os.environ["DB_PORT"])
@@ -58,4 +68,13 @@ AMQP_PASS = os.environ["AMQP_PASS"]
 AMQP_HOST = os.environ["AMQP_HOST"]
 AMQP_PORT = int(os.environ["AMQP_PORT"])
 
+BCRYPT_WORKERS = int(os.environ["BCRYPT_WORKERS"])
+BCRYPT_CACHE_MAX_ENTRIES = int(os.environ["BCRYPT_CACHE_MAX_ENTRIES"])
+BCRYPT_CACHE_TTL = int(os.environ["BCRYPT_CACHE_TTL"])
+
+BROADCAST_CACHE_ENABLED = read_bool(os.environ["BROADCAST_CACHE_ENABLED"])
+BROADCAST_CACHE_MAX_MESSAGES = int(os.environ["BROADCAST_CACHE_MAX_MESSAGES"])
+
+MATCH_PACKET_CACHE_MAX_ENTRIES = int(os.environ["MATCH_PACKET_CACHE_MAX_ENTRIES"])
+
 BANCHO_LOGIN_ROUTING_KEYS = os.environ["BANCHO_LOGIN_ROUTING_KEYS"].split(",")
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import os
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import fakeredis
+import pytest
+from dotenv import dotenv_values
+
+# settings are read from the environment on import
+for key, value in dotenv_values(Path(__file__).parent.parent / ".env.example").items():
+    os.environ.setdefault(key, value or "")
+for key in ("AMQP_HOST", "AMQP_USER", "AMQP_PASS", "BANCHO_LOGIN_ROUTING_KEYS"):
+    os.environ.setdefault(key, "")
+os.environ.setdefault("AMQP_PORT", "5672")
+
+# objects.osuToken and objects.match import each other (through the chat
+# helpers); entering the cycle from serverPackets resolves it, as the app does
+from constants import serverPackets  # noqa: E402,F401
+from objects import glob  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis() -> AsyncIterator[fakeredis.FakeAsyncRedis]:
+    """A fresh, empty redis for each test, as `glob.redis`"""
+    glob.redis = fakeredis.FakeAsyncRedis()
+    yield glob.redis
+    await glob.redis.aclose()
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import itertools
+
+import fakeredis
+import pytest
+
+from objects import glob
+from objects import match
+from objects.matchPacketCache import MatchPacketCache
+
+
+@pytest.fixture
+async def match_id(
+    monkeypatch: pytest.MonkeyPatch,
+    redis: fakeredis.FakeAsyncRedis,
+) -> int:
+    """An empty match, with an empty packet cache; its database rows are skipped"""
+    match_ids = itertools.count(1)
+
+    async def insert_match(match_name: str, match_history_private: bool) -> int:
+        return next(match_ids)
+
+    async def insert_match_event(*args: object, **kwargs: object) -> None:
+        pass
+
+    monkeypatch.setattr(match, "insert_match", insert_match)
+    monkeypatch.setattr(match, "insert_match_event", insert_match_event)
+    monkeypatch.setattr(glob, "match_packet_cache", MatchPacketCache(max_entries=2))
+
+    multiplayer_match = await match.create_match(
+        match_name="match",
+        match_password="",
+        beatmap_id=0,
+        beatmap_name="",
+        beatmap_md5="",
+        game_mode=0,
+        host_user_id=1000,
+        mods=0,
+        match_scoring_type=0,
+        match_team_type=0,
+        match_mod_mode=0,
+        seed=0,
+        is_tourney=False,
+        is_locked=False,
+        is_starting=False,
+        is_timer_running=False,
+        is_in_progress=False,
+        creation_time=0.0,
+        current_game_id=None,
+    )
+    return multiplayer_match["match_id"]
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import pytest
+
+from objects import bcryptCache
+from objects.bcryptCache import BcryptCache
+
+
+def freeze_time(monkeypatch: pytest.MonkeyPatch, current_time: float) -> None:
+    monkeypatch.setattr(bcryptCache.time, "monotonic", lambda: current_time)
+
+
+def test_get_verified_password(monkeypatch: pytest.MonkeyPatch) -> None:
+    freeze_time(monkeypatch, 0)
+    cache = BcryptCache(max_entries=2, ttl=60)
+    cache.set(1000, b"hash", b"md5")
+
+    assert cache.get(1000, b"hash") == b"md5"
+    assert cache.get(1001, b"hash") is None
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_entries_expire(monkeypatch: pytest.MonkeyPatch) -> None:
+    freeze_time(monkeypatch, 0)
+    cache = BcryptCache(max_entries=2, ttl=60)
+    cache.set(1000, b"hash", b"md5")
+    freeze_time(monkeypatch, 60)
+
+    assert cache.get(1000, b"hash") is None
+    assert cache.get_stats()["expirations"] == 1
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_changed_password_invalidates_the_entry(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    freeze_time(monkeypatch, 0)
+    cache = BcryptCache(max_entries=2, ttl=60)
+    cache.set(1000, b"hash", b"md5")
+
+    assert cache.get(1000, b"new hash") is None
+    assert cache.get(1000, b"hash") is None
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_evicts_the_least_recently_used_user(monkeypatch: pytest.MonkeyPatch) -> None:
+    freeze_time(monkeypatch, 0)
+    cache = BcryptCache(max_entries=2, ttl=60)
+    cache.set(1000, b"hash", b"md5")
+    cache.set(1001, b"hash", b"md5")
+    cache.get(1000, b"hash")
+    cache.set(1002, b"hash", b"md5")
+
+    assert cache.get(1000, b"hash") == b"md5"
+    assert cache.get(1001, b"hash") is None
+    assert cache.get(1002, b"hash") == b"md5"
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_memory_bytes_follow_the_entries(monkeypatch: pytest.MonkeyPatch) -> None:
+    freeze_time(monkeypatch, 0)
+    cache = BcryptCache(max_entries=2, ttl=60)
+    cache.set(1000, b"hash", b"md5")
+    cache.set(1000, b"new hash", b"md5")
+
+    assert cache.get_stats()["memory_bytes"] == len(b"new hash") + len(b"md5")
+
+    cache.invalidate(1000)
+
+    assert cache.get_stats()["memory_bytes"] == 0
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator
+
+import anyio
+import fakeredis
+import pytest
+
+from objects import broadcastCache
+from objects import glob
+from objects import stream_messages
+from objects.broadcastCache import BroadcastCache
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("redis")]
+
+STREAM_KEY = stream_messages.make_key("lobby")
+
+
+@pytest.fixture
+async def cache(
+    monkeypatch: pytest.MonkeyPatch,
+    redis: fakeredis.FakeAsyncRedis,
+) -> AsyncIterator[BroadcastCache]:
+    """A cache of `STREAM_KEY`, tailing it in the background"""
+    monkeypatch.setattr(broadcastCache, "TAIL_BLOCK_MS", 10)
+
+    async def get_stream_keys() -> list[str]:
+        return [STREAM_KEY]
+
+    cache = BroadcastCache(get_stream_keys, max_messages=2)
+    task = asyncio.create_task(cache.run())
+    while not cache.get_cached_stream_keys():
+        await asyncio.sleep(0.01)
+
+    yield cache
+
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+async def add_message(packet_data: bytes, excluded_token_ids: str = "") -> str:
+    message_id = await glob.redis.xadd(
+        STREAM_KEY,
+        {"packet_data": packet_data, "excluded_token_ids": excluded_token_ids},
+    )
+    return message_id.decode()
+
+
+async def wait_for_message(cache: BroadcastCache, offset: str) -> None:
+    event = asyncio.Event()
+    cache.add_waiter({STREAM_KEY: offset}, event)
+    with anyio.fail_after(1):
+        await event.wait()
+    cache.remove_waiter([STREAM_KEY], event)
+
+
+async def test_read_messages_after_the_offset(cache: BroadcastCache) -> None:
+    first_message_id = await add_message(b"first")
+    second_message_id = await add_message(b"second", excluded_token_ids="a,b")
+    await wait_for_message(cache, first_message_id)
+
+    assert cache.read(STREAM_KEY, "0-0", "a") == [
+        (first_message_id, b"first"),
+        (second_message_id, b""),
+    ]
+    assert cache.read(STREAM_KEY, first_message_id, "c") == [
+        (second_message_id, b"second"),
+    ]
+    assert cache.read(STREAM_KEY, second_message_id, "c") == []
+
+
+async def test_read_messages_no_longer_cached(cache: BroadcastCache) -> None:
+    first_message_id = await add_message(b"first")
+    second_message_id = await add_message(b"second")
+    third_message_id = await add_message(b"third")
+    await wait_for_message(cache, second_message_id)
+
+    # only the last 2 messages are kept
+    assert cache.read(STREAM_KEY, "0-0", "a") is None
+    assert cache.read(STREAM_KEY, first_message_id, "a") == [
+        (second_message_id, b"second"),
+        (third_message_id, b"third"),
+    ]
+
+
+async def test_read_messages_before_the_stream_was_cached(
+    cache: BroadcastCache,
+) -> None:
+    assert cache.read(stream_messages.make_key("main"), "0-0", "a") is None
+    assert cache.get_stats()["misses"] == 1
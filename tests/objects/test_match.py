@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import orjson
+import pytest
+
+from constants import packetIDs
+from constants import slotStatuses
+from helpers import packetHelper
+from objects import glob
+from objects import match
+from objects import osuToken
+from objects import slot
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("redis")]
+
+
+async def create_token(user_id: int = 1000) -> osuToken.Token:
+    return await osuToken.create_token(
+        user_id=user_id,
+        username=f"user{user_id}",
+        privileges=3,
+        whitelist=0,
+        ip="127.0.0.1",
+        utc_offset=0,
+        tournament=False,
+        block_non_friends_dm=False,
+        amplitude_device_id=None,
+    )
+
+
+async def test_migrate_legacy_matches(match_id: int) -> None:
+    match_with_slots = await match.get_match_with_slots(match_id)
+    assert match_with_slots is not None
+    multiplayer_match, slots = match_with_slots
+    slots[0]["user_id"] = 1000
+
+    # the legacy layout: a json string for the match, and one for each slot
+    await glob.redis.delete(match.make_key(match_id))
+    await glob.redis.set(match.make_key(match_id), orjson.dumps(multiplayer_match))
+    for slot_id, _slot in enumerate(slots):
+        await glob.redis.set(
+            f"bancho:matches:{match_id}:slots:{slot_id}",
+            orjson.dumps(_slot),
+        )
+
+    await match.migrate_legacy_matches()
+
+    assert await match.get_match_with_slots(match_id) == (multiplayer_match, slots)
+    assert not await glob.redis.keys(f"bancho:matches:{match_id}:slots:*")
+
+    # already migrated matches are left alone
+    await slot.update_slot(match_id, 0, mods=64)
+    await match.migrate_legacy_matches()
+
+    migrated_slot = await slot.get_slot(match_id, 0)
+    assert migrated_slot is not None
+    assert migrated_slot["mods"] == 64
+
+
+async def test_get_match_packet_data_is_cached_per_version(match_id: int) -> None:
+    match_packet_data = await match.get_match_packet_data(match_id)
+
+    assert match_packet_data is not None
+    assert await match.get_match_packet_data(match_id) is match_packet_data
+
+    await match.update_match(match_id, mods=64)
+    updated_match_packet_data = await match.get_match_packet_data(match_id)
+
+    assert updated_match_packet_data is not None
+    assert updated_match_packet_data.version > match_packet_data.version
+    assert updated_match_packet_data.uncensored != match_packet_data.uncensored
+
+
+async def test_get_match_packet_data_after_a_user_token_is_deleted(
+    match_id: int,
+) -> None:
+    token = await create_token()
+    await slot.update_slot(
+        match_id,
+        0,
+        status=slotStatuses.NOT_READY,
+        user_id=token["user_id"],
+        user_token=token["token_id"],
+    )
+    await osuToken.update_token(token["token_id"], match_id=match_id)
+    match_packet_data = await match.get_match_packet_data(match_id)
+
+    await osuToken.delete_token(token["token_id"])
+    updated_match_packet_data = await match.get_match_packet_data(match_id)
+
+    # the user's id is left out of the packet once their token is gone
+    assert match_packet_data is not None
+    assert updated_match_packet_data is not None
+    assert updated_match_packet_data.version > match_packet_data.version
+    assert len(updated_match_packet_data.uncensored) == (
+        len(match_packet_data.uncensored) - 4
+    )
+
+
+async def test_get_match_packet_data_deleted_match(match_id: int) -> None:
+    await match.get_match_packet_data(match_id)
+    await match.delete_match(match_id)
+
+    assert await match.get_match_packet_data(match_id) is None
+
+
+async def test_update_lobby_snapshot_keeps_a_newer_version(match_id: int) -> None:
+    match_packet_data = await match.get_match_packet_data(match_id)
+    await match.update_match(match_id, mods=64)
+    updated_match_packet_data = await match.get_match_packet_data(match_id)
+    assert match_packet_data is not None
+    assert updated_match_packet_data is not None
+
+    await match.update_lobby_snapshot(match_id, updated_match_packet_data)
+    await match.update_lobby_snapshot(match_id, match_packet_data)
+
+    assert await match.get_lobby_snapshot() == packetHelper.build_packet_from_body(
+        packetIDs.server_newMatch,
+        updated_match_packet_data.censored,
+    )
+
+
+async def test_update_lobby_snapshot_deleted_match(match_id: int) -> None:
+    match_packet_data = await match.get_match_packet_data(match_id)
+    assert match_packet_data is not None
+    await match.delete_match(match_id)
+
+    await match.update_lobby_snapshot(match_id, match_packet_data)
+
+    assert await match.get_lobby_snapshot() == b""
+
+
+async def test_rebuild_lobby_snapshot(match_id: int) -> None:
+    await glob.redis.hset(match.LOBBY_PACKETS_KEY, match_id + 1, b"stale")
+    await glob.redis.hset(match.LOBBY_VERSIONS_KEY, match_id + 1, 1)
+
+    await match.rebuild_lobby_snapshot()
+
+    match_packet_data = await match.get_match_packet_data(match_id)
+    assert match_packet_data is not None
+    assert await match.get_lobby_snapshot() == packetHelper.build_packet_from_body(
+        packetIDs.server_newMatch,
+        match_packet_data.censored,
+    )
+    assert await glob.redis.hkeys(match.LOBBY_VERSIONS_KEY) == [b"%d" % match_id]
+
+
+async def test_set_live_score(match_id: int) -> None:
+    assert await match.set_live_score(match_id, 3, score=1000, failed=True)
+
+    assert await glob.redis.hgetall(match.make_live_scores_key(match_id)) == {
+        b"3:score": b"1000",
+        b"3:failed": b"1",
+    }
+
+
+async def test_set_live_score_deleted_match(match_id: int) -> None:
+    await match.delete_match(match_id)
+
+    assert not await match.set_live_score(match_id, 3, score=1000, failed=False)
+    assert not await glob.redis.exists(match.make_live_scores_key(match_id))
+
+
+async def test_delete_match_deletes_live_scores(match_id: int) -> None:
+    await match.set_live_score(match_id, 3, score=1000, failed=False)
+
+    await match.delete_match(match_id)
+
+    assert not await glob.redis.exists(match.make_live_scores_key(match_id))
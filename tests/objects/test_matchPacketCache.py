@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from objects.matchPacketCache import MatchPacketCache
+from objects.matchPacketCache import MatchPacketData
+
+
+def make_packet_data(version: int) -> MatchPacketData:
+    return MatchPacketData(
+        version=version,
+        uncensored=b"uncensored",
+        censored=b"censored",
+    )
+
+
+def test_get_only_returns_the_requested_version() -> None:
+    cache = MatchPacketCache(max_entries=2)
+    cache.set(1, make_packet_data(version=2))
+
+    assert cache.get(1, 2) == make_packet_data(version=2)
+    assert cache.get(1, 3) is None
+    assert cache.get(2, 2) is None
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["misses"] == 2
+
+
+def test_set_keeps_a_newer_version() -> None:
+    cache = MatchPacketCache(max_entries=2)
+    cache.set(1, make_packet_data(version=3))
+    cache.set(1, make_packet_data(version=2))
+
+    assert cache.get(1, 3) == make_packet_data(version=3)
+
+
+def test_evicts_the_least_recently_used_match() -> None:
+    cache = MatchPacketCache(max_entries=2)
+    cache.set(1, make_packet_data(version=1))
+    cache.set(2, make_packet_data(version=1))
+    cache.get(1, 1)
+    cache.set(3, make_packet_data(version=1))
+
+    assert cache.get(1, 1) is not None
+    assert cache.get(2, 1) is None
+    assert cache.get(3, 1) is not None
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_invalidate() -> None:
+    cache = MatchPacketCache(max_entries=2)
+    cache.set(1, make_packet_data(version=1))
+    cache.invalidate(1)
+
+    assert cache.get(1, 1) is None
+    assert cache.get_stats()["entries"] == 0
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from objects import migrations
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("redis")]
+
+
+async def test_run_once_runs_a_migration_once() -> None:
+    runs = 0
+
+    async def migrate() -> None:
+        nonlocal runs
+        runs += 1
+
+    await migrations.run_once("test", migrate)
+    await migrations.run_once("test", migrate)
+
+    assert runs == 1
+
+
+async def test_run_once_waits_for_another_process_to_finish(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(migrations, "MIGRATION_POLL_INTERVAL", 0.01)
+    events: list[str] = []
+
+    async def slow_migrate() -> None:
+        events.append("started")
+        await asyncio.sleep(0.1)
+        events.append("finished")
+
+    async def migrate() -> None:
+        events.append("ran again")
+
+    async def run_later() -> None:
+        await asyncio.sleep(0.02)
+        await migrations.run_once("test", migrate)
+        events.append("returned")
+
+    await asyncio.gather(migrations.run_once("test", slow_migrate), run_later())
+
+    assert events == ["started", "finished", "returned"]
+
+
+async def test_run_once_releases_a_failed_migration() -> None:
+    async def failing_migrate() -> None:
+        raise RuntimeError("migration failed")
+
+    runs = 0
+
+    async def migrate() -> None:
+        nonlocal runs
+        runs += 1
+
+    with pytest.raises(RuntimeError):
+        await migrations.run_once("test", failing_migrate)
+    await migrations.run_once("test", migrate)
+
+    assert runs == 1
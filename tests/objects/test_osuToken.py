@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from time import time
+
+import orjson
+import pytest
+
+from objects import glob
+from objects import osuToken
+from objects import stream_messages
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("redis")]
+
+
+async def create_token(user_id: int = 1000, privileges: int = 3) -> osuToken.Token:
+    return await osuToken.create_token(
+        user_id=user_id,
+        username=f"user{user_id}",
+        privileges=privileges,
+        whitelist=0,
+        ip="127.0.0.1",
+        utc_offset=0,
+        tournament=False,
+        block_non_friends_dm=False,
+        amplitude_device_id=None,
+    )
+
+
+async def test_update_token_does_not_resurrect_a_deleted_token() -> None:
+    token = await create_token()
+    await osuToken.delete_token(token["token_id"])
+
+    updated_token = await osuToken.update_token(token["token_id"], away_message="afk")
+
+    assert updated_token is None
+    assert await osuToken.get_token(token["token_id"]) is None
+
+
+async def test_update_token_writes_only_the_given_fields() -> None:
+    token = await create_token()
+
+    updated_token = await osuToken.update_token(token["token_id"], away_message="afk")
+
+    assert updated_token is not None
+    assert updated_token["away_message"] == "afk"
+    assert updated_token["username"] == token["username"]
+
+
+async def test_migrate_legacy_tokens() -> None:
+    legacy_token = {
+        "token_id": "legacy",
+        "user_id": 1000,
+        "username": "user1000",
+        "privileges": 3,
+        "ping_time": time(),
+    }
+    await glob.redis.hset(
+        osuToken.LEGACY_TOKENS_KEY,
+        "legacy",
+        orjson.dumps(legacy_token),
+    )
+
+    await osuToken.migrate_legacy_tokens()
+
+    token = await osuToken.get_token("legacy")
+    assert token is not None
+    assert token["username"] == "user1000"
+    assert await osuToken.token_exists("legacy")
+    assert await osuToken.get_token_ids_by_user_id(1000) == {"legacy"}
+    assert await osuToken.get_online_user_ids() == {1000}
+    assert await osuToken.get_ping_time("legacy") == legacy_token["ping_time"]
+    assert not await glob.redis.exists(osuToken.LEGACY_TOKENS_KEY)
+
+
+async def test_migrate_legacy_tokens_in_batches(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(osuToken, "MIGRATION_BATCH_SIZE", 2)
+    for user_id in range(1000, 1005):
+        await glob.redis.hset(
+            osuToken.LEGACY_TOKENS_KEY,
+            str(user_id),
+            orjson.dumps(
+                {
+                    "token_id": str(user_id),
+                    "user_id": user_id,
+                    "privileges": 3,
+                    "ping_time": time(),
+                },
+            ),
+        )
+
+    await osuToken.migrate_legacy_tokens()
+
+    assert await osuToken.get_token_ids() == {str(i) for i in range(1000, 1005)}
+    assert not await glob.redis.exists(osuToken.LEGACY_TOKENS_KEY)
+
+
+async def test_presence_indexes_follow_privileges() -> None:
+    token = await create_token()
+
+    await osuToken.update_token(token["token_id"], privileges=0)
+    assert await osuToken.get_non_restricted_user_ids() == set()
+
+    await osuToken.update_token(token["token_id"], privileges=3)
+    assert await osuToken.get_non_restricted_user_ids() == {1000}
+
+
+async def test_deleted_tokens_leave_the_presence_indexes() -> None:
+    token = await create_token()
+    await osuToken.delete_token(token["token_id"])
+
+    # e.g. an update racing with the logout
+    await osuToken.update_token(token["token_id"], privileges=3)
+
+    assert await osuToken.get_online_user_ids() == set()
+    assert await osuToken.get_non_restricted_user_ids() == set()
+    assert await osuToken.get_token_ids_by_user_id(1000) == set()
+
+
+async def test_users_stay_online_until_their_last_token_is_deleted() -> None:
+    token = await create_token()
+    other_token = await create_token()
+
+    await osuToken.delete_token(token["token_id"])
+    assert await osuToken.get_online_user_ids() == {1000}
+
+    await osuToken.delete_token(other_token["token_id"])
+    assert await osuToken.get_online_user_ids() == set()
+
+
+async def test_backfill_presence_indexes() -> None:
+    token = await create_token()
+    restricted_token = await create_token(user_id=1001, privileges=0)
+    await glob.redis.delete(
+        osuToken.ONLINE_USER_IDS_KEY,
+        osuToken.NON_RESTRICTED_USER_IDS_KEY,
+        osuToken.make_user_token_ids_key(1000),
+        osuToken.make_user_token_ids_key(1001),
+    )
+
+    await osuToken.backfill_presence_indexes()
+
+    assert await osuToken.get_online_user_ids() == {1000, 1001}
+    assert await osuToken.get_non_restricted_user_ids() == {1000}
+    assert await osuToken.get_token_ids_by_user_id(1000) == {token["token_id"]}
+    assert await osuToken.get_token_ids_by_user_id(1001) == {
+        restricted_token["token_id"],
+    }
+
+
+async def test_inactive_tokens_are_found_by_ping_time() -> None:
+    token = await create_token()
+    inactive_token = await create_token(user_id=1001)
+    await osuToken.update_token(token["token_id"], ping_time=time())
+    await osuToken.update_token(inactive_token["token_id"], ping_time=time() - 600)
+
+    inactive_token_ids = await osuToken.get_inactive_token_ids(time() - 300)
+
+    assert inactive_token_ids == [inactive_token["token_id"]]
+
+
+async def test_ping_times_are_not_kept_for_deleted_tokens() -> None:
+    token = await create_token()
+    await osuToken.delete_token(token["token_id"])
+
+    await osuToken.updatePingTime(token["token_id"])
+
+    assert await osuToken.get_ping_time(token["token_id"]) is None
+
+
+async def test_backfill_ping_times() -> None:
+    token = await create_token()
+    await glob.redis.delete(osuToken.PING_TIMES_KEY)
+
+    await osuToken.backfill_ping_times()
+
+    assert await osuToken.get_ping_time(token["token_id"]) == token["ping_time"]
+
+
+async def test_reshard_stream_offsets(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(osuToken, "MIGRATION_BATCH_SIZE", 2)
+    unsharded_stream_key = stream_messages.make_key("main")
+    tokens = [await create_token(user_id=user_id) for user_id in range(1000, 1005)]
+    for token in tokens[:3]:
+        await glob.redis.hset(
+            f"{osuToken.make_key(token['token_id'])}:stream_offsets",
+            unsharded_stream_key,
+            "1-0",
+        )
+    await stream_messages.broadcast_data("main", b"data", shard_key=1)
+    latest_message_ids = await stream_messages.get_latest_message_ids("main")
+
+    await osuToken.reshard_stream_offsets("main")
+
+    for token in tokens:
+        stream_offsets = {
+            stream_key.decode(): offset.decode()
+            for stream_key, offset in (
+                await glob.redis.hgetall(
+                    f"{osuToken.make_key(token['token_id'])}:stream_offsets",
+                )
+            ).items()
+        }
+        assert unsharded_stream_key not in stream_offsets
+        for stream_key, latest_message_id in latest_message_ids.items():
+            if token in tokens[:3]:
+                assert stream_offsets[stream_key] == latest_message_id
+            else:
+                assert stream_key not in stream_offsets
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import pytest
+
+from objects import glob
+from objects import rateLimiter
+from objects.rateLimiter import RateLimit
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("redis")]
+
+RATE_LIMIT = RateLimit(max_hits=3, window=60)
+
+
+def freeze_time(monkeypatch: pytest.MonkeyPatch, current_time: float) -> None:
+    monkeypatch.setattr(rateLimiter, "time", lambda: current_time)
+
+
+async def test_hits_within_the_limit_are_allowed(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    freeze_time(monkeypatch, 6000)
+
+    results = [await rateLimiter.hit("test", 1000, RATE_LIMIT) for _ in range(4)]
+
+    assert results == [True, True, True, False]
+
+
+async def test_limits_are_per_name_and_subject(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    freeze_time(monkeypatch, 6000)
+    for _ in range(3):
+        await rateLimiter.hit("test", 1000, RATE_LIMIT)
+
+    assert await rateLimiter.hit("test", 1001, RATE_LIMIT)
+    assert await rateLimiter.hit("other", 1000, RATE_LIMIT)
+
+
+async def test_previous_window_is_weighted_by_its_overlap(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    freeze_time(monkeypatch, 6000)
+    for _ in range(3):
+        await rateLimiter.hit("test", 1000, RATE_LIMIT)
+
+    # halfway into the next window, half of the previous window's hits count
+    freeze_time(monkeypatch, 6090)
+    assert await rateLimiter.hit("test", 1000, RATE_LIMIT)
+    assert await rateLimiter.hit("test", 1000, RATE_LIMIT)
+    assert not await rateLimiter.hit("test", 1000, RATE_LIMIT)
+
+
+async def test_window_keys_expire(monkeypatch: pytest.MonkeyPatch) -> None:
+    freeze_time(monkeypatch, 6000)
+    await rateLimiter.hit("test", 1000, RATE_LIMIT)
+
+    ttl = await glob.redis.ttl(rateLimiter.make_key("test", 1000, 100))
+
+    assert 0 < ttl <= 2 * RATE_LIMIT.window
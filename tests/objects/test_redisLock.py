@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Iterator
+
+import anyio
+import pytest
+
+from objects import glob
+from objects import redisLock
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("redis")]
+
+
+@pytest.fixture(autouse=True)
+def release_notifier(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    """A release notifier for this test's event loop"""
+    monkeypatch.setattr(redisLock, "_release_notifier", redisLock._ReleaseNotifier())
+    yield
+    redisLock.shutdown()
+
+
+async def test_release_wakes_up_waiters() -> None:
+    lock = redisLock.redisLock("test")
+    await lock.acquire()
+
+    waiter = redisLock.redisLock("test")
+    acquired = asyncio.create_task(waiter.acquire())
+    await asyncio.sleep(0.05)
+    assert not acquired.done()
+
+    start_time = time.perf_counter()
+    await lock.release()
+    with anyio.fail_after(redisLock.MAX_NOTIFICATION_WAIT):
+        await acquired
+
+    # woken up by the release, rather than by retrying
+    assert time.perf_counter() - start_time < redisLock.MAX_NOTIFICATION_WAIT / 2
+    await waiter.release()
+
+
+async def test_release_keeps_a_lock_taken_over_after_expiry() -> None:
+    lock = redisLock.redisLock("test")
+    await lock.acquire()
+
+    # the lock expires, and someone else takes it
+    await glob.redis.delete("test")
+    other_lock = redisLock.redisLock("test")
+    await other_lock.acquire()
+
+    await lock.release()
+
+    assert await glob.redis.get("test") is not None
+    await other_lock.release()
+    assert await glob.redis.get("test") is None
+
+
+async def test_fair_lock_is_handed_over_in_order() -> None:
+    lock = redisLock.redisLock("test", fair=True)
+    await lock.acquire()
+
+    acquisitions: list[int] = []
+
+    async def acquire(waiter_id: int) -> None:
+        waiter = redisLock.redisLock("test", fair=True)
+        await waiter.acquire()
+        acquisitions.append(waiter_id)
+        await waiter.release()
+
+    waiters = []
+    for waiter_id in range(3):
+        waiters.append(asyncio.create_task(acquire(waiter_id)))
+        await asyncio.sleep(0.05)
+
+    await lock.release()
+    with anyio.fail_after(redisLock.MAX_NOTIFICATION_WAIT * 3):
+        await asyncio.gather(*waiters)
+
+    assert acquisitions == [0, 1, 2]
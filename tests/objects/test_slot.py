@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import pytest
+
+from constants import slotStatuses
+from objects import glob
+from objects import match
+from objects import slot
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("redis")]
+
+
+async def get_version(match_id: int) -> int:
+    return int(await glob.redis.hget(match.make_key(match_id), "version"))
+
+
+async def test_transition_slots_first_matching_slot(match_id: int) -> None:
+    result = await slot.transition_slots(
+        match_id,
+        [
+            {
+                "where": {"status": slotStatuses.FREE},
+                "first": True,
+                "set": {"status": slotStatuses.NOT_READY, "user_id": 1000},
+            },
+        ],
+    )
+
+    assert result is not None
+    assert result.applied
+    assert result.changed_slot_ids == [[0]]
+    assert result.slots[0]["user_id"] == 1000
+    assert result.slots[1]["status"] == slotStatuses.FREE
+    assert await slot.get_slots(match_id) == result.slots
+    assert await get_version(match_id) == 2
+
+
+async def test_transition_slots_match_the_slots_before_any_applied(
+    match_id: int,
+) -> None:
+    result = await slot.transition_slots(
+        match_id,
+        [
+            {"slot_id": 0, "set": {"status": slotStatuses.LOCKED}},
+            {"where": {"status": slotStatuses.LOCKED}, "set": {"mods": 64}},
+        ],
+    )
+
+    assert result is not None
+    assert result.changed_slot_ids == [[0], []]
+    assert result.slots[0]["status"] == slotStatuses.LOCKED
+    assert result.slots[0]["mods"] == 0
+
+
+async def test_transition_slots_where_not(match_id: int) -> None:
+    await slot.update_slot(match_id, 3, status=slotStatuses.LOCKED)
+
+    result = await slot.transition_slots(
+        match_id,
+        [{"where_not": {"status": slotStatuses.LOCKED}, "set": {"mods": 64}}],
+    )
+
+    assert result is not None
+    assert len(result.changed_slot_ids[0]) == slot.SLOT_COUNT - 1
+    assert 3 not in result.changed_slot_ids[0]
+    assert result.slots[3]["mods"] == 0
+
+
+async def test_transition_slots_required_transition_not_matched(
+    match_id: int,
+) -> None:
+    version = await get_version(match_id)
+
+    result = await slot.transition_slots(
+        match_id,
+        [
+            {"slot_id": 0, "set": {"status": slotStatuses.LOCKED}},
+            {"where": {"user_id": 1000}, "required": True, "set": {"mods": 64}},
+        ],
+    )
+
+    assert result is not None
+    assert not result.applied
+    assert result.slots[0]["status"] == slotStatuses.FREE
+    assert await slot.get_slots(match_id) == result.slots
+    assert await get_version(match_id) == version
+
+
+async def test_transition_slots_match_where(match_id: int) -> None:
+    transitions: list[slot.SlotTransition] = [
+        {"slot_id": 0, "set": {"status": slotStatuses.LOCKED}},
+    ]
+
+    result = await slot.transition_slots(
+        match_id,
+        transitions,
+        match_where={"is_in_progress": True},
+    )
+    assert result is not None
+    assert not result.applied
+
+    result = await slot.transition_slots(
+        match_id,
+        transitions,
+        match_where={"is_in_progress": False},
+    )
+    assert result is not None
+    assert result.applied
+    assert result.slots[0]["status"] == slotStatuses.LOCKED
+
+
+async def test_transition_slots_without_changes_keeps_the_version(
+    match_id: int,
+) -> None:
+    version = await get_version(match_id)
+
+    result = await slot.transition_slots(
+        match_id,
+        [{"where": {"user_id": 1000}, "set": {"mods": 64}}],
+    )
+
+    assert result is not None
+    assert result.applied
+    assert result.changed_slot_ids == [[]]
+    assert await get_version(match_id) == version
+
+
+async def test_transition_slots_deleted_match(match_id: int) -> None:
+    await match.delete_match(match_id)
+
+    result = await slot.transition_slots(
+        match_id,
+        [{"slot_id": 0, "set": {"status": slotStatuses.LOCKED}}],
+    )
+
+    assert result is None
+    assert not await glob.redis.exists(match.make_key(match_id))
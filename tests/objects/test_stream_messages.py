@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import pytest
+
+import settings
+from objects import glob
+from objects import osuToken
+from objects import stream_messages
+from objects import streamList
+
+pytestmark = [pytest.mark.anyio, pytest.mark.usefixtures("redis")]
+
+
+async def create_token(stream_names: list[str]) -> str:
+    token = await osuToken.create_token(
+        user_id=1000,
+        username="user1000",
+        privileges=3,
+        whitelist=0,
+        ip="127.0.0.1",
+        utc_offset=0,
+        tournament=False,
+        block_non_friends_dm=False,
+        amplitude_device_id=None,
+    )
+    token_id = token["token_id"]
+    for stream_name in [*stream_names, f"tokens/{token_id}:messages"]:
+        await streamList.add(stream_name)
+        await osuToken.joinStream(token_id, stream_name)
+    return token_id
+
+
+async def get_stream_offsets(token_id: str) -> dict[bytes, bytes]:
+    return await glob.redis.hgetall(f"bancho:tokens:{token_id}:stream_offsets")
+
+
+async def test_read_all_pending_data_reads_each_message_once() -> None:
+    token_id = await create_token(["lobby"])
+    await stream_messages.broadcast_data("lobby", b"lobby;")
+    await osuToken.enqueue(token_id, b"private;")
+
+    assert await stream_messages.read_all_pending_data(token_id) == (b"private;lobby;")
+    assert await stream_messages.read_all_pending_data(token_id) == b""
+
+
+async def test_read_all_pending_data_skips_excluded_messages() -> None:
+    token_id = await create_token(["lobby"])
+    await stream_messages.broadcast_data(
+        "lobby",
+        b"excluded;",
+        excluded_token_ids=[token_id],
+    )
+    await stream_messages.broadcast_data("lobby", b"included;")
+
+    assert await stream_messages.read_all_pending_data(token_id) == b"included;"
+    assert await stream_messages.read_all_pending_data(token_id) == b""
+
+
+async def test_read_all_pending_data_caps_messages_by_priority(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "APP_POLL_MAX_MESSAGES", 3)
+    token_id = await create_token(["lobby", "spect/1"])
+    for i in range(3):
+        await stream_messages.broadcast_data("spect/1", b"spect%d;" % i)
+    for i in range(2):
+        await stream_messages.broadcast_data("lobby", b"lobby%d;" % i)
+    await osuToken.enqueue(token_id, b"private;")
+
+    assert await stream_messages.read_all_pending_data(token_id) == (
+        b"private;lobby0;lobby1;"
+    )
+    assert await stream_messages.read_all_pending_data(token_id) == (
+        b"spect0;spect1;spect2;"
+    )
+    assert await stream_messages.read_all_pending_data(token_id) == b""
+
+
+async def test_read_all_pending_data_sends_one_oversized_message(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "APP_POLL_MAX_BYTES", 4)
+    token_id = await create_token(["lobby"])
+    await stream_messages.broadcast_data("lobby", b"oversized;")
+    await stream_messages.broadcast_data("lobby", b"next;")
+
+    assert await stream_messages.read_all_pending_data(token_id) == b"oversized;"
+    assert await stream_messages.read_all_pending_data(token_id) == b"next;"
+
+
+async def test_read_all_pending_data_reads_every_shard() -> None:
+    token_id = await create_token(["main"])
+    await stream_messages.broadcast_data("main", b"a;", shard_key=1)
+    await stream_messages.broadcast_data("main", b"b;", shard_key=2)
+
+    data = await stream_messages.read_all_pending_data(token_id)
+
+    assert sorted(data.split(b";")) == [b"", b"a", b"b"]
+
+
+async def test_left_streams_are_not_advanced() -> None:
+    token_id = await create_token(["lobby"])
+    await stream_messages.broadcast_data("lobby", b"lobby;")
+    await osuToken.leaveStream(token_id, "lobby")
+
+    assert await stream_messages.read_all_pending_data(token_id) == b""
+    assert stream_messages.make_key("lobby").encode() not in (
+        await get_stream_offsets(token_id)
+    )
+
+
+async def test_advance_stream_offsets_only_advances_unchanged_offsets() -> None:
+    token_id = await create_token(["lobby"])
+    stream_offsets_key = f"bancho:tokens:{token_id}:stream_offsets"
+    lobby_key = stream_messages.make_key("lobby")
+    await glob.redis.hset(stream_offsets_key, lobby_key, "2-0")
+
+    advanced = await stream_messages.ADVANCE_STREAM_OFFSETS_SCRIPT(
+        keys=[stream_offsets_key],
+        args=[lobby_key, "1-0", "3-0", lobby_key, "2-0", "4-0", "left", "1-0", "5-0"],
+    )
+
+    assert advanced == [0, 1, 0]
+    assert await glob.redis.hget(stream_offsets_key, lobby_key) == b"4-0"
+    assert not await glob.redis.hexists(stream_offsets_key, "left")
@@ -14,6 +14,7 @@ sys.path.insert(1, os.path.join(sys.path[0], "../.."))
 
 import lifecycle
 from common import exception_handling
+from common import runtime
 from common.log import logger
 from common.log import logging_config
 from constants import CHATBOT_USER_ID
@@ -21,6 +22,7 @@ from events import logoutEvent
 from objects import osuToken
 
 CRON_RUN_INTERVAL = 10 * 60  # seconds
+MAX_CONCURRENT_REVOCATIONS = 16
 
 SHUTDOWN_EVENT: asyncio.Event | None = None
 
@@ -34,48 +36,49 @@ def handle_shutdown_event(signum: int, frame: FrameType | None) -> None:
 signal.signal(signal.SIGTERM, handle_shutdown_event)
 
 
-async def _revoke_token_if_inactive(token: osuToken.Token) -> None:
-    oldest_ping_time = int(time.time()) - CRON_RUN_INTERVAL
+async def _revoke_token_if_inactive(token_id: str, oldest_ping_time: int) -> None:
+    token = await osuToken.get_token(token_id)
+    if token is None:
+        # Stale index entry, the token is already gone
+        await osuToken.remove_ping_time(token_id)
+        return
+
+    if token["user_id"] == CHATBOT_USER_ID or token["tournament"]:
+        return
+
+    # They may have pinged since we looked up the inactive tokens
+    ping_time = await osuToken.get_ping_time(token_id)
+    if ping_time is None or ping_time >= oldest_ping_time:
+        return
 
-    if (
-        token["ping_time"] < oldest_ping_time
-        and token["user_id"] != CHATBOT_USER_ID
-        and not token["tournament"]
-    ):
-        logger.info(
-            "Timing out inactive bancho session",
-            extra={
-                "username": token["username"],
-                "seconds_inactive": time.time() - token["ping_time"],
-            },
-        )
+    logger.info(
+        "Timing out inactive bancho session",
+        extra={
+            "username": token["username"],
+            "seconds_inactive": time.time() - ping_time,
+        },
+    )
 
-        await logoutEvent.handle(token)
+    await logoutEvent.handle(token)
 
 
 async def _timeout_inactive_users() -> None:
-    for token_id in await osuToken.get_token_ids():
-        token = None
-        try:
-            token = await osuToken.get_token(token_id)
-            if token is None:
-                continue
-
-            await _revoke_token_if_inactive(token)
-
-        except Exception:
-            logger.exception(
-                "An error occurred while disconnecting a timed out client",
-                extra={
-                    "token_id": token_id,
-                    "user_id": token["user_id"] if token else None,
-                    "ping_time": token["ping_time"] if token else None,
-                    "time_since_last_ping": (
-                        time.time() - token["ping_time"] if token else None
-                    ),
-                    "tournament": token["tournament"] if token else None,
-                },
-            )
+    oldest_ping_time = int(time.time()) - CRON_RUN_INTERVAL
+    token_ids = await osuToken.get_inactive_token_ids(oldest_ping_time)
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REVOCATIONS)
+
+    async def revoke_token(token_id: str) -> None:
+        async with semaphore:
+            try:
+                await _revoke_token_if_inactive(token_id, oldest_ping_time)
+            except Exception:
+                logger.exception(
+                    "An error occurred while disconnecting a timed out client",
+                    extra={"token_id": token_id},
+                )
+
+    await asyncio.gather(*(revoke_token(token_id) for token_id in token_ids))
 
 
 async def main() -> int:
@@ -85,6 +88,9 @@ async def main() -> int:
     try:
         await lifecycle.startup()
         while not SHUTDOWN_EVENT.is_set():
+            # Pick up tokens created by processes still on the legacy
+            # token layout, e.g. during a rolling deploy
+            await osuToken.migrate_legacy_tokens()
             await _timeout_inactive_users()
             try:
                 await asyncio.wait_for(
@@ -103,8 +109,5 @@ if __name__ == "__main__":
     logging_config.configure_logging()
     exception_handling.hook_exception_handlers()
     atexit.register(exception_handling.unhook_exception_handlers)
-    try:
-        exit_code = asyncio.run(main())
-    except KeyboardInterrupt:
-        exit_code = 0
+    exit_code = runtime.run(main)
     exit(exit_code)
@@ -13,6 +13,7 @@ sys.path.insert(1, os.path.join(sys.path[0], "../.."))
 
 import lifecycle
 from common import exception_handling
+from common import runtime
 from common.log import logger
 from common.log import logging_config
 from common.redis import pubSub
@@ -94,8 +95,5 @@ if __name__ == "__main__":
     logging_config.configure_logging()
     exception_handling.hook_exception_handlers()
     atexit.register(exception_handling.unhook_exception_handlers)
-    try:
-        exit_code = asyncio.run(main())
-    except KeyboardInterrupt:
-        exit_code = 0
+    exit_code = runtime.run(main)
     exit(exit_code)
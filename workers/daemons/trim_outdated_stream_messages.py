@@ -7,22 +7,21 @@ import logging
 import os
 import signal
 import sys
-import time
 from types import FrameType
 
 sys.path.insert(1, os.path.join(sys.path[0], "../.."))
 
 import lifecycle
 from common import exception_handling
+from common import runtime
 from common.log import logger
 from common.log import logging_config
 from objects import stream_messages
-from objects import streamList
 
-# TODO: this work should be done JIT when a player sends a message
-# and the cronjob/daemon strategy here should be completely removed
+# Streams are trimmed as they're written to, and expire once idle.
+# This only catches up streams which were last written to before that.
 
-FIVE_MINUTES = 5 * 60
+RECONCILE_INTERVAL = 10 * 60  # seconds
 
 SHUTDOWN_EVENT: asyncio.Event | None = None
 
@@ -36,34 +35,34 @@ def handle_shutdown_event(signum: int, frame: FrameType | None) -> None:
 signal.signal(signal.SIGTERM, handle_shutdown_event)
 
 
+async def _reconcile_idle_streams() -> None:
+    async for stream_key in stream_messages.iter_stream_keys():
+        trimmed_messages = await stream_messages.expire_idle_stream(stream_key)
+        if trimmed_messages:
+            logger.info(
+                "Trimmed outdated stream messages",
+                extra={
+                    "stream_key": stream_key,
+                    "trimmed_messages": trimmed_messages,
+                },
+            )
+
+
 async def main() -> int:
     global SHUTDOWN_EVENT
     SHUTDOWN_EVENT = asyncio.Event()
-    logger.info("Starting outdated stream message trim loop")
+    logger.info("Starting idle stream reconciliation loop")
     try:
         await lifecycle.startup()
         while not SHUTDOWN_EVENT.is_set():
-            for stream_name in await streamList.getStreams():
-                try:
-                    five_minutes_ago = time.time() - FIVE_MINUTES
-                    trimmed_messages = await stream_messages.trim_stream_messages(
-                        stream_name,
-                        min_id=f"{int(five_minutes_ago * 1000)}-0",
-                    )
-                    if trimmed_messages:
-                        logger.info(
-                            "Trimmed outdated stream messages",
-                            extra={
-                                "stream_name": stream_name,
-                                "trimmed_messages": trimmed_messages,
-                            },
-                        )
-                    await asyncio.wait_for(
-                        SHUTDOWN_EVENT.wait(),
-                        timeout=0.25,
-                    )
-                except TimeoutError:
-                    pass
+            await _reconcile_idle_streams()
+            try:
+                await asyncio.wait_for(
+                    SHUTDOWN_EVENT.wait(),
+                    timeout=RECONCILE_INTERVAL,
+                )
+            except TimeoutError:
+                pass
     finally:
         await lifecycle.shutdown()
 
@@ -74,8 +73,5 @@ if __name__ == "__main__":
     logging_config.configure_logging()
     exception_handling.hook_exception_handlers()
     atexit.register(exception_handling.unhook_exception_handlers)
-    try:
-        exit_code = asyncio.run(main())
-    except KeyboardInterrupt:
-        exit_code = 0
+    exit_code = runtime.run(main)
     exit(exit_code)